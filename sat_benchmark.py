@@ -0,0 +1,359 @@
+"""Benchmark de extremo a extremo contra el portal simulado: latencias por etapa (p50/p95/p99) y trabajos/min."""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Sequence, Tuple
+
+import sat_selenium_fiel
+import sat_telemetry
+from sat_browser import DRIVER_BACKENDS
+from sat_mock_portal import DOM_VARIANTS, MOCK_TAXPAYER, MockPortalConfig, MockSatPortal, parse_latency
+
+
+# =======================================================
+# 1. CONFIGURACIÓN
+# =======================================================
+
+ENGINES = ("selenium", "pool", "browserless")
+DEFAULT_CONCURRENCY = (1, 2, 4)
+DEFAULT_JOBS_PER_LEVEL = 8
+PERCENTILES = (50, 95, 99)
+TEST_KEY_PASS = "12345678a"
+# Número de serie con el formato del SAT (dígitos ASCII)
+TEST_SERIAL = "00001000000700000001"
+
+Runner = Callable[[str, str, str, Path], Path]
+
+
+class LevelResult(NamedTuple):
+    """Resultado de un nivel de concurrencia."""
+    engine: str
+    concurrency: int
+    jobs: int
+    failures: int
+    wall_seconds: float
+    end_to_end: Dict[str, float]
+    stages: Dict[str, Dict[str, float]]
+    # Spans del cliente (sat_telemetry) por etapa: duración y bytes de página
+    client_stages: Dict[str, Dict[str, float]] = {}
+    lean: bool = False
+    # Bytes de recursos estáticos servidos por el portal por trabajo
+    asset_bytes_per_job: float = 0.0
+    # Backend del navegador (motores selenium/pool) y comandos enviados al navegador por trabajo
+    backend: str = "selenium"
+    round_trips_per_job: float = 0.0
+
+    @property
+    def jobs_per_minute(self) -> float:
+        ok = self.jobs - self.failures
+        return ok * 60 / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+
+# =======================================================
+# 2. ESTADÍSTICAS
+# =======================================================
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Percentil con interpolación lineal."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+def summarize(values: Sequence[float]) -> Dict[str, float]:
+    summary = {f"p{p}": percentile(values, p) for p in PERCENTILES}
+    summary["mean"] = sum(values) / len(values) if values else 0.0
+    summary["n"] = len(values)
+    return summary
+
+def summarize_client_spans(path: Path) -> Dict[str, Dict[str, float]]:
+    """Duración (p50/p95/p99) y bytes medios de página por etapa a partir del JSON lines de spans."""
+    durations: Dict[str, List[float]] = {}
+    page_bytes: Dict[str, List[float]] = {}
+    if not path.exists():
+        return {}
+    for line in path.read_text(encoding="utf-8").splitlines():
+        record = json.loads(line)
+        if record.get("stage") == "job":
+            continue
+        durations.setdefault(record["name"], []).append(record["duration_seconds"])
+        if "page_bytes" in record:
+            page_bytes.setdefault(record["name"], []).append(record["page_bytes"])
+    stages = {}
+    for name, values in durations.items():
+        stages[name] = summarize(values)
+        if name in page_bytes:
+            stages[name]["page_bytes"] = sum(page_bytes[name]) / len(page_bytes[name])
+    return stages
+
+def mean_round_trips(path: Path) -> float:
+    """Comandos promedio enviados al navegador (HTTP a chromedriver o mensajes CDP) por trabajo."""
+    if not path.exists():
+        return 0.0
+    counts = [record.get("round_trips", 0) for record in map(json.loads, path.read_text(encoding="utf-8").splitlines())
+              if record.get("stage") == "job"]
+    return sum(counts) / len(counts) if counts else 0.0
+
+
+# =======================================================
+# 3. CREDENCIALES DE PRUEBA
+# =======================================================
+
+def create_test_efirma(directory: Path, rfc: str = MOCK_TAXPAYER["rfc"],
+                       password: str = TEST_KEY_PASS) -> Tuple[Path, Path]:
+    """Crea un .cer/.key autofirmados con el formato del SAT (RFC en x500UniqueIdentifier).
+
+    Sin ``cryptography`` se crean archivos vacíos: bastan para el motor con navegador
+    (el portal simulado solo valida la firma si recibe el certificado), pero no para el motor sin navegador.
+    """
+    cer_path, key_path = directory / f"{rfc}.cer", directory / f"{rfc}.key"
+    try:
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from cryptography.x509.oid import NameOID, ObjectIdentifier
+    except ImportError:
+        cer_path.write_bytes(b"")
+        key_path.write_bytes(b"")
+        return cer_path, key_path
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    subject = x509.Name([
+        x509.NameAttribute(NameOID.COMMON_NAME, MOCK_TAXPAYER["nombre"]),
+        x509.NameAttribute(ObjectIdentifier("2.5.4.45"), f"{rfc} / {MOCK_TAXPAYER['curp']}"),
+    ])
+    now = datetime.now(timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(subject)
+        .public_key(key.public_key())
+        .serial_number(int.from_bytes(TEST_SERIAL.encode("ascii"), "big"))
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=365))
+        .sign(key, hashes.SHA256())
+    )
+    cer_path.write_bytes(cert.public_bytes(serialization.Encoding.DER))
+    key_path.write_bytes(key.private_bytes(
+        serialization.Encoding.DER,
+        serialization.PrivateFormat.PKCS8,
+        serialization.BestAvailableEncryption(password.encode("utf-8")),
+    ))
+    return cer_path, key_path
+
+
+# =======================================================
+# 4. MOTORES
+# =======================================================
+
+def make_runner(engine: str, portal: MockSatPortal, concurrency: int, output_dir: Path) -> Tuple[Runner, Callable[[], None]]:
+    """Devuelve (runner, cierre) para el motor indicado, apuntado al portal simulado."""
+    if engine == "selenium":
+        def run(cer_path, key_path, key_pass, download_dir):
+            driver = sat_selenium_fiel.create_chrome_driver(download_dir)
+            try:
+                return sat_selenium_fiel.run_sat_flow(driver, cer_path, key_path, key_pass, download_dir)
+            finally:
+                driver.quit()
+        return run, lambda: None
+
+    if engine == "pool":
+        from sat_driver_pool import DriverPool
+        from sat_orchestrator import pooled_runner
+        pool = DriverPool(size=concurrency, base_download_dir=output_dir)
+        pool.start()
+        return pooled_runner(pool), pool.close
+
+    if engine == "browserless":
+        from sat_browserless import SatBrowserlessClient, run_sat_browserless
+        from sat_http import ConnectionPool
+        http_pool = ConnectionPool()
+
+        def run(cer_path, key_path, key_pass, download_dir):
+            client = SatBrowserlessClient(pool=http_pool)
+            return run_sat_browserless(cer_path, key_path, key_pass, download_dir, client=client)
+        return run, http_pool.close
+
+    raise ValueError(f"Motor desconocido: {engine} (use uno de {ENGINES})")
+
+
+# =======================================================
+# 5. EJECUCIÓN
+# =======================================================
+
+def run_level(engine: str, config: MockPortalConfig, concurrency: int, jobs: int,
+              credentials: Tuple[Path, Path], output_dir: Path, lean: bool = False,
+              backend: str = "selenium") -> LevelResult:
+    """Ejecuta ``jobs`` trabajos con ``concurrency`` en paralelo contra un portal simulado nuevo."""
+    cer_path, key_path = credentials
+    spans_path = output_dir / f"spans_{engine}_{backend}_{concurrency}_{'ligero' if lean else 'normal'}.jsonl"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    sat_telemetry.SPANS_JSONL_PATH = str(spans_path)
+    sat_selenium_fiel.LEAN_BROWSER = lean
+    sat_selenium_fiel.DRIVER_BACKEND = backend
+    with MockSatPortal(config) as portal:
+        sat_selenium_fiel.set_portal_base_url(portal.base_url)
+        runner, close = make_runner(engine, portal, concurrency, output_dir)
+
+        def timed_job(index: int) -> Tuple[float, bool]:
+            start = time.monotonic()
+            try:
+                runner(str(cer_path), str(key_path), TEST_KEY_PASS, output_dir / f"job_{index}")
+                return time.monotonic() - start, True
+            except Exception as e:
+                print(f"[BENCH] Trabajo {index} falló: {type(e).__name__}: {e}")
+                return time.monotonic() - start, False
+
+        try:
+            start = time.monotonic()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                outcomes = list(executor.map(timed_job, range(jobs)))
+            wall = time.monotonic() - start
+        finally:
+            close()
+        stage_samples = portal.stage_durations()
+
+    stages: Dict[str, List[float]] = {}
+    for sample in stage_samples:
+        for name, seconds in sample.items():
+            stages.setdefault(name, []).append(seconds)
+    return LevelResult(
+        engine=engine,
+        concurrency=concurrency,
+        jobs=jobs,
+        failures=sum(1 for _, ok in outcomes if not ok),
+        wall_seconds=wall,
+        end_to_end=summarize([seconds for seconds, ok in outcomes if ok]),
+        stages={name: summarize(values) for name, values in stages.items()},
+        client_stages=summarize_client_spans(spans_path),
+        lean=lean,
+        asset_bytes_per_job=portal.asset_bytes / jobs if jobs else 0.0,
+        backend=backend,
+        round_trips_per_job=mean_round_trips(spans_path),
+    )
+
+def result_label(r: LevelResult) -> str:
+    label = r.engine
+    if r.engine != "browserless" and r.backend != "selenium":
+        label += f"/{r.backend}"
+    return label + ("+ligero" if r.lean else "")
+
+def format_report(results: List[LevelResult]) -> str:
+    lines = [f"{'motor':<16} {'conc':>4} {'ok/total':>9} {'trab/min':>9} {'p50':>8} {'p95':>8} {'p99':>8}"]
+    for r in results:
+        e = r.end_to_end
+        lines.append(f"{result_label(r):<16} {r.concurrency:>4} {r.jobs - r.failures:>4}/{r.jobs:<4} "
+                     f"{r.jobs_per_minute:>9.1f} {e['p50']:>7.2f}s {e['p95']:>7.2f}s {e['p99']:>7.2f}s")
+        for name, s in r.stages.items():
+            lines.append(f"{'':<16} {'':>4}   · {name:<22} {s['p50']:>7.2f}s {s['p95']:>7.2f}s {s['p99']:>7.2f}s")
+    return "\n".join(lines)
+
+def format_lean_comparison(normal: LevelResult, lean: LevelResult) -> str:
+    """Ahorro del modo ligero por etapa (tiempo p50 y bytes de página) en un nivel de concurrencia."""
+    lines = [f"Modo ligero vs normal (concurrencia {normal.concurrency}):",
+             f"   {'etapa':<22} {'p50 normal':>11} {'p50 ligero':>11} {'ahorro':>9} {'KiB ahorrados':>14}"]
+    for name, base in normal.client_stages.items():
+        other = lean.client_stages.get(name)
+        if other is None:
+            continue
+        saved_kib = (base.get("page_bytes", 0) - other.get("page_bytes", 0)) / 1024
+        lines.append(f"   {name:<22} {base['p50']:>10.2f}s {other['p50']:>10.2f}s "
+                     f"{base['p50'] - other['p50']:>8.2f}s {saved_kib:>14.1f}")
+    saved_assets = (normal.asset_bytes_per_job - lean.asset_bytes_per_job) / 1024
+    lines.append(f"   Recursos estáticos servidos por trabajo: {normal.asset_bytes_per_job / 1024:.1f} KiB -> "
+                 f"{lean.asset_bytes_per_job / 1024:.1f} KiB ({saved_assets:.1f} KiB menos)")
+    return "\n".join(lines)
+
+def format_backend_comparison(base: LevelResult, other: LevelResult) -> str:
+    """CDP directo vs chromedriver por etapa (p50 del cliente) y comandos enviados al navegador por trabajo."""
+    lines = [f"Backend {other.backend} vs {base.backend} ({result_label(base)}, concurrencia {base.concurrency}):",
+             f"   {'etapa':<22} {'p50 ' + base.backend:>13} {'p50 ' + other.backend:>13} {'ahorro':>9}"]
+    for name, stage in base.client_stages.items():
+        candidate = other.client_stages.get(name)
+        if candidate is None:
+            continue
+        lines.append(f"   {name:<22} {stage['p50']:>12.3f}s {candidate['p50']:>12.3f}s "
+                     f"{stage['p50'] - candidate['p50']:>8.3f}s")
+    lines.append(f"   {'extremo a extremo':<22} {base.end_to_end['p50']:>12.3f}s {other.end_to_end['p50']:>12.3f}s "
+                 f"{base.end_to_end['p50'] - other.end_to_end['p50']:>8.3f}s")
+    lines.append(f"   Comandos al navegador por trabajo: {base.round_trips_per_job:.0f} -> {other.round_trips_per_job:.0f}; "
+                 f"trabajos/min: {base.jobs_per_minute:.1f} -> {other.jobs_per_minute:.1f}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del flujo de la constancia contra el portal simulado.")
+    parser.add_argument("--engine", choices=ENGINES, default="selenium")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS_PER_LEVEL, help="Trabajos por nivel de concurrencia")
+    parser.add_argument("--concurrency", default=",".join(map(str, DEFAULT_CONCURRENCY)), help="e.g. '1,2,4'")
+    parser.add_argument("--variant", choices=DOM_VARIANTS, default="default")
+    parser.add_argument("--latency", default="", help="Latencias por etapa del portal, e.g. 'sign=0.5,pdf=1'")
+    parser.add_argument("--assets-kb", type=int, default=0, help="Tamaño de CSS/fuente/imagen/analítica por página")
+    parser.add_argument("--lean", action="store_true", help="Usa el perfil ligero de Chrome")
+    parser.add_argument("--compare-lean", action="store_true", help="Ejecuta cada nivel en modo normal y ligero")
+    parser.add_argument("--backend", choices=DRIVER_BACKENDS, default=sat_selenium_fiel.DRIVER_BACKEND,
+                        help="Backend del navegador para los motores selenium y pool")
+    parser.add_argument("--compare-backends", action="store_true",
+                        help="Ejecuta cada nivel con chromedriver y con CDP directo")
+    parser.add_argument("--click-download", action="store_true", help="Desactiva la descarga directa por HTTP")
+    parser.add_argument("--reuse-sessions", action="store_true", help="Permite reutilizar sesiones guardadas")
+    parser.add_argument("--use-store", action="store_true", help="Permite reutilizar constancias del almacén local")
+    parser.add_argument("--json", dest="json_path", help="Escribe los resultados en este archivo JSON")
+    args = parser.parse_args()
+
+    if args.click_download:
+        sat_selenium_fiel.DIRECT_PDF_DOWNLOAD = False
+    if not args.use_store:
+        # Cada trabajo debe descargar su constancia, aunque el RFC de prueba sea siempre el mismo
+        sat_selenium_fiel.USE_CONSTANCIA_STORE = False
+    if not args.reuse_sessions:
+        # Sin clave no hay almacén de sesiones: cada trabajo hace el login completo
+        os.environ.pop("SAT_SESSION_KEY", None)
+
+    config = MockPortalConfig(parse_latency(args.latency), args.variant, args.assets_kb)
+    modes = (False, True) if args.compare_lean else (args.lean,)
+    backends = DRIVER_BACKENDS if args.compare_backends and args.engine != "browserless" else (args.backend,)
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    workdir = Path(tempfile.mkdtemp(prefix="sat_bench_"))
+    try:
+        credentials = create_test_efirma(workdir)
+        # El portal simulado exige la firma del certificado de prueba (si se pudo generar)
+        config = config._replace(certificate=credentials[0].read_bytes())
+        results = []
+        for concurrency in levels:
+            for backend in backends:
+                for lean in modes:
+                    print(f"[BENCH] {args.engine} ({backend}{', ligero' if lean else ''}): "
+                          f"{args.jobs} trabajos con concurrencia {concurrency}...")
+                    results.append(run_level(args.engine, config, concurrency, args.jobs, credentials,
+                                             workdir / "salida", lean, backend))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(format_report(results))
+    by_variant = {(r.concurrency, r.backend, r.lean): r for r in results}
+    for concurrency in levels:
+        for backend in backends:
+            if args.compare_lean:
+                print(format_lean_comparison(by_variant[concurrency, backend, False], by_variant[concurrency, backend, True]))
+        if args.compare_backends and len(backends) > 1:
+            for lean in modes:
+                print(format_backend_comparison(by_variant[concurrency, backends[0], lean],
+                                                by_variant[concurrency, backends[1], lean]))
+    if args.json_path:
+        payload = [dict(r._asdict(), jobs_per_minute=r.jobs_per_minute) for r in results]
+        Path(args.json_path).write_text(json.dumps(payload, indent=2), encoding="utf-8")
+        print(f"Resultados en {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
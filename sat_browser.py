@@ -0,0 +1,88 @@
+"""Interfaz mínima de navegador que usan los helpers del flujo: la cumplen webdriver.Chrome y CdpDriver (sat_cdp_driver)."""
+from typing import Any, Dict, List, Optional, Protocol, Sequence, Union
+
+
+# =======================================================
+# 1. BACKENDS
+# =======================================================
+
+# "selenium": webdriver.Chrome vía chromedriver (HTTP); "cdp": Chrome directo por el websocket de DevTools
+DRIVER_BACKENDS = ("selenium", "cdp")
+
+
+# =======================================================
+# 2. INTERFAZ
+# =======================================================
+
+class BrowserElement(Protocol):
+    """Elemento del DOM devuelto por ``execute_script``/``find_element`` (o el runtime JS)."""
+
+    def click(self) -> None: ...
+
+    def send_keys(self, *value: str) -> None: ...
+
+    def is_displayed(self) -> bool: ...
+
+    def is_enabled(self) -> bool: ...
+
+    def get_attribute(self, name: str) -> Optional[str]: ...
+
+
+class FrameSwitcher(Protocol):
+    """``driver.switch_to``: contexto (frame) y pestaña donde se ejecutan los comandos."""
+
+    def default_content(self) -> None: ...
+
+    def frame(self, frame_reference: Union[int, str, BrowserElement]) -> None: ...
+
+    def window(self, window_name: str) -> None: ...
+
+
+class BrowserDriver(Protocol):
+    """Subconjunto de la API de webdriver.Chrome del que dependen los helpers del flujo.
+
+    Los errores se reportan con las excepciones de ``selenium.common.exceptions``
+    (NoSuchElementException, StaleElementReferenceException, NoSuchFrameException,
+    JavascriptException, TimeoutException, WebDriverException...) en ambos backends,
+    para que las reanudaciones y los reintentos no dependan del backend. ``execute``
+    es el único punto por el que sale cada comando (lo envuelve count_round_trips).
+    """
+
+    switch_to: FrameSwitcher
+
+    @property
+    def current_url(self) -> str: ...
+
+    @property
+    def window_handles(self) -> List[str]: ...
+
+    @property
+    def current_window_handle(self) -> str: ...
+
+    def get(self, url: str) -> None: ...
+
+    def execute(self, driver_command: str, params: Optional[Dict[str, Any]] = None) -> Any: ...
+
+    def execute_script(self, script: str, *args) -> Any: ...
+
+    def execute_async_script(self, script: str, *args) -> Any: ...
+
+    def execute_cdp_cmd(self, cmd: str, cmd_args: Dict[str, Any]) -> Dict[str, Any]: ...
+
+    def set_script_timeout(self, time_to_wait: float) -> None: ...
+
+    def implicitly_wait(self, time_to_wait: float) -> None: ...
+
+    def find_element(self, by: str, value: str) -> BrowserElement: ...
+
+    def find_elements(self, by: str, value: str) -> Sequence[BrowserElement]: ...
+
+    def get_log(self, log_type: str) -> List[Dict[str, Any]]: ...
+
+    def delete_all_cookies(self) -> None: ...
+
+    def get_screenshot_as_file(self, filename: str) -> bool: ...
+
+    def close(self) -> None: ...
+
+    def quit(self) -> None: ...
@@ -0,0 +1,319 @@
+"""Motor sin navegador: login con e.firma por HTTP y descarga de la constancia con sesiones keep-alive."""
+import base64
+import time
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlencode, urljoin
+
+from sat_download_watch import has_pdf_markers
+from sat_efirma import CertificateInfo, load_private_key, preflight_efirma, sign
+from sat_http import ConnectionPool, CookieJar, HttpResponse, StreamedFile, get_connection_pool, request, stream_response_to_file
+import sat_selenium_fiel
+from sat_selenium_fiel import build_final_pdf_name, fresh_constancia, store_constancia, submit_constancia_extraction
+
+
+# =======================================================
+# 1. CONFIGURACIÓN
+# =======================================================
+
+# Formulario de acceso con e.firma del servidor de identidad (NIDP) del SAT
+FIEL_LOGIN_PATH = "/nidp/app/login?id=SATx509Custom&sid=0&option=credential&sid=0"
+FIEL_LOGIN_URL = "https://loginda.siat.sat.gob.mx" + FIEL_LOGIN_PATH
+# Niveles de iframes que se recorren (como el navegador) para encontrar el formulario de e.firma
+MAX_FRAME_DEPTH = 2
+FIEL_FORM_ID = "certform"
+GENERAR_FORM_ID = "formReimpAcuse"
+GENERAR_BUTTON_NAME = "formReimpAcuse:j_idt50"
+GENERAR_BUTTON_TEXT = "generar constancia"
+# Formularios intermedios del SSO (SAML) que el navegador enviaría automáticamente
+AUTO_POST_FIELDS = ("SAMLResponse", "SAMLRequest", "RelayState", "wresult")
+MAX_AUTO_POSTS = 5
+
+
+class BrowserlessLoginError(RuntimeError):
+    """El portal no aceptó el login o no mostró el módulo de la constancia."""
+
+
+# =======================================================
+# 2. FORMULARIOS HTML
+# =======================================================
+
+class HtmlForm(NamedTuple):
+    """Formulario HTML con sus campos exitosos y botones de envío."""
+    form_id: str
+    action: str
+    method: str
+    fields: List[Tuple[str, str]]
+    buttons: List[Tuple[str, str, str]]  # (name, value, texto visible)
+
+    def field(self, name: str, default: str = "") -> str:
+        for key, value in self.fields:
+            if key == name:
+                return value
+        return default
+
+    def find_button(self, name: str = "", text: str = "") -> Optional[Tuple[str, str, str]]:
+        for button in self.buttons:
+            if name and button[0] == name:
+                return button
+            if text and text in button[2].lower():
+                return button
+        return None
+
+
+class _FormParser(HTMLParser):
+    def __init__(self, base_url: str):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.forms: List[HtmlForm] = []
+        self.frames: List[str] = []
+        self._form: Optional[Dict] = None
+        self._select: Optional[Dict] = None
+        self._textarea: Optional[Dict] = None
+        self._button: Optional[Dict] = None
+
+    def handle_starttag(self, tag, attrs):
+        a = {k: (v or "") for k, v in attrs}
+        if tag in ("iframe", "frame") and a.get("src"):
+            self.frames.append(urljoin(self.base_url, a["src"]))
+            return
+        if tag == "form":
+            self._form = {
+                "id": a.get("id") or a.get("name", ""),
+                "action": urljoin(self.base_url, a.get("action") or self.base_url),
+                "method": (a.get("method") or "GET").upper(),
+                "fields": [],
+                "buttons": [],
+            }
+            return
+        if self._form is None:
+            return
+
+        name = a.get("name", "")
+        if tag == "input":
+            kind = a.get("type", "text").lower()
+            if kind in ("submit", "button", "image"):
+                self._form["buttons"].append((name, a.get("value", ""), a.get("value", "")))
+            elif kind in ("checkbox", "radio"):
+                if "checked" in a and name:
+                    self._form["fields"].append((name, a.get("value", "on")))
+            elif kind != "file" and name and "disabled" not in a:
+                self._form["fields"].append((name, a.get("value", "")))
+        elif tag == "select" and name:
+            self._select = {"name": name, "value": None, "first": None}
+        elif tag == "option" and self._select is not None:
+            value = a.get("value", "")
+            if self._select["first"] is None:
+                self._select["first"] = value
+            if "selected" in a:
+                self._select["value"] = value
+        elif tag == "textarea" and name:
+            self._textarea = {"name": name, "text": ""}
+        elif tag == "button":
+            self._button = {"name": name, "value": a.get("value", ""), "text": ""}
+
+    def handle_data(self, data):
+        if self._textarea is not None:
+            self._textarea["text"] += data
+        if self._button is not None:
+            self._button["text"] += data
+
+    def handle_endtag(self, tag):
+        if self._form is None:
+            return
+        if tag == "select" and self._select is not None:
+            value = self._select["value"] if self._select["value"] is not None else self._select["first"]
+            self._form["fields"].append((self._select["name"], value or ""))
+            self._select = None
+        elif tag == "textarea" and self._textarea is not None:
+            self._form["fields"].append((self._textarea["name"], self._textarea["text"]))
+            self._textarea = None
+        elif tag == "button" and self._button is not None:
+            b = self._button
+            self._form["buttons"].append((b["name"], b["value"], " ".join(b["text"].split())))
+            self._button = None
+        elif tag == "form":
+            f = self._form
+            self.forms.append(HtmlForm(f["id"], f["action"], f["method"], f["fields"], f["buttons"]))
+            self._form = None
+
+
+def _parse(html: str, base_url: str) -> _FormParser:
+    parser = _FormParser(base_url)
+    parser.feed(html)
+    parser.close()
+    return parser
+
+def parse_forms(html: str, base_url: str) -> List[HtmlForm]:
+    """Extrae los formularios de una página HTML."""
+    return _parse(html, base_url).forms
+
+def parse_frames(html: str, base_url: str) -> List[str]:
+    """URLs absolutas de los iframes de una página HTML."""
+    return _parse(html, base_url).frames
+
+
+# =======================================================
+# 3. CLIENTE
+# =======================================================
+
+def build_fiel_login_fields(form: HtmlForm, cert: CertificateInfo, private_key) -> List[Tuple[str, str]]:
+    """Campos del formulario de e.firma firmados como lo hace el JavaScript del portal.
+
+    La cadena firmada es ``guid|RFC|serie`` (SHA-1, PKCS#1 v1.5) y el token es
+    ``base64(base64(cadena) + "#" + base64(firma))``.
+    """
+    guid = form.field("guid")
+    source = f"{guid}|{cert.rfc}|{cert.serial}"
+    signature = base64.b64encode(sign(private_key, source.encode("utf-8"), "sha1")).decode("ascii")
+    token = base64.b64encode(
+        (base64.b64encode(source.encode("utf-8")).decode("ascii") + "#" + signature).encode("ascii")
+    ).decode("ascii")
+
+    overrides = {
+        "token": token,
+        "credentialsRequired": "CERT",
+        "guid": guid,
+        "ks": "null",
+        "urlApplet": form.action,
+        "fert": cert.not_after.strftime("%y%m%d%H%M%SZ"),
+    }
+    fields = [(k, v) for k, v in form.fields if k not in overrides]
+    fields.extend(overrides.items())
+    return fields
+
+def default_fiel_login_url() -> str:
+    """Formulario de e.firma del portal configurado en el core: el NIDP del SAT o la misma ruta en el servidor local."""
+    if sat_selenium_fiel.is_sat_portal():
+        return FIEL_LOGIN_URL
+    return sat_selenium_fiel.SAT_PORTAL_BASE_URL + FIEL_LOGIN_PATH
+
+
+class SatBrowserlessClient:
+    """Sesión HTTP autenticada con e.firma contra el portal del SAT (o un servidor local equivalente)."""
+
+    def __init__(self, login_url: Optional[str] = None, fiel_login_url: Optional[str] = None,
+                 pool: Optional[ConnectionPool] = None):
+        # Sin URLs se usa el portal configurado en el core (ver set_portal_base_url)
+        self.login_url = login_url or sat_selenium_fiel.SAT_LOGIN_URL
+        self.fiel_login_url = fiel_login_url or default_fiel_login_url()
+        self.pool = pool or get_connection_pool()
+        self.jar = CookieJar()
+        self.requests = 0
+
+    def _request(self, method: str, url: str, fields: Optional[List[Tuple[str, str]]] = None,
+                 referer: Optional[str] = None, accept: str = "text/html,*/*") -> HttpResponse:
+        headers = {"Accept": accept}
+        if referer:
+            headers["Referer"] = referer
+        body = None
+        if fields is not None and method == "POST":
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+            body = urlencode(fields).encode("utf-8")
+        elif fields:
+            url = f"{url}{'&' if '?' in url else '?'}{urlencode(fields)}"
+        self.requests += 1
+        return request(method, url, headers=headers, body=body, pool=self.pool, cookie_jar=self.jar)
+
+    def _page(self, method: str, url: str, fields=None, referer=None) -> Tuple[str, str]:
+        """Petición que devuelve (url final, html), enviando los formularios SAML automáticos."""
+        response = self._request(method, url, fields, referer)
+        html = response.read().decode("utf-8", errors="replace")
+        url = response.url
+        for _ in range(MAX_AUTO_POSTS):
+            auto = next((f for f in parse_forms(html, url)
+                         if any(name in AUTO_POST_FIELDS for name, _ in f.fields)), None)
+            if auto is None:
+                break
+            response = self._request(auto.method, auto.action, auto.fields, referer=url)
+            html = response.read().decode("utf-8", errors="replace")
+            url = response.url
+        return url, html
+
+    def _find_form(self, url: str, html: str, form_id: str, depth: int = MAX_FRAME_DEPTH) -> Tuple[str, Optional[HtmlForm]]:
+        """Busca el formulario en la página y, si no está, en sus iframes; devuelve (url de la página, formulario)."""
+        form = next((f for f in parse_forms(html, url) if f.form_id == form_id), None)
+        if form is not None or depth == 0:
+            return url, form
+        for src in parse_frames(html, url):
+            frame_url, frame_html = self._page("GET", src, referer=url)
+            found_url, form = self._find_form(frame_url, frame_html, form_id, depth - 1)
+            if form is not None:
+                return found_url, form
+        return url, None
+
+    def login(self, cert: CertificateInfo, private_key):
+        """Login con e.firma: obtiene el reto (guid), lo firma localmente y envía el formulario."""
+        self._page("GET", self.login_url)
+        url, html = self._page("GET", self.fiel_login_url)
+        url, form = self._find_form(url, html, FIEL_FORM_ID)
+        if form is None:
+            raise BrowserlessLoginError(f"No se encontró el formulario '{FIEL_FORM_ID}' de e.firma en {url}.")
+
+        fields = build_fiel_login_fields(form, cert, private_key)
+        url, html = self._page(form.method, form.action, fields, referer=url)
+        if any(f.form_id == FIEL_FORM_ID for f in parse_forms(html, url)):
+            raise BrowserlessLoginError("El portal rechazó el login con e.firma (se volvió a mostrar el formulario).")
+
+    def _generar_form(self) -> Tuple[str, HtmlForm, Tuple[str, str, str]]:
+        url, html = self._page("GET", self.login_url)
+        for form in parse_forms(html, url):
+            button = form.find_button(name=GENERAR_BUTTON_NAME, text=GENERAR_BUTTON_TEXT)
+            if form.form_id == GENERAR_FORM_ID or button:
+                if button is None:
+                    button = (GENERAR_BUTTON_NAME, GENERAR_BUTTON_NAME, "")
+                return url, form, button
+        raise BrowserlessLoginError(f"No se encontró el formulario de 'Generar Constancia' en {url}.")
+
+    def download_constancia(self, destination: Path, keep_content: bool = False) -> StreamedFile:
+        """Envía 'Generar Constancia' y escribe el PDF en ``destination`` de forma atómica.
+
+        Con ``keep_content`` el PDF también queda en memoria (``StreamedFile.content``).
+        """
+        url, form, button = self._generar_form()
+        fields = list(form.fields)
+        if button[0]:
+            fields.append((button[0], button[1] or button[0]))
+
+        response = self._request(form.method, form.action, fields, referer=url, accept="application/pdf,*/*")
+        content_type = response.header("Content-Type").lower()
+        if response.status != 200 or "pdf" not in content_type:
+            response.finish()
+            raise BrowserlessLoginError(f"La respuesta de 'Generar Constancia' no es un PDF (HTTP {response.status}, {content_type}).")
+        streamed = stream_response_to_file(response, destination, keep_content=keep_content)
+        if not has_pdf_markers(streamed.path):
+            streamed.path.unlink()
+            raise BrowserlessLoginError("El PDF recibido está incompleto (sin %PDF/%%EOF).")
+        return streamed
+
+
+def run_sat_browserless(cer_path: str, key_path: str, key_pass: str, download_dir: Path,
+                        client: Optional[SatBrowserlessClient] = None) -> Path:
+    """Equivalente a ``run_sat_automation_core`` sin navegador."""
+    start = time.monotonic()
+    cer, key = Path(cer_path), Path(key_path)
+    if not cer.exists() or not key.exists():
+        raise FileNotFoundError(f"Rutas de e.firma inválidas o inaccesibles: {cer_path} / {key_path}")
+    # La e.firma se valida antes de consultar el almacén: el .cer solo no da acceso a la constancia
+    cert = preflight_efirma(str(cer), str(key), key_pass)
+    cached = fresh_constancia(cert, download_dir)
+    if cached:
+        return cached
+
+    private_key = load_private_key(str(key), key_pass)
+    client = client or SatBrowserlessClient()
+
+    print(f"Iniciando sesión sin navegador para {cert.rfc} (serie {cert.serial})...")
+    client.login(cert, private_key)
+    print("¡Inicio de sesión con e.firma exitoso!")
+
+    final_pdf_path = download_dir / build_final_pdf_name(cert.rfc)
+    # Como en la descarga directa de Selenium: el almacén y la extracción usan los bytes ya recibidos
+    keep_content = sat_selenium_fiel.EXTRACT_CONSTANCIA_FIELDS or sat_selenium_fiel.USE_CONSTANCIA_STORE
+    streamed = client.download_constancia(final_pdf_path, keep_content=keep_content)
+    print(f" -> PDF descargado: {streamed.size_bytes} bytes, {client.requests} peticiones HTTP, "
+          f"{time.monotonic() - start:.2f} s en total.")
+    store_constancia(final_pdf_path, cert.rfc, streamed.content)
+    submit_constancia_extraction(final_pdf_path, cert.rfc, streamed.content)
+    return final_pdf_path
@@ -0,0 +1,808 @@
+"""Backend CDP: controla Chrome por el websocket de DevTools, sin proceso de chromedriver ni su capa HTTP."""
+import base64
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+from selenium.common.exceptions import (
+    JavascriptException,
+    NoSuchElementException,
+    NoSuchFrameException,
+    NoSuchWindowException,
+    StaleElementReferenceException,
+    TimeoutException,
+    WebDriverException,
+)
+from selenium.webdriver.chrome.options import Options
+
+
+# =======================================================
+# 1. CONFIGURACIÓN
+# =======================================================
+
+# Ejecutable de Chrome: options.binary_location, $CHROME_BINARY o el primero de estos en el PATH
+CHROME_BINARY_NAMES = ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser", "chrome", "headless_shell")
+STARTUP_TIMEOUT_SECONDS = 20
+CDP_COMMAND_TIMEOUT_SECONDS = 30
+PAGE_LOAD_TIMEOUT_SECONDS = 60
+DEFAULT_SCRIPT_TIMEOUT_SECONDS = 30
+# Espera a que exista el contexto JS de un frame recién navegado
+FRAME_CONTEXT_WAIT_SECONDS = 2.0
+# Dominios CDP que van a la sesión del navegador y no a la de la pestaña
+BROWSER_DOMAINS = ("Browser.", "Target.", "SystemInfo.")
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+_STALE = "__sat_stale__"
+_SCRIPT_TIMEOUT = "__sat_timeout__"
+
+
+# =======================================================
+# 2. WEBSOCKET (RFC 6455, solo lo que usa DevTools)
+# =======================================================
+
+class CdpWebSocket:
+    """Cliente websocket mínimo: mensajes de texto enmascarados, fragmentación, ping/pong y cierre."""
+
+    def __init__(self, url: str, timeout: float = STARTUP_TIMEOUT_SECONDS):
+        parts = urlsplit(url)
+        host, port = parts.hostname or "127.0.0.1", parts.port or 80
+        self._sock = socket.create_connection((host, port), timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._send_lock = threading.Lock()
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        self._sock.sendall((
+            f"GET {parts.path or '/'} HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\n"
+            f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n"
+        ).encode("ascii"))
+        self._buffer = b""
+        while b"\r\n\r\n" not in self._buffer:
+            chunk = self._sock.recv(4096)
+            if not chunk:
+                raise ConnectionError("DevTools cerró la conexión durante el handshake.")
+            self._buffer += chunk
+        head, self._buffer = self._buffer.split(b"\r\n\r\n", 1)
+        lines = head.decode("latin-1").split("\r\n")
+        headers = {k.strip().lower(): v.strip() for k, _, v in (line.partition(":") for line in lines[1:])}
+        expected = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode("ascii")).digest()).decode("ascii")
+        if " 101 " not in lines[0] + " " or headers.get("sec-websocket-accept") != expected:
+            raise ConnectionError(f"Handshake de websocket rechazado: {lines[0]}")
+        self._sock.settimeout(None)
+
+    def _read_exact(self, size: int) -> bytes:
+        while len(self._buffer) < size:
+            chunk = self._sock.recv(max(65536, size - len(self._buffer)))
+            if not chunk:
+                raise ConnectionError("DevTools cerró la conexión.")
+            self._buffer += chunk
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def _send_frame(self, opcode: int, payload: bytes):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, 0x80 | length)
+        elif length < 1 << 16:
+            header = struct.pack("!BBH", 0x80 | opcode, 0x80 | 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 0x80 | 127, length)
+        mask = os.urandom(4)
+        repeated = (mask * (length // 4 + 1))[:length]
+        masked = (int.from_bytes(payload, "little") ^ int.from_bytes(repeated, "little")).to_bytes(length, "little")
+        with self._send_lock:
+            self._sock.sendall(header + mask + masked)
+
+    def send_text(self, text: str):
+        self._send_frame(0x1, text.encode("utf-8"))
+
+    def recv_text(self) -> Optional[str]:
+        """Siguiente mensaje de texto completo; None si el otro extremo cerró."""
+        fragments: List[bytes] = []
+        while True:
+            first, second = self._read_exact(2)
+            opcode, length = first & 0x0F, second & 0x7F
+            if length == 126:
+                length = struct.unpack("!H", self._read_exact(2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", self._read_exact(8))[0]
+            mask = self._read_exact(4) if second & 0x80 else None
+            payload = self._read_exact(length)
+            if mask:
+                repeated = (mask * (length // 4 + 1))[:length]
+                payload = (int.from_bytes(payload, "little") ^ int.from_bytes(repeated, "little")).to_bytes(length, "little")
+            if opcode == 0x8:
+                return None
+            if opcode == 0x9:
+                self._send_frame(0xA, payload)
+                continue
+            if opcode in (0x0, 0x1, 0x2):
+                fragments.append(payload)
+                if first & 0x80:
+                    return b"".join(fragments).decode("utf-8")
+
+    def close(self):
+        try:
+            self._send_frame(0x8, b"")
+        except OSError:
+            pass
+        try:
+            self._sock.close()
+        except OSError:
+            pass
+
+
+# =======================================================
+# 3. CONEXIÓN CDP
+# =======================================================
+
+def _cdp_error(method: str, error: Dict[str, Any]) -> WebDriverException:
+    message = error.get("message", "")
+    lowered = message.lower()
+    if ("context" in lowered and "not" in lowered) or "no node" in lowered or "could not find node" in lowered:
+        return StaleElementReferenceException(f"{method}: {message}")
+    if "no target" in lowered or "no session" in lowered or "session with given id not found" in lowered:
+        return NoSuchWindowException(f"{method}: {message}")
+    return WebDriverException(f"{method}: {message} ({error.get('code')})")
+
+
+class CdpConnection:
+    """Comandos CDP con respuesta (por id) y despacho de eventos en un hilo lector."""
+
+    def __init__(self, ws_url: str):
+        self._ws = CdpWebSocket(ws_url)
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, list] = {}  # id -> [Event, respuesta]
+        self._lock = threading.Lock()
+        self.listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self.closed = False
+        self._reader = threading.Thread(target=self._read_loop, name="sat-cdp", daemon=True)
+        self._reader.start()
+
+    def _message(self, method: str, params: Optional[Dict[str, Any]], session_id: Optional[str]) -> Tuple[int, str]:
+        message_id = next(self._ids)
+        message: Dict[str, Any] = {"id": message_id, "method": method, "params": params or {}}
+        if session_id:
+            message["sessionId"] = session_id
+        return message_id, json.dumps(message)
+
+    def send(self, method: str, params: Optional[Dict[str, Any]] = None, session_id: Optional[str] = None,
+             timeout: float = CDP_COMMAND_TIMEOUT_SECONDS) -> Dict[str, Any]:
+        """Envía un comando y espera su respuesta."""
+        message_id, payload = self._message(method, params, session_id)
+        waiter = [threading.Event(), None]
+        with self._lock:
+            if self.closed:
+                raise WebDriverException("La conexión con Chrome (DevTools) está cerrada.")
+            self._pending[message_id] = waiter
+        try:
+            self._ws.send_text(payload)
+        except OSError as e:
+            with self._lock:
+                self._pending.pop(message_id, None)
+            raise WebDriverException(f"No se pudo enviar {method} a Chrome: {e}")
+        if not waiter[0].wait(timeout):
+            with self._lock:
+                self._pending.pop(message_id, None)
+            raise TimeoutException(f"Chrome no respondió {method} en {timeout:.0f} s.")
+        response = waiter[1]
+        if response is None:
+            raise WebDriverException("Se perdió la conexión con Chrome (DevTools).")
+        if "error" in response:
+            raise _cdp_error(method, response["error"])
+        return response.get("result", {})
+
+    def post(self, method: str, params: Optional[Dict[str, Any]] = None, session_id: Optional[str] = None):
+        """Envía un comando sin esperar la respuesta (se puede usar desde los listeners)."""
+        _, payload = self._message(method, params, session_id)
+        try:
+            self._ws.send_text(payload)
+        except OSError:
+            pass
+
+    def _read_loop(self):
+        try:
+            while True:
+                text = self._ws.recv_text()
+                if text is None:
+                    break
+                message = json.loads(text)
+                if "id" in message:
+                    with self._lock:
+                        waiter = self._pending.pop(message["id"], None)
+                    if waiter:
+                        waiter[1] = message
+                        waiter[0].set()
+                    continue
+                for listener in list(self.listeners):
+                    try:
+                        listener(message)
+                    except Exception as e:
+                        print(f"[CDP] Falló el manejo de {message.get('method')}: {type(e).__name__}: {e}")
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self._lock:
+                self.closed = True
+                pending, self._pending = self._pending, {}
+            for waiter in pending.values():
+                waiter[0].set()
+
+    def close(self):
+        self._ws.close()
+        self._reader.join(timeout=2)
+
+
+# =======================================================
+# 4. SCRIPTS DE PÁGINA
+# =======================================================
+
+# Envoltura de cada execute_script: decodifica argumentos (elementos por referencia), ejecuta el
+# script del usuario y serializa el resultado. Los elementos se guardan en un registro por documento
+# y viajan como {"__satEl": id}; el id lleva un prefijo aleatorio por documento (otro frame o una
+# navegación lo invalidan, como un WebElement obsoleto).
+_WRAPPER_HEAD = r"""function (args, isAsync, timeoutMs) {
+    const reg = window.__satCdp || (window.__satCdp = {
+        prefix: Math.random().toString(36).slice(2), next: 1, refs: new Map(), ids: new WeakMap()});
+    function decode(v) {
+        if (Array.isArray(v)) return v.map(decode);
+        if (v && typeof v === 'object') {
+            if ('__satEl' in v) {
+                const el = reg.refs.get(v.__satEl);
+                if (!el || !el.isConnected) throw new Error('__sat_stale__');
+                return el;
+            }
+            const out = {};
+            for (const k of Object.keys(v)) out[k] = decode(v[k]);
+            return out;
+        }
+        return v;
+    }
+    function encode(v, depth) {
+        if (v === undefined || v === null || typeof v === 'function' || depth > 20) return null;
+        if (typeof v !== 'object') return v;
+        if (v.nodeType === 1) {
+            let id = reg.ids.get(v);
+            if (!id) { id = reg.prefix + ':' + (reg.next++); reg.ids.set(v, id); reg.refs.set(id, v); }
+            return {__satEl: id, file: v.tagName === 'INPUT' && (v.type || '').toLowerCase() === 'file'};
+        }
+        if (Array.isArray(v) || (typeof v.length === 'number' && typeof v.item === 'function'))
+            return Array.from(v, function (x) { return encode(x, depth + 1); });
+        if (v === window || v.nodeType) return null;
+        const out = {};
+        for (const k of Object.keys(v)) out[k] = encode(v[k], depth + 1);
+        return out;
+    }
+    const decoded = decode(args);
+    const fn = function () {
+"""
+_WRAPPER_TAIL = r"""
+    };
+    if (!isAsync) return encode(fn.apply(window, decoded), 0);
+    return new Promise(function (resolve, reject) {
+        const timer = setTimeout(function () { reject(new Error('__sat_timeout__')); }, timeoutMs);
+        decoded.push(function (r) { clearTimeout(timer); resolve(encode(r, 0)); });
+        try { fn.apply(window, decoded); } catch (e) { clearTimeout(timer); reject(e); }
+    });
+}"""
+
+_FIND_JS = r"""
+    const by = arguments[0], value = arguments[1], all = arguments[2];
+    let found = [];
+    if (by === 'xpath') {
+        const r = document.evaluate(value, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        for (let i = 0; i < r.snapshotLength; i++) found.push(r.snapshotItem(i));
+    } else if (by === 'link text' || by === 'partial link text') {
+        found = Array.from(document.querySelectorAll('a')).filter(function (a) {
+            const text = (a.innerText || a.textContent || '').trim();
+            return by === 'link text' ? text === value : text.indexOf(value) !== -1;
+        });
+    } else {
+        const css = {'id': '[id="' + CSS.escape(value) + '"]', 'name': '[name="' + CSS.escape(value) + '"]',
+                     'tag name': value, 'class name': '.' + CSS.escape(value), 'css selector': value}[by];
+        found = Array.from(document.querySelectorAll(css));
+    }
+    found = found.filter(function (n) { return n.nodeType === 1; });
+    return all ? found : (found[0] || null);
+"""
+
+_DISPLAYED_JS = r"""
+    const el = arguments[0];
+    if (el.type === 'hidden') return false;
+    const rect = el.getBoundingClientRect();
+    if (rect.width <= 0 || rect.height <= 0) return false;
+    const st = window.getComputedStyle(el);
+    return st.visibility !== 'hidden' && st.display !== 'none' && st.opacity !== '0';
+"""
+
+_ATTRIBUTE_JS = r"""
+    const el = arguments[0], name = arguments[1];
+    if (name in el && typeof el[name] !== 'function' && typeof el[name] !== 'object') {
+        const v = el[name];
+        return typeof v === 'boolean' ? (v ? 'true' : null) : String(v);
+    }
+    return el.getAttribute(name);
+"""
+
+
+# =======================================================
+# 5. ELEMENTOS Y CAMBIO DE CONTEXTO
+# =======================================================
+
+class CdpElement:
+    """Referencia a un elemento del DOM dentro de un contexto JS (documento de un frame)."""
+
+    def __init__(self, driver: "CdpDriver", session_id: str, context_id: int, ref: str, is_file: bool = False):
+        self._driver = driver
+        self._session_id = session_id
+        self._context_id = context_id
+        self._ref = ref
+        self._is_file = is_file
+        self._object_id: Optional[str] = None
+
+    def __repr__(self) -> str:
+        return f"<CdpElement {self._ref}>"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CdpElement) and (other._context_id, other._ref) == (self._context_id, self._ref)
+
+    def __hash__(self) -> int:
+        return hash((self._context_id, self._ref))
+
+    def _script(self, script: str, *args) -> Any:
+        return self._driver._run_script(script, (self,) + args, self._session_id, self._context_id)
+
+    def object_id(self) -> str:
+        """RemoteObjectId del elemento (para comandos del dominio DOM); se obtiene una vez."""
+        if self._object_id is None:
+            result = self._driver.execute("Runtime.callFunctionOn", {
+                "functionDeclaration": "function (id) { const el = window.__satCdp && window.__satCdp.refs.get(id);"
+                                       " if (!el || !el.isConnected) throw new Error('__sat_stale__'); return el; }",
+                "arguments": [{"value": self._ref}],
+                "executionContextId": self._context_id,
+            }, self._session_id)
+            if "exceptionDetails" in result or "objectId" not in result.get("result", {}):
+                raise StaleElementReferenceException(f"El elemento {self._ref} ya no está en el documento.")
+            self._object_id = result["result"]["objectId"]
+        return self._object_id
+
+    def click(self):
+        self._script("arguments[0].scrollIntoView({block: 'center', inline: 'center'}); arguments[0].click();")
+
+    def send_keys(self, *value: str):
+        """Archivos: DOM.setFileInputFiles (rutas separadas por saltos de línea); texto: Input.insertText."""
+        text = "".join(value)
+        if self._is_file:
+            self._driver.execute("DOM.setFileInputFiles", {"files": text.split("\n"), "objectId": self.object_id()},
+                                 self._session_id)
+            return
+        self._script("arguments[0].focus();")
+        self._driver.execute("Input.insertText", {"text": text}, self._driver._page_session)
+
+    def clear(self):
+        self._script("arguments[0].value = ''; arguments[0].dispatchEvent(new Event('input', {bubbles: true}));")
+
+    def is_displayed(self) -> bool:
+        return bool(self._script(_DISPLAYED_JS))
+
+    def is_enabled(self) -> bool:
+        return bool(self._script("return !arguments[0].disabled;"))
+
+    def get_attribute(self, name: str) -> Optional[str]:
+        return self._script(_ATTRIBUTE_JS, name)
+
+    @property
+    def text(self) -> str:
+        return self._script("return (arguments[0].innerText || '').trim();") or ""
+
+    @property
+    def tag_name(self) -> str:
+        return (self._script("return arguments[0].tagName;") or "").lower()
+
+
+class _SwitchTo:
+    def __init__(self, driver: "CdpDriver"):
+        self._driver = driver
+
+    def default_content(self):
+        self._driver._frame_id = self._driver._target_id
+
+    def frame(self, frame_reference: Union[int, str, CdpElement]):
+        self._driver._switch_to_frame(frame_reference)
+
+    def window(self, window_name: str):
+        self._driver._switch_to_window(window_name)
+
+
+class _ChromeService:
+    """Equivalente a ``webdriver.Chrome.service`` (el gobernador de recursos usa ``process.pid``)."""
+
+    def __init__(self, process: subprocess.Popen):
+        self.process = process
+
+
+# =======================================================
+# 6. DRIVER
+# =======================================================
+
+class CdpDriver:
+    """Chrome controlado por CDP con la misma interfaz que usa el flujo (ver sat_browser.BrowserDriver).
+
+    Cada ``execute_script`` es un solo ``Runtime.callFunctionOn`` en el contexto JS del
+    frame actual; subir un archivo es ``DOM.setFileInputFiles``; las descargas llegan
+    como eventos ``Browser.downloadProgress`` y se exponen con ``get_log('performance')``
+    igual que en chromedriver, así que sat_download_watch funciona sin cambios.
+    """
+
+    def __init__(self, connection: CdpConnection, process: Optional[subprocess.Popen] = None,
+                 profile_dir: Optional[str] = None, download_dir: Optional[str] = None):
+        self.connection = connection
+        self.service = _ChromeService(process) if process else None
+        self._profile_dir = profile_dir
+        self.switch_to = _SwitchTo(self)
+        self._cond = threading.Condition()
+        self._contexts: Dict[Tuple[str, str], int] = {}  # (sesión, frame) -> contexto JS por defecto
+        self._frame_sessions: Dict[str, str] = {}  # frame de otro proceso (OOPIF) -> su sesión
+        self._page_sessions: Dict[str, str] = {}  # pestaña -> sesión
+        self._loads: Dict[str, int] = {}  # sesión -> eventos load del frame principal
+        self._handle_order: Dict[str, int] = {}
+        self._download_events: List[Dict[str, Any]] = []
+        self._script_timeout = DEFAULT_SCRIPT_TIMEOUT_SECONDS
+        self._quit = False
+        connection.listeners.append(self._on_event)
+
+        targets = [t for t in self.execute("Target.getTargets")["targetInfos"] if t["type"] == "page"]
+        target_id = targets[0]["targetId"] if targets else self.execute("Target.createTarget", {"url": "about:blank"})["targetId"]
+        self._target_id = target_id
+        self._frame_id = target_id
+        self._page_session = self._attach(target_id)
+        if download_dir:
+            self.execute("Browser.setDownloadBehavior", {"behavior": "allow", "downloadPath": download_dir,
+                                                         "eventsEnabled": True})
+
+    # --- Comandos ---
+
+    def execute(self, driver_command: str, params: Optional[Dict[str, Any]] = None,
+                session_id: Optional[str] = None) -> Dict[str, Any]:
+        """Un mensaje CDP (el equivalente a un comando HTTP de chromedriver)."""
+        timeout = CDP_COMMAND_TIMEOUT_SECONDS
+        if params and params.get("awaitPromise"):
+            timeout = max(timeout, self._script_timeout + 5)
+        return self.connection.send(driver_command, params, session_id, timeout)
+
+    def execute_cdp_cmd(self, cmd: str, cmd_args: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        session = None if cmd.startswith(BROWSER_DOMAINS) else self._page_session
+        return self.execute(cmd, cmd_args or {}, session)
+
+    # --- Eventos ---
+
+    def _on_event(self, message: Dict[str, Any]):
+        method = message.get("method", "")
+        params = message.get("params", {})
+        session = message.get("sessionId")
+        if method.startswith("Browser.download"):
+            with self._cond:
+                self._download_events.append({"method": method, "params": params})
+            return
+        with self._cond:
+            if method == "Runtime.executionContextCreated":
+                context = params["context"]
+                aux = context.get("auxData", {})
+                if aux.get("isDefault") and aux.get("frameId"):
+                    self._contexts[(session, aux["frameId"])] = context["id"]
+            elif method == "Runtime.executionContextDestroyed":
+                gone = params.get("executionContextId")
+                for key in [k for k, v in self._contexts.items() if k[0] == session and v == gone]:
+                    del self._contexts[key]
+            elif method == "Runtime.executionContextsCleared":
+                for key in [k for k in self._contexts if k[0] == session]:
+                    del self._contexts[key]
+            elif method == "Page.loadEventFired":
+                self._loads[session] = self._loads.get(session, 0) + 1
+            elif method == "Target.attachedToTarget" and params["targetInfo"]["type"] == "iframe":
+                # Frame de otro origen en su propio proceso: se controla con su propia sesión
+                child = params["sessionId"]
+                self._frame_sessions[params["targetInfo"]["targetId"]] = child
+                for command, args in (("Runtime.enable", {}), ("Target.setAutoAttach", _AUTO_ATTACH),
+                                      ("Runtime.runIfWaitingForDebugger", {})):
+                    self.connection.post(command, args, child)
+            elif method == "Target.detachedFromTarget":
+                child = params.get("sessionId")
+                for target in [t for t, s in self._page_sessions.items() if s == child]:
+                    del self._page_sessions[target]
+                for frame in [f for f, s in self._frame_sessions.items() if s == child]:
+                    del self._frame_sessions[frame]
+                for key in [k for k in self._contexts if k[0] == child]:
+                    del self._contexts[key]
+            else:
+                return
+            self._cond.notify_all()
+
+    # --- Pestañas ---
+
+    def _attach(self, target_id: str) -> str:
+        session = self.execute("Target.attachToTarget", {"targetId": target_id, "flatten": True})["sessionId"]
+        self._page_sessions[target_id] = session
+        self.execute("Runtime.enable", {}, session)
+        self.execute("Page.enable", {}, session)
+        self.execute("Target.setAutoAttach", _AUTO_ATTACH, session)
+        return session
+
+    @property
+    def window_handles(self) -> List[str]:
+        pages = [t["targetId"] for t in self.execute("Target.getTargets")["targetInfos"] if t["type"] == "page"]
+        for handle in pages:
+            self._handle_order.setdefault(handle, len(self._handle_order))
+        return sorted(pages, key=self._handle_order.get)
+
+    @property
+    def current_window_handle(self) -> str:
+        return self._target_id
+
+    def _switch_to_window(self, handle: str):
+        session = self._page_sessions.get(handle)
+        if session is None:
+            try:
+                session = self._attach(handle)
+            except WebDriverException:
+                raise NoSuchWindowException(f"No existe la pestaña {handle}.")
+        self._target_id = self._frame_id = handle
+        self._page_session = session
+
+    def close(self):
+        """Cierra la pestaña actual (como en Selenium, hay que cambiar de pestaña después)."""
+        self.execute("Target.closeTarget", {"targetId": self._target_id})
+        self._page_sessions.pop(self._target_id, None)
+
+    @property
+    def current_url(self) -> str:
+        return self.execute("Target.getTargetInfo", {"targetId": self._target_id})["targetInfo"]["url"]
+
+    def get(self, url: str):
+        """Navega la pestaña actual y espera el evento load (como pageLoadStrategy 'normal')."""
+        session = self._page_session
+        self.switch_to.default_content()
+        with self._cond:
+            loads = self._loads.get(session, 0)
+        result = self.execute("Page.navigate", {"url": url}, session)
+        error = result.get("errorText")
+        if error == "net::ERR_ABORTED":
+            return  # La respuesta fue una descarga
+        if error:
+            raise WebDriverException(f"No se pudo cargar {url}: {error}")
+        if not result.get("loaderId"):
+            return  # Navegación dentro del mismo documento (#fragmento)
+        deadline = time.monotonic() + PAGE_LOAD_TIMEOUT_SECONDS
+        with self._cond:
+            while self._loads.get(session, 0) == loads:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutException(f"La página {url} no terminó de cargar en {PAGE_LOAD_TIMEOUT_SECONDS} s.")
+                self._cond.wait(remaining)
+
+    # --- Frames ---
+
+    def _context(self) -> Tuple[str, int]:
+        """Sesión y contexto JS del frame actual (espera a que el frame termine de crear su documento)."""
+        session = self._frame_sessions.get(self._frame_id, self._page_session)
+        deadline = time.monotonic() + FRAME_CONTEXT_WAIT_SECONDS
+        with self._cond:
+            while True:
+                session = self._frame_sessions.get(self._frame_id, session)
+                context = self._contexts.get((session, self._frame_id))
+                if context is not None:
+                    return session, context
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise NoSuchFrameException(f"El frame {self._frame_id} no tiene documento (¿se eliminó?).")
+                self._cond.wait(remaining)
+
+    def _switch_to_frame(self, frame_reference: Union[int, str, CdpElement]):
+        if isinstance(frame_reference, CdpElement):
+            element = frame_reference
+        elif isinstance(frame_reference, int):
+            element = self.execute_script(
+                "return document.querySelectorAll('iframe, frame')[arguments[0]] || null;", frame_reference)
+        else:
+            element = self.execute_script(
+                "return document.querySelector('iframe[id=\"' + CSS.escape(arguments[0]) + '\"], "
+                "iframe[name=\"' + CSS.escape(arguments[0]) + '\"], frame[name=\"' + CSS.escape(arguments[0]) + '\"]');",
+                frame_reference)
+        if element is None:
+            raise NoSuchFrameException(f"No existe el frame {frame_reference!r} en el contexto actual.")
+        node = self.execute("DOM.describeNode", {"objectId": element.object_id()}, element._session_id)["node"]
+        if not node.get("frameId"):
+            raise NoSuchFrameException(f"El elemento {frame_reference!r} no es un frame.")
+        self._frame_id = node["frameId"]
+
+    # --- Scripts ---
+
+    def _encode(self, value: Any) -> Any:
+        if isinstance(value, CdpElement):
+            return {"__satEl": value._ref}
+        if isinstance(value, (list, tuple)):
+            return [self._encode(v) for v in value]
+        if isinstance(value, dict):
+            return {k: self._encode(v) for k, v in value.items()}
+        if isinstance(value, Path):
+            return str(value)
+        return value
+
+    def _decode(self, value: Any, session_id: str, context_id: int) -> Any:
+        if isinstance(value, list):
+            return [self._decode(v, session_id, context_id) for v in value]
+        if isinstance(value, dict):
+            if "__satEl" in value:
+                return CdpElement(self, session_id, context_id, value["__satEl"], bool(value.get("file")))
+            return {k: self._decode(v, session_id, context_id) for k, v in value.items()}
+        return value
+
+    def _run_script(self, script: str, args: tuple, session_id: str, context_id: int, is_async: bool = False) -> Any:
+        """Ejecuta el cuerpo de función ``script`` con ``arguments`` en un contexto: un solo mensaje CDP."""
+        result = self.execute("Runtime.callFunctionOn", {
+            "functionDeclaration": _WRAPPER_HEAD + script + _WRAPPER_TAIL,
+            "arguments": [{"value": self._encode(list(args))}, {"value": is_async},
+                          {"value": int(self._script_timeout * 1000)}],
+            "executionContextId": context_id,
+            "returnByValue": True,
+            "awaitPromise": is_async,
+            "userGesture": True,
+        }, session_id)
+        details = result.get("exceptionDetails")
+        if details:
+            description = (details.get("exception") or {}).get("description") or details.get("text", "")
+            if _STALE in description:
+                raise StaleElementReferenceException("El elemento ya no está en el documento del frame actual.")
+            if _SCRIPT_TIMEOUT in description:
+                raise TimeoutException(f"El script asíncrono no terminó en {self._script_timeout} s.")
+            raise JavascriptException(description)
+        return self._decode(result.get("result", {}).get("value"), session_id, context_id)
+
+    def execute_script(self, script: str, *args) -> Any:
+        session, context = self._context()
+        try:
+            return self._run_script(script, args, session, context)
+        except StaleElementReferenceException:
+            if any(isinstance(a, CdpElement) for a in args):
+                raise
+            # El documento navegó entre la búsqueda del contexto y el envío: reintentar en el nuevo
+            with self._cond:
+                if self._contexts.get((session, self._frame_id)) == context:
+                    del self._contexts[(session, self._frame_id)]
+            session, context = self._context()
+            return self._run_script(script, args, session, context)
+
+    def execute_async_script(self, script: str, *args) -> Any:
+        session, context = self._context()
+        return self._run_script(script, args, session, context, is_async=True)
+
+    def set_script_timeout(self, time_to_wait: float):
+        self._script_timeout = time_to_wait
+
+    def implicitly_wait(self, time_to_wait: float):
+        """Sin esperas implícitas: el flujo usa esperas por condición (sat_waits)."""
+
+    def find_element(self, by: str, value: str) -> CdpElement:
+        element = self.execute_script(_FIND_JS, by, value, False)
+        if element is None:
+            raise NoSuchElementException(f"No se encontró el elemento {by}={value}.")
+        return element
+
+    def find_elements(self, by: str, value: str) -> List[CdpElement]:
+        return self.execute_script(_FIND_JS, by, value, True) or []
+
+    # --- Descargas, cookies, capturas ---
+
+    def get_log(self, log_type: str) -> List[Dict[str, Any]]:
+        """``performance``: eventos de descarga acumulados con el formato del log de chromedriver."""
+        if log_type != "performance":
+            return []
+        with self._cond:
+            events, self._download_events = self._download_events, []
+        now = int(time.time() * 1000)
+        return [{"level": "INFO", "timestamp": now, "message": json.dumps({"message": e})} for e in events]
+
+    def delete_all_cookies(self):
+        self.execute("Network.clearBrowserCookies", {}, self._page_session)
+
+    def get_screenshot_as_file(self, filename: str) -> bool:
+        data = self.execute("Page.captureScreenshot", {"format": "png"}, self._page_session)["data"]
+        Path(filename).write_bytes(base64.b64decode(data))
+        return True
+
+    def quit(self):
+        """Cierra Chrome, la conexión y el perfil temporal (idempotente)."""
+        if self._quit:
+            return
+        self._quit = True
+        try:
+            self.connection.send("Browser.close", timeout=5)
+        except WebDriverException:
+            pass
+        self.connection.close()
+        process = self.service.process if self.service else None
+        if process is not None:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait(timeout=5)
+        if self._profile_dir:
+            shutil.rmtree(self._profile_dir, ignore_errors=True)
+
+
+_AUTO_ATTACH = {"autoAttach": True, "waitForDebuggerOnStart": False, "flatten": True}
+
+
+# =======================================================
+# 7. ARRANQUE DE CHROME
+# =======================================================
+
+def find_chrome_binary(options: Optional[Options] = None) -> Optional[str]:
+    configured = getattr(options, "binary_location", "") or os.environ.get("CHROME_BINARY", "")
+    if configured:
+        return configured
+    for name in CHROME_BINARY_NAMES:
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+def _nested_prefs(prefs: Dict[str, Any]) -> Dict[str, Any]:
+    """{"download.default_directory": x} -> {"download": {"default_directory": x}} (formato de Preferences)."""
+    nested: Dict[str, Any] = {}
+    for dotted, value in prefs.items():
+        node = nested
+        *parents, leaf = dotted.split(".")
+        for part in parents:
+            node = node.setdefault(part, {})
+        node[leaf] = value
+    return nested
+
+def create_cdp_driver(options: Options) -> CdpDriver:
+    """Lanza Chrome con las opciones de build_chrome_options y se conecta a su websocket de DevTools.
+
+    Las preferencias (directorio de descarga, visor de PDF) se escriben en el perfil, como
+    hace chromedriver; las capacidades propias de chromedriver (loggingPrefs) no aplican.
+    """
+    binary = find_chrome_binary(options)
+    if not binary:
+        raise WebDriverException("No se encontró Chrome (use $CHROME_BINARY o options.binary_location).")
+    profile_dir = tempfile.mkdtemp(prefix="sat_cdp_")
+    prefs = options.experimental_options.get("prefs", {})
+    default_profile = Path(profile_dir) / "Default"
+    default_profile.mkdir(parents=True)
+    (default_profile / "Preferences").write_text(json.dumps(_nested_prefs(prefs)), encoding="utf-8")
+
+    args = [binary, *options.arguments, "--remote-debugging-port=0", f"--user-data-dir={profile_dir}",
+            "--enable-automation", "--no-first-run", "--no-default-browser-check", "about:blank"]
+    process = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    port_file = Path(profile_dir) / "DevToolsActivePort"
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    try:
+        while True:
+            if port_file.exists():
+                lines = port_file.read_text(encoding="utf-8").split()
+                if len(lines) >= 2:
+                    break
+            if process.poll() is not None:
+                raise WebDriverException(f"Chrome terminó al iniciar (código {process.returncode}).")
+            if time.monotonic() > deadline:
+                raise WebDriverException(f"Chrome no abrió DevTools en {STARTUP_TIMEOUT_SECONDS} s.")
+            time.sleep(0.05)
+        connection = CdpConnection(f"ws://127.0.0.1:{lines[0]}{lines[1]}")
+        return CdpDriver(connection, process, profile_dir, prefs.get("download.default_directory"))
+    except BaseException:
+        process.kill()
+        process.wait()
+        shutil.rmtree(profile_dir, ignore_errors=True)
+        raise
@@ -0,0 +1,441 @@
+"""Extracción de los datos de la Constancia de Situación Fiscal (PDF en memoria) a registros JSON lines."""
+import argparse
+import json
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+
+# =======================================================
+# 1. CONFIGURACIÓN
+# =======================================================
+
+# 0 = extraer en el propio proceso (un hilo de fondo); >0 = pool de procesos de ese tamaño (opcional)
+DEFAULT_EXTRACT_WORKERS = 0
+MESES = {
+    "ENERO": 1, "FEBRERO": 2, "MARZO": 3, "ABRIL": 4, "MAYO": 5, "JUNIO": 6, "JULIO": 7,
+    "AGOSTO": 8, "SEPTIEMBRE": 9, "OCTUBRE": 10, "NOVIEMBRE": 11, "DICIEMBRE": 12,
+}
+# Etiquetas del bloque "Datos del domicilio registrado" -> clave del registro
+DOMICILIO_LABELS = {
+    "Código Postal": "codigo_postal",
+    "Tipo de Vialidad": "tipo_vialidad",
+    "Nombre de Vialidad": "vialidad",
+    "Número Exterior": "numero_exterior",
+    "Número Interior": "numero_interior",
+    "Nombre de la Colonia": "colonia",
+    "Nombre de la Localidad": "localidad",
+    "Nombre del Municipio o Demarcación Territorial": "municipio",
+    "Nombre de la Entidad Federativa": "entidad_federativa",
+    "Entre Calle": "entre_calle",
+    "Y Calle": "y_calle",
+}
+IDENTIFICACION_LABELS = {
+    "RFC": "rfc",
+    "CURP": "curp",
+    "Nombre (s)": "nombre",
+    "Primer Apellido": "primer_apellido",
+    "Segundo Apellido": "segundo_apellido",
+    "Denominación/Razón Social": "razon_social",
+    "Régimen Capital": "regimen_capital",
+    "Fecha inicio de operaciones": "inicio_operaciones",
+    "Estatus en el padrón": "estatus",
+}
+# Otras etiquetas que cierran el valor de la etiqueta anterior
+STOP_LABELS = ("Fecha de último cambio de estado", "Nombre Comercial", "Datos del domicilio registrado",
+               "Actividades Económicas", "Regímenes", "Obligaciones", "Lugar y Fecha de Emisión",
+               "CONSTANCIA DE SITUACIÓN FISCAL", "Datos de Identificación del Contribuyente")
+
+
+class ConstanciaRecord(NamedTuple):
+    """Datos estructurados de una constancia."""
+    source: str
+    rfc: Optional[str]
+    curp: Optional[str]
+    nombre: Optional[str]
+    razon_social: Optional[str]
+    fecha_emision: Optional[str]  # ISO 8601 (AAAA-MM-DD)
+    estatus: Optional[str]
+    domicilio: Dict[str, str]
+    regimenes: List[Dict[str, Optional[str]]]
+    obligaciones: List[Dict[str, Optional[str]]]
+
+    def to_dict(self) -> Dict:
+        return self._asdict()
+
+
+# =======================================================
+# 2. TEXTO DEL PDF
+# =======================================================
+
+_STREAM_RE = re.compile(rb"<<((?:(?!>>\s*stream).)*?)>>\s*stream\r?\n(.*?)\r?\n?endstream", re.S)
+_TOKEN_RE = re.compile(rb"\((?:\\.|[^\\()]|\((?:\\.|[^\\()])*\))*\)|<[0-9A-Fa-f\s]*>|\[|\]|/[^\s/\[\]()<>]+|[-+]?\d*\.?\d+|[A-Za-z'\"*]+")
+_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f", b"(": b"(", b")": b")", b"\\": b"\\"}
+
+
+def _literal(token: bytes) -> bytes:
+    """Decodifica una cadena literal de PDF ``(...)`` con sus escapes."""
+    body, out, i = token[1:-1], bytearray(), 0
+    while i < len(body):
+        c = body[i:i + 1]
+        if c != b"\\":
+            out += c
+            i += 1
+            continue
+        nxt = body[i + 1:i + 2]
+        if nxt in _ESCAPES:
+            out += _ESCAPES[nxt]
+            i += 2
+        elif nxt.isdigit():
+            octal = re.match(rb"[0-7]{1,3}", body[i + 1:i + 4]).group()
+            out.append(int(octal, 8) & 0xFF)
+            i += 1 + len(octal)
+        else:
+            i += 2  # continuación de línea u otro escape sin efecto
+    return bytes(out)
+
+def _content_text(stream: bytes) -> List[str]:
+    """Texto de un content stream (operadores Tj, TJ, ', " con saltos en T*, Td, TD, Tm y ET)."""
+    lines: List[str] = []
+    current: List[str] = []
+    operands: List[bytes] = []
+    in_array: Optional[List[bytes]] = None
+
+    def show(strings: Sequence[bytes]):
+        for s in strings:
+            if s.startswith(b"("):
+                current.append(_literal(s).decode("cp1252", errors="replace"))
+            elif s.startswith(b"<"):
+                hexa = re.sub(rb"\s", b"", s[1:-1])
+                current.append(bytes.fromhex(hexa.decode() + ("0" if len(hexa) % 2 else "")).decode("cp1252", errors="replace"))
+            elif in_array is None:
+                try:
+                    if float(s) < -200:  # desplazamiento grande dentro de TJ = espacio
+                        current.append(" ")
+                except ValueError:
+                    pass
+
+    def newline():
+        if current:
+            lines.append("".join(current))
+            current.clear()
+
+    for token in _TOKEN_RE.findall(stream):
+        if token == b"[":
+            in_array = []
+            continue
+        if token == b"]":
+            operands.append(in_array or [])
+            in_array = None
+            continue
+        if in_array is not None:
+            in_array.append(token)
+            continue
+        if token[:1] in b"(<" or token[:1].isdigit() or token[:1] in b"-+./":
+            operands.append(token)
+            continue
+        op = token
+        if op == b"Tj" and operands:
+            show([operands[-1]])
+        elif op == b"TJ" and operands and isinstance(operands[-1], list):
+            saved, in_array = in_array, None
+            show(operands[-1])
+            in_array = saved
+        elif op in (b"'", b'"') and operands:
+            newline()
+            show([operands[-1]])
+        elif op in (b"T*", b"ET", b"Tm"):
+            newline()
+        elif op in (b"Td", b"TD") and len(operands) >= 2:
+            try:
+                if float(operands[-1]) != 0:
+                    newline()
+                elif current:
+                    current.append(" ")
+            except (TypeError, ValueError):
+                newline()
+        operands = []
+    newline()
+    return lines
+
+def _builtin_text(pdf: bytes) -> str:
+    lines: List[str] = []
+    for header, data in _STREAM_RE.findall(pdf):
+        if b"/Image" in header or b"/ObjStm" in header or b"/XRef" in header or b"/Length1" in header:
+            continue
+        if b"/FlateDecode" in header:
+            try:
+                data = zlib.decompressobj().decompress(data)
+            except zlib.error:
+                continue
+        elif b"/Filter" in header:
+            continue
+        lines.extend(_content_text(data))
+    return "\n".join(lines)
+
+def extract_text(pdf: bytes) -> str:
+    """Texto del PDF. Usa ``pypdf`` si está instalado (fuentes CID/ToUnicode); si no, un lector mínimo propio."""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return _builtin_text(pdf)
+    from io import BytesIO
+    reader = PdfReader(BytesIO(pdf))
+    return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+# =======================================================
+# 3. CAMPOS
+# =======================================================
+
+def _label_regex(label: str) -> str:
+    """Patrón de la etiqueta tolerante a acentos, mayúsculas y espacios."""
+    parts = []
+    for ch in label:
+        base = unicodedata.normalize("NFD", ch)[0]
+        if ch.isspace():
+            parts.append(r"\s*")
+        elif base != ch or base.lower() in "aeiou":
+            parts.append(f"[{re.escape(base)}{re.escape(ch)}{re.escape(base.upper())}{re.escape(ch.upper())}]")
+        else:
+            parts.append(re.escape(ch))
+    return "".join(parts)
+
+_ALL_LABELS = {**IDENTIFICACION_LABELS, **DOMICILIO_LABELS, **{label: None for label in STOP_LABELS}}
+# Las etiquetas largas primero para que "Nombre de Vialidad" no se confunda con "Nombre (s)"
+_LABEL_RE = re.compile(
+    "|".join(f"(?P<l{i}>{_label_regex(label)})\\s*:?"
+             for i, label in enumerate(sorted(_ALL_LABELS, key=len, reverse=True))),
+    re.I,
+)
+_LABEL_KEYS = [_ALL_LABELS[label] for label in sorted(_ALL_LABELS, key=len, reverse=True)]
+_FECHA_RE = re.compile(r"(\d{1,2})\s+DE\s+([A-ZÁÉÍÓÚ]+)\s+DE\s+(\d{4})", re.I)
+_DATE_TAIL_RE = re.compile(r"^(.*?)\s+(\d{2}/\d{2}/\d{4})(?:\s+(\d{2}/\d{2}/\d{4}))?\s*$")
+_RFC_RE = re.compile(r"\b([A-ZÑ&]{3,4}\d{6}[A-Z0-9]{3})\b")
+
+
+def _label_values(text: str) -> Dict[str, str]:
+    """Valor de cada etiqueta conocida: el texto hasta la siguiente etiqueta o fin de línea."""
+    values: Dict[str, str] = {}
+    for line in text.splitlines():
+        matches = list(_LABEL_RE.finditer(line))
+        for n, match in enumerate(matches):
+            key = _LABEL_KEYS[int(match.lastgroup[1:])]
+            end = matches[n + 1].start() if n + 1 < len(matches) else len(line)
+            value = line[match.end():end].strip(" :")
+            if key and value and key not in values:
+                values[key] = value
+    return values
+
+def _section_rows(lines: List[str], start: str, stops: Sequence[str]) -> List[Tuple[str, str, Optional[str]]]:
+    """Filas (descripción, fecha inicio, fecha fin) de una tabla entre ``start`` y la primera de ``stops``."""
+    start_re = re.compile(_label_regex(start) + r"\s*:", re.I)
+    stop_res = [re.compile(_label_regex(s), re.I) for s in stops]
+    rows, inside = [], False
+    for line in lines:
+        if not inside:
+            inside = bool(start_re.match(line.strip()))
+            continue
+        if any(r.match(line.strip()) for r in stop_res):
+            break
+        match = _DATE_TAIL_RE.match(line.strip())
+        if match:
+            rows.append((match.group(1).strip(), match.group(2), match.group(3)))
+    return rows
+
+def _parse_fecha(text: str) -> Optional[str]:
+    match = _FECHA_RE.search(text)
+    if not match:
+        return None
+    day, month, year = match.groups()
+    month_key = unicodedata.normalize("NFD", month.upper()).encode("ascii", "ignore").decode()
+    month_number = MESES.get(month_key) or (int(month) if month.isdigit() else None)
+    if not month_number:
+        return None
+    try:
+        return date(int(year), month_number, int(day)).isoformat()
+    except ValueError:
+        return None
+
+def parse_constancia_text(text: str, source: str = "") -> ConstanciaRecord:
+    """Interpreta el texto de una constancia (persona física o moral)."""
+    lines = [line for line in text.splitlines() if line.strip()]
+    values = _label_values(text)
+
+    emision_line = next((l for l in lines if re.search(_label_regex("Fecha de Emisión"), l, re.I)), "")
+    nombre = " ".join(filter(None, (values.get("nombre"), values.get("primer_apellido"), values.get("segundo_apellido"))))
+    rfc = values.get("rfc", "").split()[0] if values.get("rfc") else None
+    if not rfc:
+        found = _RFC_RE.search(text)
+        rfc = found.group(1) if found else None
+
+    regimenes = [
+        {"regimen": desc, "fecha_inicio": start, "fecha_fin": end}
+        for desc, start, end in _section_rows(lines, "Regímenes", ("Obligaciones",))
+        if not re.match(_label_regex("Régimen Fecha"), desc, re.I)
+    ]
+    obligaciones = [
+        {"descripcion": desc, "fecha_inicio": start, "fecha_fin": end}
+        for desc, start, end in _section_rows(lines, "Obligaciones", ("Sus datos personales", "Cadena Original"))
+    ]
+    return ConstanciaRecord(
+        source=source,
+        rfc=rfc,
+        curp=values["curp"].split()[0] if values.get("curp") else None,
+        nombre=nombre or None,
+        razon_social=values.get("razon_social"),
+        fecha_emision=_parse_fecha(emision_line),
+        estatus=values.get("estatus"),
+        domicilio={key: values[key] for key in DOMICILIO_LABELS.values() if values.get(key)},
+        regimenes=regimenes,
+        obligaciones=obligaciones,
+    )
+
+def extract_constancia(pdf: bytes, source: str = "") -> ConstanciaRecord:
+    """Extrae el registro de una constancia a partir de los bytes del PDF."""
+    return parse_constancia_text(extract_text(pdf), source)
+
+def _extract_to_dict(pdf: bytes, source: str) -> Dict:
+    # Función de módulo para que el pool de procesos pueda serializarla
+    return extract_constancia(pdf, source).to_dict()
+
+
+# =======================================================
+# 4. POOL DE EXTRACCIÓN
+# =======================================================
+
+class ConstanciaExtractor:
+    """Extrae constancias en segundo plano y agrega cada registro a un JSON lines.
+
+    Por defecto (``max_workers=0``) extrae en un hilo del propio proceso: cada constancia
+    cuesta milisegundos y así no se lanzan procesos junto a Chrome. Con ``max_workers > 0``
+    usa un pool de procesos, útil solo para extraer lotes grandes de PDFs ya descargados.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_EXTRACT_WORKERS):
+        self.max_workers = max_workers
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self.extracted = 0
+        self.failed = 0
+
+    def __enter__(self) -> "ConstanciaExtractor":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _pool(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.max_workers > 0:
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="extraccion")
+            return self._executor
+
+    def submit(self, pdf: bytes, source: str, output_path: Optional[Path] = None) -> Future:
+        """Programa la extracción; el Future devuelve el registro como dict."""
+        future = self._pool().submit(_extract_to_dict, pdf, source)
+
+        def done(f: Future):
+            error = f.exception()
+            with self._lock:
+                if error is not None:
+                    self.failed += 1
+                    print(f"[EXTRACCIÓN] Falló {source}: {type(error).__name__}: {error}")
+                    return
+                self.extracted += 1
+                if output_path is not None:
+                    with open(output_path, "a", encoding="utf-8") as fh:
+                        fh.write(json.dumps(f.result(), ensure_ascii=False) + "\n")
+        future.add_done_callback(done)
+        return future
+
+    def close(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+_extractor: Optional[ConstanciaExtractor] = None
+_extractor_lock = threading.Lock()
+
+
+def get_extractor() -> ConstanciaExtractor:
+    """Extractor compartido del proceso (el hilo o el pool se crea con la primera constancia)."""
+    global _extractor
+    with _extractor_lock:
+        if _extractor is None:
+            import atexit
+            _extractor = ConstanciaExtractor()
+            atexit.register(_extractor.close)
+        return _extractor
+
+
+# =======================================================
+# 5. LÍNEA DE COMANDOS Y BENCHMARK
+# =======================================================
+
+def benchmark(samples: int, workers: Sequence[int], compress: bool = True) -> List[Dict[str, float]]:
+    """Mide constancias/s al extraer ``samples`` PDFs simulados con distintos tamaños de pool."""
+    from sat_mock_portal import MOCK_TAXPAYER, constancia_lines, render_pdf
+
+    pdfs = []
+    for i in range(samples):
+        taxpayer = dict(MOCK_TAXPAYER, rfc=f"XAXX0101{i % 100:02d}{i % 10}00"[:13])
+        pdfs.append(render_pdf(constancia_lines(taxpayer), compress=compress))
+
+    start = time.perf_counter()
+    for i, pdf in enumerate(pdfs):
+        extract_constancia(pdf, f"muestra_{i}.pdf")
+    results = [{"workers": 0, "seconds": time.perf_counter() - start}]
+
+    for count in workers:
+        with ConstanciaExtractor(count) as extractor:
+            extractor._pool().submit(int).result()  # Arrancar los procesos fuera de la medición
+            start = time.perf_counter()
+            futures = [extractor.submit(pdf, f"muestra_{i}.pdf") for i, pdf in enumerate(pdfs)]
+            for future in futures:
+                future.result()
+            results.append({"workers": count, "seconds": time.perf_counter() - start})
+    for r in results:
+        r["per_second"] = samples / r["seconds"] if r["seconds"] > 0 else 0.0
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extrae los datos de constancias PDF a JSON lines.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    extract = sub.add_parser("extract", help="Extrae constancias PDF")
+    extract.add_argument("pdfs", nargs="+", type=Path)
+    extract.add_argument("--output", type=Path, default=Path("constancias.jsonl"))
+    extract.add_argument("--workers", type=int, default=DEFAULT_EXTRACT_WORKERS,
+                         help="Procesos del pool (0 = en este proceso)")
+    bench = sub.add_parser("bench", help="Benchmark con constancias simuladas")
+    bench.add_argument("--samples", type=int, default=500)
+    bench.add_argument("--workers", default="1,2,4", help="Tamaños del pool de procesos, e.g. '1,2,4'")
+    bench.add_argument("--uncompressed", action="store_true", help="Streams sin FlateDecode")
+    args = parser.parse_args()
+
+    if args.command == "extract":
+        with ConstanciaExtractor(args.workers) as extractor:
+            for pdf in args.pdfs:
+                extractor.submit(pdf.read_bytes(), pdf.name, args.output)
+        print(f"{extractor.extracted} constancias extraídas ({extractor.failed} con error) en {args.output}")
+    else:
+        workers = [int(w) for w in args.workers.split(",") if w.strip()]
+        for r in benchmark(args.samples, workers, compress=not args.uncompressed):
+            label = "en proceso" if r["workers"] == 0 else f"{r['workers']} procesos"
+            print(f"{label:<12} {r['seconds']:7.2f} s  {r['per_second']:8.1f} constancias/s")
+
+
+if __name__ == "__main__":
+    main()
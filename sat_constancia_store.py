@@ -0,0 +1,213 @@
+"""Almacén local de constancias direccionado por contenido (SHA-256), indexado por RFC y fecha de emisión."""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo exclusión entre hilos del mismo proceso
+    fcntl = None
+
+
+# =======================================================
+# 1. CONFIGURACIÓN
+# =======================================================
+
+STORE_DIR = Path.cwd() / ".sat_constancias"
+INDEX_FILENAME = "index.json"
+# Archivo bloqueado con flock durante cada lectura-modificación-escritura del índice
+LOCK_FILENAME = "index.lock"
+# Una constancia descargada hace menos de esto se reutiliza sin abrir el navegador
+CONSTANCIA_FRESHNESS_SECONDS = 6 * 60 * 60
+# Política de desalojo: edad máxima y tope de entradas/bytes (se desaloja primero la menos usada)
+STORE_MAX_AGE_SECONDS = 30 * 24 * 60 * 60
+STORE_MAX_ENTRIES = 500
+STORE_MAX_BYTES = 200 * 1024 * 1024
+
+
+class StoredConstancia(NamedTuple):
+    """Entrada del índice: un PDF único (por hash) y su RFC."""
+    sha256: str
+    rfc: str
+    issue_date: str  # ISO 8601; fecha de emisión del PDF o, si no se pudo leer, de la descarga
+    fetched_at: float
+    last_access: float
+    size_bytes: int
+
+    def age_seconds(self, now: Optional[float] = None) -> float:
+        return (now or time.time()) - self.fetched_at
+
+
+def _issue_date(content: bytes, fetched_at: float) -> str:
+    """Fecha de emisión impresa en la constancia; si no se puede leer, la fecha de descarga."""
+    try:
+        from sat_constancia_extract import extract_constancia
+        issued = extract_constancia(content).fecha_emision
+    except Exception:
+        issued = None
+    return issued or date.fromtimestamp(fetched_at).isoformat()
+
+
+# =======================================================
+# 2. ALMACÉN
+# =======================================================
+
+class ConstanciaStore:
+    """PDFs en ``blobs/<sha[:2]>/<sha>.pdf`` y un índice JSON por hash, con desalojo por edad y LRU."""
+
+    def __init__(self, directory: Path = STORE_DIR, max_age_seconds: float = STORE_MAX_AGE_SECONDS,
+                 max_entries: int = STORE_MAX_ENTRIES, max_bytes: int = STORE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_age_seconds = max_age_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def blob_path(self, sha256: str) -> Path:
+        return self.directory / "blobs" / sha256[:2] / f"{sha256}.pdf"
+
+    # --- Índice (se relee en cada operación para convivir con otros procesos) ---
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Exclusión entre hilos y, con flock, entre procesos (e.g., los workers de sat_job_queue)."""
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.directory / LOCK_FILENAME, "ab") as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _load_index(self) -> Dict[str, StoredConstancia]:
+        try:
+            data = json.loads((self.directory / INDEX_FILENAME).read_text(encoding="utf-8"))
+            return {sha: StoredConstancia(**entry) for sha, entry in data.items()}
+        except FileNotFoundError:
+            return {}
+        except (ValueError, TypeError) as e:
+            print(f"[ALMACÉN] Índice ilegible, se reconstruye vacío: {e}")
+            return {}
+
+    def _save_index(self, index: Dict[str, StoredConstancia]):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".tmp_", dir=str(self.directory))
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump({sha: entry._asdict() for sha, entry in index.items()}, fh)
+        os.replace(tmp, str(self.directory / INDEX_FILENAME))
+
+    # --- Operaciones ---
+
+    def put(self, rfc: str, content: bytes) -> StoredConstancia:
+        """Guarda el PDF; si ya existe el mismo contenido solo se renueva su entrada (deduplicación)."""
+        sha = hashlib.sha256(content).hexdigest()
+        now = time.time()
+        blob = self.blob_path(sha)
+        with self._locked():
+            index = self._load_index()
+            existing = index.get(sha)
+            if existing is None or not blob.exists():
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                fd, tmp = tempfile.mkstemp(prefix=".tmp_", suffix=".pdf", dir=str(blob.parent))
+                with os.fdopen(fd, "wb") as fh:
+                    fh.write(content)
+                os.replace(tmp, str(blob))
+                issue_date = _issue_date(content, now)
+            else:
+                print(f"[ALMACÉN] Constancia de {rfc} idéntica a una ya guardada ({sha[:12]}); no se duplica.")
+                issue_date = existing.issue_date
+            entry = StoredConstancia(sha, rfc.upper(), issue_date, now, now, len(content))
+            index[sha] = entry
+            self._evict(index, now)
+            self._save_index(index)
+        return entry
+
+    def put_file(self, rfc: str, path: Path) -> StoredConstancia:
+        return self.put(rfc, Path(path).read_bytes())
+
+    def lookup(self, rfc: str, max_age_seconds: float = CONSTANCIA_FRESHNESS_SECONDS) -> Optional[StoredConstancia]:
+        """Constancia más reciente del RFC descargada dentro de la ventana de frescura, o None."""
+        now = time.time()
+        with self._locked():
+            index = self._load_index()
+            fresh = [e for e in index.values()
+                     if e.rfc == rfc.upper() and e.age_seconds(now) <= max_age_seconds and self.blob_path(e.sha256).exists()]
+            if not fresh:
+                return None
+            entry = max(fresh, key=lambda e: e.fetched_at)._replace(last_access=now)
+            index[entry.sha256] = entry
+            self._save_index(index)
+        return entry
+
+    def find(self, rfc: str, issue_date: Optional[str] = None) -> List[StoredConstancia]:
+        """Constancias guardadas del RFC (opcionalmente de una fecha de emisión), la más reciente primero."""
+        with self._locked():
+            index = self._load_index()
+        entries = [e for e in index.values()
+                   if e.rfc == rfc.upper() and (issue_date is None or e.issue_date == issue_date)]
+        return sorted(entries, key=lambda e: e.fetched_at, reverse=True)
+
+    def materialize(self, entry: StoredConstancia, destination: Path) -> Path:
+        """Deja una copia del PDF en ``destination`` (enlace duro si es posible) de forma atómica."""
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        if destination.exists():
+            return destination
+        tmp = destination.with_name(f".tmp_{entry.sha256[:12]}_{destination.name}")
+        try:
+            os.link(str(self.blob_path(entry.sha256)), str(tmp))
+        except OSError:
+            shutil.copyfile(str(self.blob_path(entry.sha256)), str(tmp))
+        os.replace(str(tmp), str(destination))
+        return destination
+
+    def evict(self) -> int:
+        """Aplica la política de desalojo; devuelve cuántas entradas se eliminaron."""
+        with self._locked():
+            index = self._load_index()
+            removed = self._evict(index, time.time())
+            if removed:
+                self._save_index(index)
+        return removed
+
+    def _evict(self, index: Dict[str, StoredConstancia], now: float) -> int:
+        # Primero por edad; después las menos usadas hasta cumplir los topes
+        doomed = {sha for sha, e in index.items() if e.age_seconds(now) > self.max_age_seconds}
+        remaining = sorted((e for sha, e in index.items() if sha not in doomed), key=lambda e: e.last_access)
+        total_bytes = sum(e.size_bytes for e in remaining)
+        while remaining and (len(remaining) > self.max_entries or total_bytes > self.max_bytes):
+            entry = remaining.pop(0)
+            doomed.add(entry.sha256)
+            total_bytes -= entry.size_bytes
+        for sha in doomed:
+            del index[sha]
+            blob = self.blob_path(sha)
+            try:
+                blob.unlink()
+                blob.parent.rmdir()  # Solo si quedó vacío
+            except OSError:
+                pass
+        return len(doomed)
+
+
+_default_store: Optional[ConstanciaStore] = None
+_default_lock = threading.Lock()
+
+
+def get_constancia_store() -> ConstanciaStore:
+    """Almacén por defecto del proceso."""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = ConstanciaStore()
+        return _default_store
@@ -0,0 +1,284 @@
+"""Detección de descargas completas: eventos CDP, inotify (Linux) y sondeo como último recurso."""
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+
+# =======================================================
+# 1. CONFIGURACIÓN
+# =======================================================
+
+# Intervalo para leer eventos CDP del log de rendimiento de ChromeDriver
+CDP_EVENT_POLL_SECONDS = 0.1
+# Sin ningún evento de descarga CDP en este intervalo se pasa a inotify/sondeo
+CDP_SILENCE_SECONDS = 5
+# Intervalo del sondeo de respaldo (plataformas sin inotify)
+FALLBACK_POLL_SECONDS = 0.2
+# El tamaño debe mantenerse igual durante este intervalo para considerar el archivo cerrado
+SIZE_STABLE_SECONDS = 0.15
+# Tiempo máximo para que un PDF ya aparecido termine de escribirse y pase la validación
+COMPLETION_GRACE_SECONDS = 10
+# Bytes del final del archivo donde se busca el marcador %%EOF
+PDF_TAIL_BYTES = 2048
+
+PARTIAL_SUFFIXES = (".crdownload", ".tmp", ".part")
+
+# Constantes de inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0o2000000)
+INOTIFY_EVENT_HEADER = struct.Struct("iIII")
+
+
+class DownloadResult(NamedTuple):
+    """PDF descargado y validado, con métricas de la descarga."""
+    path: Path
+    size_bytes: int
+    elapsed_seconds: float
+    source: str  # 'cdp', 'inotify' o 'poll'
+
+    @property
+    def bytes_per_second(self) -> float:
+        if self.elapsed_seconds <= 0:
+            return float(self.size_bytes)
+        return self.size_bytes / self.elapsed_seconds
+
+
+# =======================================================
+# 2. VALIDACIÓN DEL ARCHIVO
+# =======================================================
+
+def snapshot_filenames(directory: Path) -> Set[str]:
+    """Obtiene los nombres de los archivos en un directorio."""
+    try:
+        return {p.name for p in directory.iterdir() if p.is_file()}
+    except FileNotFoundError:
+        return set()
+    except Exception:
+        return set()
+
+def is_candidate_pdf(name: str) -> bool:
+    """Un .pdf terminado (no un archivo parcial de Chrome como .crdownload)."""
+    lower = name.lower()
+    return lower.endswith(".pdf") and not lower.endswith(PARTIAL_SUFFIXES)
+
+def has_pdf_markers(path: Path) -> bool:
+    """Comprueba la cabecera %PDF y el marcador %%EOF al final del archivo."""
+    try:
+        with path.open("rb") as fh:
+            if fh.read(5) != b"%PDF-":
+                return False
+            fh.seek(0, os.SEEK_END)
+            size = fh.tell()
+            fh.seek(max(0, size - PDF_TAIL_BYTES))
+            return b"%%EOF" in fh.read()
+    except OSError:
+        return False
+
+def _first_new_pdf(download_dir: Path, known_files: Set[str]) -> Optional[Path]:
+    """Primer PDF terminado que no estaba en el directorio antes de la descarga."""
+    new_pdfs = [n for n in snapshot_filenames(download_dir) - known_files if is_candidate_pdf(n)]
+    return download_dir / sorted(new_pdfs)[0] if new_pdfs else None
+
+def wait_until_pdf_complete(path: Path, timeout_seconds: float = COMPLETION_GRACE_SECONDS) -> Optional[int]:
+    """Espera a que el tamaño sea estable y el PDF esté completo; devuelve su tamaño."""
+    deadline = time.monotonic() + timeout_seconds
+    last_size = -1
+    while time.monotonic() < deadline:
+        try:
+            size = path.stat().st_size
+        except OSError:
+            size = -1
+
+        if size > 0 and size == last_size and has_pdf_markers(path):
+            return size
+        last_size = size
+        time.sleep(SIZE_STABLE_SECONDS)
+    return None
+
+
+# =======================================================
+# 3. FUENTES DE EVENTOS
+# =======================================================
+
+def drain_cdp_download_events(driver) -> Optional[List[Dict]]:
+    """Lee los eventos de descarga CDP acumulados en el log de rendimiento.
+
+    Devuelve ``None`` si el driver no tiene habilitado el log de rendimiento.
+    """
+    try:
+        entries = driver.get_log("performance")
+    except Exception:
+        return None
+
+    events = []
+    for entry in entries:
+        try:
+            message = json.loads(entry["message"])["message"]
+        except (KeyError, TypeError, ValueError):
+            continue
+        method = message.get("method", "")
+        if method.endswith(".downloadWillBegin") or method.endswith(".downloadProgress"):
+            events.append(message)
+    return events
+
+def _wait_with_cdp_events(
+    driver,
+    download_dir: Path,
+    known_files: Set[str],
+    deadline: float,
+    pending: Optional[List[Dict]] = None,
+) -> Tuple[Optional[Path], bool]:
+    """Espera el evento downloadProgress 'completed' y localiza el archivo correspondiente.
+
+    ``pending`` son eventos ya leídos del log (al comprobar si está habilitado), que se
+    procesan primero. Devuelve ``(archivo, hubo_eventos)``: si en CDP_SILENCE_SECONDS no
+    llega ningún evento de descarga se abandona la espera para usar el sistema de archivos.
+    """
+    suggested: Dict[str, str] = {}
+    heard = False
+    silence_deadline = time.monotonic() + CDP_SILENCE_SECONDS
+    while time.monotonic() < deadline:
+        events = pending if pending is not None else (drain_cdp_download_events(driver) or [])
+        pending = None
+        heard = heard or bool(events)
+        for event in events:
+            params = event.get("params", {})
+            guid = params.get("guid")
+            if event["method"].endswith(".downloadWillBegin"):
+                suggested[guid] = params.get("suggestedFilename", "")
+                continue
+
+            state = params.get("state")
+            if state == "canceled":
+                print(f" -> Descarga cancelada por Chrome ({suggested.get(guid, guid)}).")
+                return None, True
+            if state != "completed":
+                continue
+
+            name = suggested.get(guid)
+            if name and is_candidate_pdf(name) and (download_dir / name).exists():
+                return download_dir / name, True
+
+        # El nombre sugerido pudo cambiar (duplicados) o la descarga ocurrió en una
+        # pestaña cuyos eventos no se registran: usar el PDF nuevo del directorio
+        found = _first_new_pdf(download_dir, known_files)
+        if found:
+            return found, heard
+        if not heard and time.monotonic() >= silence_deadline:
+            return None, False
+        time.sleep(CDP_EVENT_POLL_SECONDS)
+    return None, heard
+
+def _load_libc_inotify():
+    """Carga las funciones inotify de libc (solo Linux)."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+def _wait_with_inotify(libc, download_dir: Path, known_files: Set[str], deadline: float) -> Optional[Path]:
+    """Bloquea sobre inotify hasta que aparezca un PDF terminado (rename de .crdownload)."""
+    fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1 falló")
+    try:
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(fd, os.fsencode(str(download_dir)), mask) < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch falló")
+
+        # El archivo pudo llegar antes de registrar el watch
+        while True:
+            found = _first_new_pdf(download_dir, known_files)
+            if found:
+                return found
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            readable, _, _ = select.select([fd], [], [], remaining)
+            if readable:
+                try:
+                    os.read(fd, 64 * (INOTIFY_EVENT_HEADER.size + 256))
+                except BlockingIOError:
+                    pass
+    finally:
+        os.close(fd)
+
+def _wait_with_polling(download_dir: Path, known_files: Set[str], deadline: float) -> Optional[Path]:
+    """Sondeo corto del directorio (respaldo para plataformas sin inotify)."""
+    while time.monotonic() < deadline:
+        found = _first_new_pdf(download_dir, known_files)
+        if found:
+            return found
+        time.sleep(FALLBACK_POLL_SECONDS)
+    return None
+
+def _wait_on_filesystem(download_dir: Path, known_files: Set[str], deadline: float) -> Tuple[Optional[Path], str]:
+    """Espera el PDF con inotify si está disponible; si no, con sondeo."""
+    libc = _load_libc_inotify()
+    if libc is not None:
+        try:
+            return _wait_with_inotify(libc, download_dir, known_files, deadline), "inotify"
+        except OSError:
+            pass
+    return _wait_with_polling(download_dir, known_files, deadline), "poll"
+
+
+# =======================================================
+# 4. ESPERA DE LA DESCARGA
+# =======================================================
+
+def wait_for_pdf_download(
+    download_dir: Path,
+    known_files: Set[str],
+    timeout_seconds: float,
+    driver=None,
+) -> Optional[DownloadResult]:
+    """Espera a que un PDF nuevo termine de descargarse y lo valida.
+
+    Usa los eventos CDP ``downloadWillBegin``/``downloadProgress`` si el driver tiene
+    el log de rendimiento habilitado (los eventos leídos al comprobarlo no se pierden);
+    si no hay log o no llega ningún evento, inotify en Linux y, en último caso, sondeo.
+    """
+    start = time.monotonic()
+    deadline = start + timeout_seconds
+    found = None
+    heard = False
+
+    probed = drain_cdp_download_events(driver) if driver is not None else None
+    if probed is not None:
+        found, heard = _wait_with_cdp_events(driver, download_dir, known_files, deadline, probed)
+        source = "cdp"
+    if not heard and found is None and time.monotonic() < deadline:
+        if probed is not None:
+            print(" -> Sin eventos CDP de descarga; se espera el archivo en el directorio.")
+        found, source = _wait_on_filesystem(download_dir, known_files, deadline)
+
+    if found is None:
+        return None
+
+    size = wait_until_pdf_complete(found, min(COMPLETION_GRACE_SECONDS, max(deadline - time.monotonic(), 1)))
+    if size is None:
+        print(f" -> El archivo {found.name} no es un PDF completo (tamaño inestable o sin %PDF/%%EOF).")
+        return None
+    return DownloadResult(found, size, time.monotonic() - start, source)
+
+def wait_for_new_pdf_download(download_dir: Path, known_files: Set[str], timeout_seconds: float, driver=None) -> Optional[Path]:
+    """Espera a que un nuevo archivo PDF aparezca y termine de escribirse en el directorio."""
+    result = wait_for_pdf_download(download_dir, known_files, timeout_seconds, driver)
+    return result.path if result else None
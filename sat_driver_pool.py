@@ -0,0 +1,293 @@
+"""Pool de drivers de Chrome precalentados para generar constancias en lote."""
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Iterable, List, NamedTuple, Optional
+
+from sat_browser import BrowserDriver
+from sat_resources import ResourceGovernor, get_resource_governor, quit_and_reap
+from sat_selenium_fiel import (
+    RESOURCE_GOVERNOR,
+    check_efirma_before_browser,
+    close_extra_windows,
+    create_chrome_driver,
+    fresh_constancia,
+    is_driver_usable,
+    portal_origins,
+    run_sat_flow,
+)
+
+
+# =======================================================
+# 1. CONFIGURACIÓN
+# =======================================================
+
+DEFAULT_POOL_SIZE = 2
+# Número de constancias que procesa un Chrome antes de reciclarlo
+DEFAULT_MAX_JOBS_PER_DRIVER = 25
+ACQUIRE_TIMEOUT_SECONDS = 300
+# Espera máxima por memoria libre antes de lanzar (o relanzar) un Chrome del pool
+LAUNCH_CAPACITY_TIMEOUT_SECONDS = 120
+
+
+class ConstanciaJob(NamedTuple):
+    """Un trabajo de generación: archivos de e.firma, contraseña y directorio de salida."""
+    cer_path: str
+    key_path: str
+    key_pass: str
+    download_dir: Path
+
+
+class JobResult(NamedTuple):
+    """Resultado de un trabajo del lote."""
+    job: ConstanciaJob
+    pdf_path: Optional[Path]
+    error: Optional[Exception]
+    elapsed_seconds: float
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+# =======================================================
+# 2. LIMPIEZA DE ESTADO ENTRE TRABAJOS
+# =======================================================
+
+def reset_driver_state(driver: BrowserDriver):
+    """Deja el driver como recién iniciado: una sola pestaña, sin cookies ni storage."""
+    close_extra_windows(driver, None)
+    driver.get("about:blank")
+    driver.delete_all_cookies()
+    driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+    driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+    for origin in portal_origins():
+        driver.execute_cdp_cmd("Storage.clearDataForOrigin", {
+            "origin": origin,
+            "storageTypes": "all",
+        })
+
+
+
+# =======================================================
+# 3. POOL DE DRIVERS
+# =======================================================
+
+_worker_ids = itertools.count(1)
+
+
+class PooledDriver:
+    """Driver del pool junto con el número de trabajos que ha procesado."""
+
+    def __init__(self, driver: Optional[BrowserDriver]):
+        self.driver = driver
+        self.jobs_done = 0
+        self.launched_at = time.time()
+        self.worker = f"chrome-{next(_worker_ids)}"
+
+
+class DriverPool:
+    """Pool acotado de drivers de Chrome reutilizables.
+
+    Los drivers se lanzan por adelantado y se reciclan al llegar a
+    ``max_jobs_per_driver`` trabajos, cuando Chrome deja de responder o
+    cuando su árbol de procesos supera la memoria que permite el gobernador.
+    """
+
+    def __init__(
+        self,
+        size: int = DEFAULT_POOL_SIZE,
+        max_jobs_per_driver: int = DEFAULT_MAX_JOBS_PER_DRIVER,
+        base_download_dir: Optional[Path] = None,
+        driver_factory: Callable[[Path], BrowserDriver] = create_chrome_driver,
+        governor: Optional[ResourceGovernor] = None,
+    ):
+        if size < 1:
+            raise ValueError("El tamaño del pool debe ser al menos 1.")
+        self.size = size
+        self.max_jobs_per_driver = max_jobs_per_driver
+        self.base_download_dir = base_download_dir or (Path.cwd() / "constancias")
+        self.driver_factory = driver_factory
+        self.governor = governor or (get_resource_governor() if RESOURCE_GOVERNOR else None)
+        self._idle: "queue.Queue[PooledDriver]" = queue.Queue(maxsize=size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self.launched = 0
+        self.recycled = 0
+
+    def __enter__(self) -> "DriverPool":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _launch(self) -> PooledDriver:
+        if self.governor:
+            self.governor.reserve_launch(LAUNCH_CAPACITY_TIMEOUT_SECONDS)
+        try:
+            driver = self.driver_factory(self.base_download_dir)
+        except Exception:
+            if self.governor:
+                self.governor.cancel_launch()
+            raise
+        pooled = PooledDriver(driver)
+        if self.governor:
+            self.governor.register(pooled.worker, driver)
+        with self._lock:
+            self.launched += 1
+        return pooled
+
+    def _retire(self, pooled: PooledDriver, reason: Optional[str] = None):
+        """Cierra el driver y termina los procesos de Chrome que queden vivos."""
+        if self.governor:
+            self.governor.unregister(pooled.worker, reason)
+        quit_and_reap(pooled.driver)
+
+    def start(self):
+        """Lanza todos los drivers del pool en paralelo.
+
+        Si algún arranque falla se cierran los que sí arrancaron (``__exit__`` no se
+        ejecuta cuando falla ``__enter__``) y se relanza el primer error.
+        """
+        if self.governor:
+            self.governor.start_monitor()
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            futures = [executor.submit(self._launch) for _ in range(self.size)]
+            wait(futures)
+
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        if errors:
+            for future in futures:
+                if future.exception() is None:
+                    self._retire(future.result(), "arranque")
+            if self.governor:
+                self.governor.stop_monitor()
+            raise errors[0]
+        for future in futures:
+            self._idle.put(future.result())
+
+    def acquire(self, timeout: float = ACQUIRE_TIMEOUT_SECONDS) -> PooledDriver:
+        """Toma un driver libre, esperando si todos están ocupados."""
+        if self._closed:
+            raise RuntimeError("El pool de drivers ya fue cerrado.")
+        pooled = self._idle.get(timeout=timeout)
+        if pooled.driver is None:
+            # Cupo cuyo relanzamiento falló antes: se reintenta aquí
+            try:
+                return self._launch()
+            except Exception:
+                self._idle.put(pooled)
+                raise
+        return pooled
+
+    def release(self, pooled: PooledDriver, crashed: bool = False):
+        """Devuelve un driver al pool, limpiándolo o reciclándolo según corresponda."""
+        pooled.jobs_done += 1
+        reason = None
+        if crashed:
+            reason = "crash"
+        elif pooled.jobs_done >= self.max_jobs_per_driver:
+            reason = "max_jobs"
+        elif self.governor:
+            usage = self.governor.over_limit(pooled.worker)
+            if usage:
+                print(f"[POOL] {pooled.worker} usa {usage.rss_mb:.0f} MB en {usage.processes} procesos; se reciclará.")
+                reason = "memoria"
+        recycle = reason is not None
+
+        if not recycle:
+            try:
+                reset_driver_state(pooled.driver)
+            except Exception as e:
+                print(f"[POOL] No se pudo limpiar el driver, se reciclará: {e}")
+                recycle, reason = True, "reset"
+
+        if recycle:
+            self._retire(pooled, reason)
+            with self._lock:
+                self.recycled += 1
+            if self._closed:
+                return
+            try:
+                pooled = self._launch()
+            except Exception as e:
+                # Se conserva el cupo vacío: el siguiente acquire reintentará el arranque
+                print(f"[POOL] No se pudo relanzar Chrome: {e}")
+                pooled = PooledDriver(None)
+
+        if self._closed:
+            if pooled.driver:
+                self._retire(pooled)
+            return
+        self._idle.put(pooled)
+
+    def run_job(self, job: ConstanciaJob) -> JobResult:
+        """Ejecuta un trabajo en un driver del pool."""
+        start_time = time.time()
+        try:
+            cert = check_efirma_before_browser(job.cer_path, job.key_path, job.key_pass)
+        except (FileNotFoundError, ValueError) as e:
+            return JobResult(job, None, e, time.time() - start_time)
+        cached = fresh_constancia(cert, job.download_dir)
+        if cached:
+            return JobResult(job, cached, None, time.time() - start_time)
+        try:
+            pooled = self.acquire()
+        except queue.Empty:
+            error = TimeoutError(f"Ningún Chrome del pool quedó libre en {ACQUIRE_TIMEOUT_SECONDS} s.")
+            return JobResult(job, None, error, time.time() - start_time)
+        except Exception as e:
+            # Relanzamiento fallido, memoria insuficiente o pool cerrado: solo falla este trabajo
+            return JobResult(job, None, e, time.time() - start_time)
+        crashed = False
+        try:
+            pdf_path = run_sat_flow(pooled.driver, job.cer_path, job.key_path, job.key_pass, job.download_dir)
+            return JobResult(job, pdf_path, None, time.time() - start_time)
+        except Exception as e:
+            crashed = not is_driver_usable(pooled.driver)
+            return JobResult(job, None, e, time.time() - start_time)
+        finally:
+            self.release(pooled, crashed=crashed)
+
+    def close(self):
+        """Cierra todos los drivers libres del pool."""
+        self._closed = True
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if pooled.driver:
+                self._retire(pooled)
+        if self.governor:
+            self.governor.reap_orphans()
+            self.governor.stop_monitor()
+
+
+# =======================================================
+# 4. ENTRADA DE LOTE
+# =======================================================
+
+def run_batch(
+    jobs: Iterable[ConstanciaJob],
+    pool_size: int = DEFAULT_POOL_SIZE,
+    max_jobs_per_driver: int = DEFAULT_MAX_JOBS_PER_DRIVER,
+) -> List[JobResult]:
+    """Procesa una lista de trabajos sobre un pool de drivers reutilizables."""
+    jobs = [ConstanciaJob(*job) for job in jobs]
+    if not jobs:
+        return []
+
+    pool_size = min(pool_size, len(jobs))
+    with DriverPool(pool_size, max_jobs_per_driver) as pool:
+        with ThreadPoolExecutor(max_workers=pool_size) as executor:
+            results = list(executor.map(pool.run_job, jobs))
+
+    ok = sum(1 for r in results if r.ok)
+    print(f"[POOL] Lote terminado: {ok}/{len(results)} exitosos, "
+          f"{pool.launched} Chrome lanzados, {pool.recycled} reciclados.")
+    return results
@@ -0,0 +1,188 @@
+"""Lectura local de la e.firma: certificado (.cer), llave privada (.key) y firma de datos."""
+import base64
+import hashlib
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Tuple
+
+
+# OID 2.5.4.45 (x500UniqueIdentifier): en los certificados del SAT contiene "RFC / CURP"
+OID_X500_UNIQUE_IDENTIFIER = "2.5.4.45"
+# Aviso cuando al certificado le quedan menos días de vigencia
+EXPIRY_WARNING_DAYS = 15
+
+
+def _crypto():
+    """Importa ``cryptography`` (dependencia opcional) con un mensaje claro si falta."""
+    try:
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import padding
+    except ImportError:
+        raise RuntimeError(
+            "La lectura de la e.firma requiere el paquete 'cryptography' (pip install cryptography)."
+        )
+    return x509, hashes, serialization, padding
+
+
+class CertificateInfo(NamedTuple):
+    """Datos del certificado de la e.firma."""
+    rfc: str
+    serial: str
+    not_before: datetime
+    not_after: datetime
+    der: bytes
+
+    @property
+    def pem_body(self) -> str:
+        """Certificado en base64 sin cabeceras PEM (como lo envía el portal)."""
+        return base64.b64encode(self.der).decode("ascii")
+
+    def is_valid_at(self, when: datetime) -> bool:
+        return self.not_before <= when <= self.not_after
+
+
+def sat_serial_number(serial_number: int) -> str:
+    """Número de serie del SAT: los bytes del entero son dígitos ASCII (e.g., '00001000000...')."""
+    raw = serial_number.to_bytes((serial_number.bit_length() + 7) // 8 or 1, "big")
+    try:
+        text = raw.decode("ascii")
+    except UnicodeDecodeError:
+        return format(serial_number, "x")
+    return text if text.isdigit() else format(serial_number, "x")
+
+
+def parse_certificate(der: bytes) -> CertificateInfo:
+    """Interpreta un certificado DER del SAT."""
+    x509, _, _, _ = _crypto()
+    cert = x509.load_der_x509_certificate(der)
+
+    rfc = ""
+    for attr in cert.subject:
+        if attr.oid.dotted_string == OID_X500_UNIQUE_IDENTIFIER:
+            rfc = str(attr.value).split("/")[0].strip().upper()
+            break
+
+    not_before = getattr(cert, "not_valid_before_utc", None) or cert.not_valid_before.replace(tzinfo=timezone.utc)
+    not_after = getattr(cert, "not_valid_after_utc", None) or cert.not_valid_after.replace(tzinfo=timezone.utc)
+    return CertificateInfo(rfc, sat_serial_number(cert.serial_number), not_before, not_after, der)
+
+
+def load_certificate(cer_path: str) -> CertificateInfo:
+    """Lee y analiza el archivo .cer."""
+    return parse_certificate(Path(cer_path).read_bytes())
+
+
+def load_private_key(key_path: str, password: str):
+    """Descifra la llave privada (.key, PKCS#8 DER cifrado) con la contraseña."""
+    _, _, serialization, _ = _crypto()
+    data = Path(key_path).read_bytes()
+    try:
+        return serialization.load_der_private_key(data, password=password.encode("utf-8"))
+    except ValueError as e:
+        raise ValueError(f"No se pudo descifrar la llave privada (¿contraseña incorrecta?): {e}")
+
+
+def sign(private_key, data: bytes, algorithm: str = "sha256") -> bytes:
+    """Firma RSA PKCS#1 v1.5 de ``data``."""
+    _, hashes, _, padding = _crypto()
+    digest = {"sha1": hashes.SHA1, "sha256": hashes.SHA256}[algorithm]()
+    return private_key.sign(data, padding.PKCS1v15(), digest)
+
+
+def verify(cert: CertificateInfo, data: bytes, signature: bytes, algorithm: str = "sha256") -> bool:
+    """Verifica una firma RSA PKCS#1 v1.5 de ``data`` con la llave pública del certificado."""
+    x509, hashes, _, padding = _crypto()
+    from cryptography.exceptions import InvalidSignature
+    digest = {"sha1": hashes.SHA1, "sha256": hashes.SHA256}[algorithm]()
+    try:
+        x509.load_der_x509_certificate(cert.der).public_key().verify(signature, data, padding.PKCS1v15(), digest)
+        return True
+    except InvalidSignature:
+        return False
+
+
+def key_matches_certificate(private_key, cert: CertificateInfo) -> bool:
+    """Comprueba que la llave pública del certificado corresponde a la llave privada."""
+    x509, _, serialization, _ = _crypto()
+    public_cert = x509.load_der_x509_certificate(cert.der).public_key()
+    fmt = serialization.PublicFormat.SubjectPublicKeyInfo
+    enc = serialization.Encoding.DER
+    return public_cert.public_bytes(enc, fmt) == private_key.public_key().public_bytes(enc, fmt)
+
+
+class EfirmaPreflightError(ValueError):
+    """La e.firma no puede usarse para iniciar sesión (vencida, contraseña incorrecta o llave ajena)."""
+
+
+def crypto_available() -> bool:
+    try:
+        _crypto()
+    except RuntimeError:
+        return False
+    return True
+
+
+# Resultado por (hash .cer, hash .key, hash de la contraseña): el certificado o el motivo del rechazo.
+# La contraseña se resume con una sal aleatoria del proceso; no se guarda en claro.
+_preflight_cache: Dict[Tuple[str, str, str], Tuple[Optional[CertificateInfo], Optional[str]]] = {}
+_preflight_lock = threading.Lock()
+_password_salt = os.urandom(16)
+
+
+def preflight_efirma(cer_path: str, key_path: str, password: str, now: Optional[datetime] = None) -> CertificateInfo:
+    """Valida la e.firma sin navegador: certificado legible y vigente, llave descifrable y del mismo certificado.
+
+    El análisis se guarda en memoria por hash de los archivos, así que repetir la
+    validación de la misma e.firma (e.g., en un lote) cuesta solo leer y resumir los archivos.
+    Lanza FileNotFoundError o EfirmaPreflightError.
+    """
+    try:
+        cer_der = Path(cer_path).read_bytes()
+        key_der = Path(key_path).read_bytes()
+    except OSError:
+        raise FileNotFoundError(f"Rutas de e.firma inválidas o inaccesibles: {cer_path} / {key_path}")
+
+    cache_key = (
+        hashlib.sha256(cer_der).hexdigest(),
+        hashlib.sha256(key_der).hexdigest(),
+        hashlib.sha256(_password_salt + password.encode("utf-8")).hexdigest(),
+    )
+    with _preflight_lock:
+        cached = _preflight_cache.get(cache_key)
+    if cached is None:
+        cached = _analyze_efirma(cer_der, key_der, password)
+        with _preflight_lock:
+            _preflight_cache[cache_key] = cached
+    cert, problem = cached
+    if problem:
+        raise EfirmaPreflightError(problem)
+
+    # La vigencia depende del momento de la consulta: no se guarda en caché
+    now = now or datetime.now(timezone.utc)
+    if now < cert.not_before:
+        raise EfirmaPreflightError(f"El certificado de {cert.rfc} aún no es válido (desde {cert.not_before:%Y-%m-%d}).")
+    if now > cert.not_after:
+        raise EfirmaPreflightError(f"El certificado de {cert.rfc} venció el {cert.not_after:%Y-%m-%d}.")
+    if cert.not_after - now < timedelta(days=EXPIRY_WARNING_DAYS):
+        print(f"[E.FIRMA] El certificado de {cert.rfc} vence el {cert.not_after:%Y-%m-%d}.")
+    return cert
+
+
+def _analyze_efirma(cer_der: bytes, key_der: bytes, password: str) -> Tuple[Optional[CertificateInfo], Optional[str]]:
+    _, _, serialization, _ = _crypto()
+    try:
+        cert = parse_certificate(cer_der)
+    except ValueError as e:
+        return None, f"El archivo .cer no es un certificado válido: {e}"
+    if not cert.rfc:
+        return None, "El certificado no contiene el RFC (¿es un certificado del SAT?)."
+    try:
+        private_key = serialization.load_der_private_key(key_der, password=password.encode("utf-8"))
+    except (ValueError, TypeError) as e:
+        return None, f"No se pudo descifrar la llave privada de {cert.rfc} (¿contraseña incorrecta?): {e}"
+    if not key_matches_certificate(private_key, cert):
+        return None, f"La llave privada no corresponde al certificado de {cert.rfc} (serie {cert.serial})."
+    return cert, None
@@ -0,0 +1,190 @@
+"""Resolución de frames: mapea el árbol de iframes una vez por navegación y recuerda qué control vive en cada frame."""
+import threading
+import uuid
+import weakref
+from typing import Dict, List, Optional, Tuple
+
+from selenium.common.exceptions import NoSuchFrameException, WebDriverException
+
+from sat_browser import BrowserDriver
+from sat_telemetry import record_frame, record_retry
+
+
+# =======================================================
+# 1. CONFIGURACIÓN
+# =======================================================
+
+FramePath = Tuple[int, ...]
+
+# Controles que se buscan en cada frame (CSS o XPath)
+FRAME_CONTROLS = {
+    "login": ["css", "input[type='text'], input[type='email'], input[type='password'], input[type='file']"],
+    "file": ["css", "input[type='file']"],
+    "password": ["css", "input[type='password']"],
+    "generar": ["xpath", "//*[@id='formReimpAcuse:j_idt50'] | //button[contains(normalize-space(.),'Generar Constancia')]"],
+}
+# Marca que se deja en el documento principal para detectar navegaciones
+NAVIGATION_TOKEN_ATTR = "__satFrameMapToken"
+
+
+# =======================================================
+# 2. SONDA DEL ÁRBOL DE FRAMES
+# =======================================================
+
+_PROBE_JS = """
+    const controls = arguments[0];
+    const prefix = arguments[1];
+    const out = {};
+    const opaque = [];
+    function matches(doc, spec) {
+        try {
+            if (spec[0] === 'css') return !!doc.querySelector(spec[1]);
+            return !!doc.evaluate(spec[1], doc, null,
+                XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+        } catch (e) { return false; }
+    }
+    function probe(win, path) {
+        let doc;
+        try { doc = win.document; void doc.documentElement; } catch (e) { opaque.push(path); return; }
+        if (!doc) { opaque.push(path); return; }
+        for (const name of Object.keys(controls)) {
+            if (matches(doc, controls[name])) (out[name] = out[name] || []).push(path);
+        }
+        let count = 0;
+        try { count = win.frames.length; } catch (e) { count = 0; }
+        for (let i = 0; i < count; i++) probe(win.frames[i], path.concat([i]));
+    }
+    probe(window, prefix);
+    return [out, opaque];
+"""
+
+_TOKEN_JS = """
+    const attr = arguments[0];
+    const value = arguments[1];
+    if (value) { window[attr] = value; }
+    return window[attr] || null;
+"""
+
+
+def switch_to_frame_path(driver: BrowserDriver, path: FramePath):
+    """Cambia al frame indicado por su ruta de índices desde el documento principal."""
+    driver.switch_to.default_content()
+    for index in path:
+        driver.switch_to.frame(index)
+
+
+class FrameMap:
+    """Rutas de frame (DFS, documento principal primero) donde aparece cada control."""
+
+    def __init__(self, token: str, controls: Dict[str, List[FramePath]]):
+        self.token = token
+        self.controls = controls
+
+    def paths(self, control: str) -> List[FramePath]:
+        return self.controls.get(control, [])
+
+
+# =======================================================
+# 3. RESOLUTOR CON CACHÉ
+# =======================================================
+
+class FrameResolver:
+    """Mapea el árbol de frames con una sola sonda y reutiliza el mapa hasta la siguiente navegación.
+
+    Los frames del mismo origen se recorren dentro de la sonda; solo los frames de
+    otro origen requieren entrar con ``switch_to.frame`` y repetir la sonda.
+    """
+
+    def __init__(self, driver: BrowserDriver):
+        self.driver = driver
+        self._map: Optional[FrameMap] = None
+        self.probes = 0
+
+    def invalidate(self):
+        self._map = None
+
+    def _current_token(self) -> Optional[str]:
+        self.driver.switch_to.default_content()
+        return self.driver.execute_script(_TOKEN_JS, NAVIGATION_TOKEN_ATTR, None)
+
+    def _build_map(self) -> FrameMap:
+        driver = self.driver
+        token = uuid.uuid4().hex
+        driver.switch_to.default_content()
+        driver.execute_script(_TOKEN_JS, NAVIGATION_TOKEN_ATTR, token)
+
+        controls: Dict[str, List[FramePath]] = {}
+        pending: List[FramePath] = [()]
+        while pending:
+            path = pending.pop(0)
+            try:
+                switch_to_frame_path(driver, path)
+                found, opaque = driver.execute_script(_PROBE_JS, FRAME_CONTROLS, list(path))
+                self.probes += 1
+            except (NoSuchFrameException, WebDriverException):
+                continue
+            for name, paths in found.items():
+                controls.setdefault(name, []).extend(tuple(p) for p in paths)
+            # Frames de otro origen: entrar y sondear desde dentro
+            pending.extend(tuple(p) for p in opaque if tuple(p) != path)
+
+        driver.switch_to.default_content()
+        return FrameMap(token, controls)
+
+    def frame_map(self) -> FrameMap:
+        """Mapa vigente; se reconstruye si el documento principal navegó."""
+        if self._map is None or self._current_token() != self._map.token:
+            self._map = self._build_map()
+        return self._map
+
+    def cached_frame_for(self, control: str) -> Optional[FramePath]:
+        """Ruta del control según el último mapa construido, sin sondear el DOM."""
+        paths = self._map.paths(control) if self._map else []
+        return paths[0] if paths else None
+
+    def frame_for(self, control: str, prefer_frames: bool = False) -> Optional[FramePath]:
+        """Ruta del frame que contiene el control (o None si no aparece en ningún frame)."""
+        paths = self.frame_map().paths(control)
+        if prefer_frames:
+            nested = [p for p in paths if p]
+            if nested:
+                return nested[0]
+        return paths[0] if paths else None
+
+    def switch_to(self, control: str, prefer_frames: bool = False) -> bool:
+        """Cambia al frame del control; si el frame cambió desde el mapeo, vuelve a mapear una vez."""
+        for attempt in range(2):
+            if attempt:
+                record_retry()
+            path = self.frame_for(control, prefer_frames)
+            if path is None:
+                if attempt == 0 and self._map is not None:
+                    # El control pudo aparecer después del mapeo (contenido dinámico del frame)
+                    self.invalidate()
+                    continue
+                self.driver.switch_to.default_content()
+                return False
+            try:
+                switch_to_frame_path(self.driver, path)
+                if self.driver.execute_script(_PROBE_JS, {control: FRAME_CONTROLS[control]}, [])[0]:
+                    record_frame(control, path)
+                    return True
+            except (NoSuchFrameException, WebDriverException):
+                pass
+            self.invalidate()
+        self.driver.switch_to.default_content()
+        return False
+
+
+_resolvers: "weakref.WeakKeyDictionary[BrowserDriver, FrameResolver]" = weakref.WeakKeyDictionary()
+_resolvers_lock = threading.Lock()
+
+
+def get_frame_resolver(driver: BrowserDriver) -> FrameResolver:
+    """Resolutor de frames asociado a un driver (uno por driver)."""
+    with _resolvers_lock:
+        resolver = _resolvers.get(driver)
+        if resolver is None:
+            resolver = FrameResolver(driver)
+            _resolvers[driver] = resolver
+        return resolver
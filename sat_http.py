@@ -0,0 +1,304 @@
+"""Cliente HTTP mínimo con conexiones keep-alive reutilizables (solo biblioteca estándar)."""
+import http.client
+import http.cookies
+import os
+import queue
+import ssl
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+
+# =======================================================
+# 1. CONFIGURACIÓN
+# =======================================================
+
+HTTP_TIMEOUT_SECONDS = 60
+# Conexiones ociosas que se conservan por host
+MAX_IDLE_CONNECTIONS_PER_HOST = 4
+MAX_REDIRECTS = 5
+STREAM_CHUNK_BYTES = 64 * 1024
+DEFAULT_USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+
+
+class StreamedFile(NamedTuple):
+    """Respuesta escrita en disco."""
+    path: Path
+    size_bytes: int
+    elapsed_seconds: float
+    content_type: str
+    # Cuerpo en memoria (solo con keep_content=True), para procesarlo sin releer el archivo
+    content: Optional[bytes] = None
+
+    @property
+    def bytes_per_second(self) -> float:
+        if self.elapsed_seconds <= 0:
+            return float(self.size_bytes)
+        return self.size_bytes / self.elapsed_seconds
+
+
+# =======================================================
+# 2. POOL DE CONEXIONES
+# =======================================================
+
+class ConnectionPool:
+    """Conexiones HTTP(S) keep-alive agrupadas por (esquema, host, puerto)."""
+
+    def __init__(self, timeout: float = HTTP_TIMEOUT_SECONDS, max_idle_per_host: int = MAX_IDLE_CONNECTIONS_PER_HOST,
+                 ssl_context: Optional[ssl.SSLContext] = None):
+        self.timeout = timeout
+        self.max_idle_per_host = max_idle_per_host
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self._idle: Dict[Tuple[str, str, int], "queue.LifoQueue[http.client.HTTPConnection]"] = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def _key(self, url: str) -> Tuple[str, str, int]:
+        parts = urlsplit(url)
+        scheme = parts.scheme or "https"
+        port = parts.port or (443 if scheme == "https" else 80)
+        return scheme, parts.hostname or "", port
+
+    def new_connection(self, key: Tuple[str, str, int]) -> http.client.HTTPConnection:
+        scheme, host, port = key
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self.ssl_context)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=self.timeout)
+        with self._lock:
+            self.created += 1
+        return conn
+
+    def acquire(self, url: str) -> Tuple[Tuple[str, str, int], http.client.HTTPConnection, bool]:
+        """Conexión para la URL: una ociosa si existe (reused=True) o una nueva."""
+        key = self._key(url)
+        with self._lock:
+            idle = self._idle.setdefault(key, queue.LifoQueue())
+        try:
+            conn = idle.get_nowait()
+            with self._lock:
+                self.reused += 1
+            return key, conn, True
+        except queue.Empty:
+            return key, self.new_connection(key), False
+
+    def release(self, key: Tuple[str, str, int], conn: http.client.HTTPConnection, reusable: bool = True):
+        idle = self._idle.get(key)
+        if reusable and idle is not None and idle.qsize() < self.max_idle_per_host:
+            idle.put(conn)
+        else:
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            queues = list(self._idle.values())
+            self._idle.clear()
+        for idle in queues:
+            while True:
+                try:
+                    idle.get_nowait().close()
+                except queue.Empty:
+                    break
+
+
+_default_pool = ConnectionPool()
+
+
+def get_connection_pool() -> ConnectionPool:
+    """Pool de conexiones compartido del proceso."""
+    return _default_pool
+
+
+# =======================================================
+# 3. PETICIONES
+# =======================================================
+
+def cookie_header_for(url: str, cookies: Iterable[Dict]) -> str:
+    """Cabecera Cookie para la URL a partir de cookies en formato CDP (name, value, domain, path, secure)."""
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    path = parts.path or "/"
+    pairs = []
+    for cookie in cookies:
+        domain = cookie.get("domain", "").lower()
+        bare = domain.lstrip(".")
+        if not (host == bare or host.endswith("." + bare)):
+            continue
+        if not path.startswith(cookie.get("path", "/") or "/"):
+            continue
+        if cookie.get("secure") and parts.scheme != "https":
+            continue
+        pairs.append(f"{cookie['name']}={cookie['value']}")
+    return "; ".join(pairs)
+
+
+class CookieJar:
+    """Cookies de una sesión HTTP en el mismo formato que CDP (name, value, domain, path, secure)."""
+
+    def __init__(self, cookies: Optional[Iterable[Dict]] = None):
+        self._cookies: Dict[Tuple[str, str, str], Dict] = {}
+        self._lock = threading.Lock()
+        for cookie in cookies or []:
+            self.set(cookie)
+
+    def set(self, cookie: Dict):
+        key = (cookie.get("domain", "").lower(), cookie.get("path", "/") or "/", cookie["name"])
+        with self._lock:
+            self._cookies[key] = dict(cookie)
+
+    def update_from_response(self, url: str, headers: Iterable[Tuple[str, str]]):
+        """Aplica las cabeceras Set-Cookie de una respuesta."""
+        host = (urlsplit(url).hostname or "").lower()
+        for name, value in headers:
+            if name.lower() != "set-cookie":
+                continue
+            parsed = http.cookies.SimpleCookie()
+            try:
+                parsed.load(value)
+            except http.cookies.CookieError:
+                continue
+            for morsel in parsed.values():
+                cookie = {
+                    "name": morsel.key,
+                    "value": morsel.value,
+                    "domain": morsel["domain"] or host,
+                    "path": morsel["path"] or "/",
+                    "secure": bool(morsel["secure"]),
+                    "httpOnly": bool(morsel["httponly"]),
+                }
+                if morsel["max-age"] in ("0", "-1") or morsel.value == "":
+                    self.delete(cookie)
+                else:
+                    self.set(cookie)
+
+    def delete(self, cookie: Dict):
+        key = (cookie.get("domain", "").lower(), cookie.get("path", "/") or "/", cookie["name"])
+        with self._lock:
+            self._cookies.pop(key, None)
+
+    def cookies(self) -> List[Dict]:
+        with self._lock:
+            return [dict(c) for c in self._cookies.values()]
+
+
+class HttpResponse(NamedTuple):
+    """Respuesta abierta: se debe leer o cerrar con ``finish``."""
+    url: str
+    status: int
+    headers: List[Tuple[str, str]]
+    raw: http.client.HTTPResponse
+    release: object  # callable(reusable: bool)
+
+    def header(self, name: str, default: str = "") -> str:
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return default
+
+    def read(self) -> bytes:
+        try:
+            data = self.raw.read()
+        except Exception:
+            self.release(False)
+            raise
+        self.release(not self.raw.will_close)
+        return data
+
+    def finish(self):
+        """Descarta el resto del cuerpo y devuelve la conexión al pool."""
+        self.read()
+
+
+def request(method: str, url: str, headers: Optional[Dict[str, str]] = None, body: Optional[bytes] = None,
+            cookies: Optional[Iterable[Dict]] = None, pool: Optional[ConnectionPool] = None,
+            follow_redirects: bool = True, cookie_jar: Optional[CookieJar] = None) -> HttpResponse:
+    """Envía una petición por una conexión del pool; sigue redirecciones con GET.
+
+    Con ``cookie_jar`` las cookies se toman del jar y se actualizan en cada salto.
+    """
+    pool = pool or get_connection_pool()
+    cookies = list(cookies or [])
+
+    for _ in range(MAX_REDIRECTS + 1):
+        if cookie_jar is not None:
+            cookies = cookie_jar.cookies()
+        send_headers = {"User-Agent": DEFAULT_USER_AGENT, "Accept": "*/*", "Connection": "keep-alive"}
+        send_headers.update(headers or {})
+        cookie = cookie_header_for(url, cookies)
+        if cookie:
+            send_headers["Cookie"] = cookie
+
+        parts = urlsplit(url)
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+
+        key, conn, reused = pool.acquire(url)
+        while True:
+            try:
+                conn.request(method, target, body=body, headers=send_headers)
+                raw = conn.getresponse()
+                break
+            except (http.client.HTTPException, OSError):
+                # La conexión que falló nunca vuelve al pool, tampoco la del reintento
+                conn.close()
+                if not reused:
+                    raise
+            # Conexión keep-alive cerrada por el servidor: reintentar una vez con una nueva
+            conn, reused = pool.new_connection(key), False
+
+        def release(reusable: bool, _key=key, _conn=conn):
+            pool.release(_key, _conn, reusable)
+
+        response = HttpResponse(url, raw.status, raw.getheaders(), raw, release)
+        if cookie_jar is not None:
+            cookie_jar.update_from_response(url, response.headers)
+        location = response.header("Location")
+        if follow_redirects and raw.status in (301, 302, 303, 307, 308) and location:
+            response.finish()
+            url = urljoin(url, location)
+            if raw.status in (301, 302, 303):
+                method, body = "GET", None
+                headers = {k: v for k, v in (headers or {}).items() if k.lower() != "content-type"}
+            continue
+        return response
+
+    raise http.client.HTTPException(f"Demasiadas redirecciones desde {url}")
+
+
+def stream_response_to_file(response: HttpResponse, destination: Path, keep_content: bool = False) -> StreamedFile:
+    """Escribe el cuerpo en un temporal junto al destino y lo mueve de forma atómica.
+
+    Con ``keep_content`` también conserva el cuerpo en memoria (``StreamedFile.content``).
+    """
+    start = time.monotonic()
+    chunks: Optional[List[bytes]] = [] if keep_content else None
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".stream_", suffix=destination.suffix, dir=str(destination.parent))
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            while True:
+                chunk = response.raw.read(STREAM_CHUNK_BYTES)
+                if not chunk:
+                    break
+                fh.write(chunk)
+                size += len(chunk)
+                if chunks is not None:
+                    chunks.append(chunk)
+        response.release(not response.raw.will_close)
+        os.replace(tmp, str(destination))
+    except BaseException:
+        response.release(False)
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    content = b"".join(chunks) if chunks is not None else None
+    return StreamedFile(destination, size, time.monotonic() - start, response.header("Content-Type"), content)
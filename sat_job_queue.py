@@ -0,0 +1,466 @@
+"""Cola de trabajos compartida entre máquinas (SQLite en almacenamiento común) con arrendamientos y latidos."""
+import argparse
+import csv
+import multiprocessing
+import os
+import random
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, NamedTuple, Optional, Sequence
+
+from sat_session_store import SESSION_KEY_ENV, generate_session_key, load_fernet
+
+
+# =======================================================
+# 1. CONFIGURACIÓN
+# =======================================================
+
+QUEUE_DB_PATH = Path.cwd() / "sat_jobs.sqlite3"
+# Un trabajo arrendado vuelve a la cola si su trabajador no renueva el arrendamiento a tiempo
+LEASE_SECONDS = 300.0
+HEARTBEAT_SECONDS = 60.0
+DEFAULT_MAX_ATTEMPTS = 3
+POLL_SECONDS = 2.0
+# Espera de SQLite ante bloqueos de otros procesos/máquinas
+BUSY_TIMEOUT_SECONDS = 30.0
+# "DELETE" funciona en sistemas de archivos de red; "WAL" es más rápido pero solo en un mismo host
+JOURNAL_MODE = os.environ.get("SAT_QUEUE_JOURNAL_MODE", "DELETE")
+ENGINES = ("selenium", "pool", "browserless")
+
+QUEUED, LEASED, SUCCEEDED, FAILED = "queued", "leased", "succeeded", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    cer_path TEXT NOT NULL,
+    key_path TEXT NOT NULL,
+    key_pass TEXT NOT NULL,  -- token Fernet (SAT_SESSION_KEY), nunca la contraseña en claro
+    download_dir TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    created_at REAL NOT NULL,
+    finished_at REAL,
+    pdf_path TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at);
+"""
+
+
+class QueuedJob(NamedTuple):
+    """Trabajo arrendado por un trabajador."""
+    id: int
+    cer_path: str
+    key_path: str
+    key_pass: str
+    download_dir: Path
+    attempts: int
+    max_attempts: int
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+# =======================================================
+# 2. COLA
+# =======================================================
+
+class JobQueue:
+    """Cola en una base SQLite compartida; cada operación es una transacción corta.
+
+    Un trabajador toma un trabajo con un arrendamiento (``lease_expires``) y lo renueva
+    con latidos. Si el trabajador muere, el arrendamiento vence y otro lo reclama.
+    Las contraseñas de la e.firma se guardan cifradas con la clave Fernet ``key`` (por
+    defecto ``SAT_SESSION_KEY``), que debe ser la misma en todas las máquinas.
+    """
+
+    def __init__(self, db_path: Path = QUEUE_DB_PATH, lease_seconds: float = LEASE_SECONDS,
+                 key: Optional[str] = None):
+        self.db_path = Path(db_path)
+        self.lease_seconds = lease_seconds
+        self._key = key
+        self._fernet = None
+        self._local = threading.local()
+        created = not self.db_path.exists()
+        self._conn().executescript(_SCHEMA)
+        if created:
+            os.chmod(self.db_path, 0o600)  # Guarda contraseñas de e.firma (cifradas)
+
+    def cipher(self):
+        """Cifrador de las contraseñas; lanza RuntimeError/ValueError si falta ``cryptography`` o la clave."""
+        if self._fernet is None:
+            self._fernet = load_fernet(self._key or os.environ.get(SESSION_KEY_ENV))
+        return self._fernet
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute(f"PRAGMA journal_mode={JOURNAL_MODE}")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # IMMEDIATE toma el bloqueo de escritura al inicio: dos trabajadores no pueden tomar el mismo trabajo
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def enqueue(self, cer_path: str, key_path: str, key_pass: str, download_dir: Path,
+                max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> int:
+        return self.enqueue_many([(cer_path, key_path, key_pass, download_dir)], max_attempts)[0]
+
+    def enqueue_many(self, jobs: Iterable[Sequence], max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> list:
+        """Encola (cer_path, key_path, key_pass, download_dir) en una sola transacción."""
+        cipher = self.cipher()
+        now = time.time()
+        ids = []
+        with self._transaction() as conn:
+            for cer_path, key_path, key_pass, download_dir in jobs:
+                sealed = cipher.encrypt(key_pass.encode("utf-8")).decode("ascii")
+                cursor = conn.execute(
+                    "INSERT INTO jobs (cer_path, key_path, key_pass, download_dir, max_attempts, available_at, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (str(cer_path), str(key_path), sealed, str(download_dir), max_attempts, now, now),
+                )
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def claim(self, worker_id: str) -> Optional[QueuedJob]:
+        """Arrienda el siguiente trabajo disponible (o con arrendamiento vencido)."""
+        cipher = self.cipher()
+        from cryptography.fernet import InvalidToken
+        while True:
+            now = time.time()
+            with self._transaction() as conn:
+                # Arrendamientos vencidos sin intentos restantes: el trabajador murió en el último intento
+                conn.execute(
+                    "UPDATE jobs SET status = ?, finished_at = ?, lease_owner = NULL,"
+                    " error = 'Arrendamiento vencido (trabajador caído) en el último intento'"
+                    " WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts",
+                    (FAILED, now, LEASED, now),
+                )
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_expires < ?)"
+                    " ORDER BY available_at, id LIMIT 1",
+                    (QUEUED, now, LEASED, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                if row["status"] == LEASED:
+                    print(f"[COLA] Reclamando el trabajo {row['id']} de {row['lease_owner']} (arrendamiento vencido).")
+                conn.execute(
+                    "UPDATE jobs SET status = ?, lease_owner = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                    (LEASED, worker_id, now + self.lease_seconds, row["id"]),
+                )
+            try:
+                key_pass = cipher.decrypt(row["key_pass"].encode("utf-8")).decode("utf-8")
+            except InvalidToken:
+                # Clave distinta a la del encolado (o fila en claro): reintentar no ayuda
+                error = f"No se pudo descifrar la contraseña con {SESSION_KEY_ENV} (¿clave distinta a la del encolado?)"
+                print(f"[COLA] Trabajo {row['id']}: {error}.")
+                self.fail(row["id"], worker_id, error)
+                # Siguiente trabajo (en bucle: una cola llena de filas ilegibles no debe agotar la pila)
+                continue
+            return QueuedJob(row["id"], row["cer_path"], row["key_path"], key_pass, Path(row["download_dir"]),
+                             row["attempts"] + 1, row["max_attempts"])
+
+    def heartbeat(self, job_id: int, worker_id: str) -> bool:
+        """Renueva el arrendamiento; False si otro trabajador ya lo reclamó."""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND lease_owner = ? AND status = ?",
+                (time.time() + self.lease_seconds, job_id, worker_id, LEASED),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: int, worker_id: str, pdf_path: Path) -> bool:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, pdf_path = ?, finished_at = ?, lease_owner = NULL, error = NULL"
+                " WHERE id = ? AND lease_owner = ? AND status = ?",
+                (SUCCEEDED, str(pdf_path), time.time(), job_id, worker_id, LEASED),
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: int, worker_id: str, error: str, retry_in: Optional[float] = None) -> bool:
+        """Registra la falla; con ``retry_in`` y intentos restantes el trabajo vuelve a la cola."""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ? AND lease_owner = ? AND status = ?",
+                               (job_id, worker_id, LEASED)).fetchone()
+            if row is None:
+                return False
+            if retry_in is not None and row["attempts"] < row["max_attempts"]:
+                conn.execute("UPDATE jobs SET status = ?, available_at = ?, lease_owner = NULL, error = ? WHERE id = ?",
+                             (QUEUED, now + retry_in, error, job_id))
+            else:
+                conn.execute("UPDATE jobs SET status = ?, finished_at = ?, lease_owner = NULL, error = ? WHERE id = ?",
+                             (FAILED, now, error, job_id))
+        return True
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def requeue_failed(self) -> int:
+        """Devuelve a la cola los trabajos fallidos, con sus intentos, error y arrendamiento reiniciados."""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, attempts = 0, available_at = ?, finished_at = NULL, error = NULL,"
+                " lease_owner = NULL, lease_expires = NULL WHERE status = ?",
+                (QUEUED, time.time(), FAILED),
+            )
+        return cursor.rowcount
+
+
+# =======================================================
+# 3. TRABAJADOR
+# =======================================================
+
+Runner = Callable[[str, str, str, Path], Path]
+
+
+class QueueWorker:
+    """Toma trabajos de la cola, ejecuta el core y registra el resultado, con latidos mientras trabaja."""
+
+    def __init__(self, queue: JobQueue, runner: Runner, worker_id: Optional[str] = None,
+                 heartbeat_seconds: float = HEARTBEAT_SECONDS, poll_seconds: float = POLL_SECONDS,
+                 is_retryable: Optional[Callable[[BaseException], bool]] = None):
+        self.queue = queue
+        self.runner = runner
+        self.worker_id = worker_id or default_worker_id()
+        self.heartbeat_seconds = heartbeat_seconds
+        self.poll_seconds = poll_seconds
+        if is_retryable is None:
+            from sat_orchestrator import is_retryable
+        self.is_retryable = is_retryable
+        self.processed = 0
+
+    def _heartbeat(self, job: QueuedJob, done: threading.Event):
+        while not done.wait(self.heartbeat_seconds):
+            try:
+                if not self.queue.heartbeat(job.id, self.worker_id):
+                    print(f"[COLA] {self.worker_id} perdió el arrendamiento del trabajo {job.id}.")
+                    return
+            except sqlite3.Error as e:
+                print(f"[COLA] Latido fallido del trabajo {job.id}: {e}")
+
+    def run_one(self, job: QueuedJob):
+        done = threading.Event()
+        beat = threading.Thread(target=self._heartbeat, args=(job, done), name=f"latido-{job.id}", daemon=True)
+        beat.start()
+        try:
+            pdf_path = self.runner(job.cer_path, job.key_path, job.key_pass, job.download_dir)
+        except Exception as e:
+            done.set()
+            retry_in = None
+            if self.is_retryable(e):
+                from sat_orchestrator import backoff_delay
+                retry_in = backoff_delay(job.attempts)
+            self.queue.fail(job.id, self.worker_id, f"{type(e).__name__}: {e}", retry_in)
+            print(f"[COLA] Trabajo {job.id} falló (intento {job.attempts}/{job.max_attempts}): {type(e).__name__}: {e}")
+        else:
+            done.set()
+            if not self.queue.complete(job.id, self.worker_id, pdf_path):
+                print(f"[COLA] El trabajo {job.id} terminó, pero otro trabajador lo había reclamado.")
+        finally:
+            done.set()
+            beat.join()
+        self.processed += 1
+
+    def run(self, stop: Optional[threading.Event] = None, max_jobs: Optional[int] = None, exit_when_idle: bool = False):
+        """Procesa trabajos hasta ``stop``, ``max_jobs`` o (con ``exit_when_idle``) una cola vacía."""
+        stop = stop or threading.Event()
+        while not stop.is_set() and (max_jobs is None or self.processed < max_jobs):
+            job = self.queue.claim(self.worker_id)
+            if job is None:
+                if exit_when_idle:
+                    return
+                # Jitter para que muchos trabajadores no consulten la base al mismo tiempo
+                stop.wait(self.poll_seconds * random.uniform(0.5, 1.5))
+                continue
+            self.run_one(job)
+
+
+def make_runner(engine: str):
+    """Runner del core para un proceso trabajador; devuelve (runner, cierre)."""
+    if engine == "pool":
+        from sat_driver_pool import DriverPool
+        from sat_orchestrator import pooled_runner
+        pool = DriverPool(size=1)
+        pool.start()
+        return pooled_runner(pool), pool.close
+    if engine == "browserless":
+        from sat_browserless import run_sat_browserless
+        return run_sat_browserless, lambda: None
+    from sat_selenium_fiel import run_sat_automation_core
+    return run_sat_automation_core, lambda: None
+
+def _worker_process(db_path: str, engine: str, lease_seconds: float, exit_when_idle: bool):
+    queue = JobQueue(Path(db_path), lease_seconds)
+    try:
+        queue.cipher()
+    except (RuntimeError, ValueError) as e:
+        print(f"[COLA] El trabajador no puede descifrar las contraseñas: {e}")
+        return
+    runner, close = make_runner(engine)
+    worker = QueueWorker(queue, runner)
+    print(f"[COLA] Trabajador {worker.worker_id} listo (motor {engine}).")
+    try:
+        worker.run(exit_when_idle=exit_when_idle)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close()
+        queue.close()
+
+
+# =======================================================
+# 4. PRUEBA DE RENDIMIENTO MULTIPROCESO
+# =======================================================
+
+def _bench_worker(db_path: str, lease_seconds: float, work_ms: float, crash_rate: float, seed: int, key: str):
+    rng = random.Random(seed)
+
+    def runner(cer_path, key_path, key_pass, download_dir):
+        if rng.random() < crash_rate:
+            os._exit(1)  # Trabajador caído a mitad del trabajo: el arrendamiento debe vencer y reclamarse
+        time.sleep(work_ms / 1000)
+        return Path(download_dir) / "constancia.pdf"
+
+    queue = JobQueue(Path(db_path), lease_seconds, key)
+    worker = QueueWorker(queue, runner, heartbeat_seconds=max(lease_seconds / 3, 0.05), poll_seconds=0.05,
+                         is_retryable=lambda e: False)
+    worker.run()  # El proceso padre lo termina cuando la cola queda vacía
+
+def benchmark(jobs: int, processes: int, work_ms: float, crash_rate: float = 0.0, lease_seconds: float = 2.0) -> Dict:
+    """Encola ``jobs`` trabajos simulados y los procesa con ``processes`` procesos; reclama los de procesos caídos."""
+    workdir = Path(tempfile.mkdtemp(prefix="sat_queue_bench_"))
+    db_path = workdir / "cola.sqlite3"
+    # Las contraseñas se cifran como en producción; sin SAT_SESSION_KEY se usa una clave desechable
+    key = os.environ.get(SESSION_KEY_ENV) or generate_session_key()
+    queue = JobQueue(db_path, lease_seconds, key)
+    queue.enqueue_many((f"{i}.cer", f"{i}.key", "", workdir / str(i)) for i in range(jobs))
+    # Con caídas simuladas, un trabajo puede necesitar varios intentos
+    if crash_rate:
+        with queue._transaction() as conn:
+            conn.execute("UPDATE jobs SET max_attempts = 10")
+
+    start = time.perf_counter()
+    seed = 0
+    running = []
+    while True:
+        running = [p for p in running if p.is_alive()]
+        counts = queue.counts()
+        if not counts.get(QUEUED) and not counts.get(LEASED):
+            break
+        # Reponer procesos caídos mientras quede trabajo
+        while len(running) < processes:
+            seed += 1
+            proc = multiprocessing.Process(target=_bench_worker,
+                                           args=(str(db_path), lease_seconds, work_ms, crash_rate, seed, key))
+            proc.start()
+            running.append(proc)
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    for proc in running:
+        proc.terminate()
+        proc.join()
+
+    counts = queue.counts()
+    attempts = queue._conn().execute("SELECT SUM(attempts) FROM jobs").fetchone()[0]
+    queue.close()
+    return {
+        "jobs": jobs, "processes": processes, "seconds": elapsed, "jobs_per_second": jobs / elapsed,
+        "succeeded": counts.get(SUCCEEDED, 0), "failed": counts.get(FAILED, 0),
+        "reclaimed": attempts - jobs, "workers_started": seed,
+    }
+
+
+# =======================================================
+# 5. LÍNEA DE COMANDOS
+# =======================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Cola de constancias compartida entre máquinas (SQLite).")
+    parser.add_argument("--db", type=Path, default=QUEUE_DB_PATH)
+    parser.add_argument("--lease", type=float, default=LEASE_SECONDS, help="Segundos de arrendamiento")
+    sub = parser.add_subparsers(dest="command", required=True)
+    enqueue = sub.add_parser("enqueue", help="Encola trabajos desde un CSV: cer_path,key_path,key_pass,download_dir")
+    enqueue.add_argument("csv", type=Path)
+    enqueue.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+    work = sub.add_parser("work", help="Procesa trabajos de la cola")
+    work.add_argument("--processes", type=int, default=1)
+    work.add_argument("--engine", choices=ENGINES, default="pool")
+    work.add_argument("--exit-when-idle", action="store_true")
+    sub.add_parser("status", help="Trabajos por estado")
+    sub.add_parser("requeue-failed", help="Reencola los trabajos fallidos")
+    bench = sub.add_parser("bench", help="Rendimiento con varios procesos y trabajos simulados")
+    bench.add_argument("--jobs", type=int, default=500)
+    bench.add_argument("--processes", default="1,2,4,8")
+    bench.add_argument("--work-ms", type=float, default=20.0, help="Duración simulada de cada trabajo")
+    bench.add_argument("--crash-rate", type=float, default=0.0, help="Probabilidad de que un proceso muera a mitad de un trabajo")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        for processes in [int(p) for p in args.processes.split(",") if p.strip()]:
+            r = benchmark(args.jobs, processes, args.work_ms, args.crash_rate)
+            print(f"{r['processes']:>3} procesos: {r['jobs_per_second']:8.1f} trabajos/s  "
+                  f"({r['succeeded']} ok, {r['failed']} fallidos, {r['reclaimed']} reclamados, "
+                  f"{r['workers_started']} procesos lanzados, {r['seconds']:.2f} s)")
+        return
+
+    queue = JobQueue(args.db, args.lease)
+    if args.command == "enqueue":
+        with args.csv.open(newline="", encoding="utf-8") as fh:
+            rows = [row[:4] for row in csv.reader(fh) if row and not row[0].startswith("#")]
+        try:
+            ids = queue.enqueue_many(rows, args.max_attempts)
+        except (RuntimeError, ValueError) as e:  # Sin cryptography o sin una clave válida en SAT_SESSION_KEY
+            parser.error(str(e))
+        print(f"{len(ids)} trabajos encolados en {args.db}")
+    elif args.command == "status":
+        print(queue.counts())
+    elif args.command == "requeue-failed":
+        print(f"{queue.requeue_failed()} trabajos reencolados")
+    elif args.command == "work":
+        procs = [multiprocessing.Process(target=_worker_process, args=(str(args.db), args.engine, args.lease, args.exit_when_idle))
+                 for _ in range(args.processes)]
+        for proc in procs:
+            proc.start()
+        try:
+            for proc in procs:
+                proc.join()
+        except KeyboardInterrupt:
+            for proc in procs:
+                proc.join()
+        print(queue.counts())
+
+
+if __name__ == "__main__":
+    main()
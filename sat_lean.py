@@ -0,0 +1,122 @@
+"""Perfil ligero de Chrome: bloqueo de imágenes, fuentes y trackers por CDP y funciones de fondo desactivadas."""
+from typing import Dict, Iterable, List
+
+from selenium.common.exceptions import WebDriverException
+
+from sat_browser import BrowserDriver
+
+
+# =======================================================
+# 1. CONFIGURACIÓN
+# =======================================================
+
+# Patrones (comodines de Network.setBlockedURLs) por tipo de recurso
+RESOURCE_TYPE_PATTERNS = {
+    "image": ["*.png", "*.png?*", "*.jpg", "*.jpg?*", "*.jpeg", "*.gif", "*.gif?*", "*.svg", "*.ico", "*.webp"],
+    "font": ["*.woff", "*.woff?*", "*.woff2", "*.woff2?*", "*.ttf", "*.otf", "*.eot"],
+    "media": ["*.mp4", "*.webm", "*.mp3"],
+    "stylesheet": ["*.css", "*.css?*"],
+}
+# Tipos bloqueados en modo ligero. Las hojas de estilo no se bloquean por defecto: el portal
+# oculta el formulario de contraseña (CIEC) con CSS y sin él los localizadores pueden elegir
+# el campo equivocado; agréguelas solo tras confirmar que el login sigue funcionando.
+LEAN_RESOURCE_TYPES = ("image", "font", "media")
+# Analítica y terceros que el flujo nunca necesita
+TRACKER_PATTERNS = [
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*doubleclick.net*",
+    "*facebook.net*",
+    "*hotjar.com*",
+    "*clarity.ms*",
+    "*nr-data.net*",
+    "*newrelic.com*",
+    "*/analytics.js*",
+]
+# Funciones de Chrome en segundo plano que solo consumen CPU, red y memoria
+LEAN_CHROME_ARGS = [
+    "--disable-extensions",
+    "--disable-sync",
+    "--disable-component-update",
+    "--disable-background-networking",
+    "--disable-default-apps",
+    "--disable-gpu",
+    "--disable-features=Translate,OptimizationHints,MediaRouter,AutofillServerCommunication",
+    "--no-first-run",
+    "--mute-audio",
+    "--blink-settings=imagesEnabled=false",
+]
+LEAN_PREFS = {
+    "profile.managed_default_content_settings.images": 2,
+    "profile.default_content_setting_values.notifications": 2,
+}
+
+
+# =======================================================
+# 2. BLOQUEO
+# =======================================================
+
+def blocked_url_patterns(resource_types: Iterable[str] = LEAN_RESOURCE_TYPES,
+                         trackers: Iterable[str] = TRACKER_PATTERNS) -> List[str]:
+    """Patrones a bloquear para los tipos de recurso y trackers indicados."""
+    patterns = []
+    for kind in resource_types:
+        patterns.extend(RESOURCE_TYPE_PATTERNS[kind])
+    patterns.extend(trackers)
+    return patterns
+
+def enable_url_blocking(driver: BrowserDriver, patterns: List[str]) -> bool:
+    """Bloquea las URLs indicadas en la pestaña del driver (CDP); devuelve False si CDP no está disponible."""
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+        return True
+    except WebDriverException as e:
+        print(f"[LIGERO] No se pudo activar el bloqueo de URLs: {e}")
+        return False
+
+
+# =======================================================
+# 3. MEDICIÓN DE CARGA
+# =======================================================
+
+# Suma la Resource Timing del documento principal y de sus frames del mismo origen
+_PAGE_STATS_JS = r"""
+function stats(win) {
+    const out = {bytes: 0, requests: 0, load_ms: 0};
+    let perf;
+    try { perf = win.performance; } catch (e) { return out; }
+    const nav = perf.getEntriesByType('navigation')[0];
+    if (nav) {
+        out.bytes += nav.transferSize || 0;
+        out.requests += 1;
+        out.load_ms = Math.max(0, (nav.loadEventEnd || nav.domContentLoadedEventEnd) - nav.startTime);
+    }
+    for (const r of perf.getEntriesByType('resource')) {
+        out.bytes += r.transferSize || 0;
+        out.requests += 1;
+    }
+    for (let i = 0; i < win.frames.length; i++) {
+        const child = stats(win.frames[i]);
+        out.bytes += child.bytes;
+        out.requests += child.requests;
+    }
+    return out;
+}
+return stats(window.top);
+"""
+
+
+def page_load_stats(driver: BrowserDriver) -> Dict[str, float]:
+    """Bytes transferidos, peticiones y tiempo de carga de la página actual (vacío si no se pueden leer)."""
+    try:
+        result = driver.execute_script(_PAGE_STATS_JS)
+    except WebDriverException:
+        return {}
+    if not result:
+        return {}
+    return {
+        "page_bytes": int(result.get("bytes", 0)),
+        "page_requests": int(result.get("requests", 0)),
+        "page_load_ms": round(float(result.get("load_ms", 0)), 1),
+    }
@@ -0,0 +1,113 @@
+"""Motor de localizadores: evalúa todos los candidatos (y la acción del paso) en una sola llamada por sondeo."""
+import time
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import JavascriptException, StaleElementReferenceException
+
+from sat_browser import BrowserDriver, BrowserElement
+from sat_page_runtime import page_call
+from sat_selector_cache import get_selector_cache
+from sat_telemetry import record_locator
+
+
+# =======================================================
+# 1. CONFIGURACIÓN
+# =======================================================
+
+RACE_POLL_SECONDS = 0.1
+
+# Estrategias de Selenium traducidas a la consulta equivalente en JS
+_JS_STRATEGIES = {
+    By.ID: "id",
+    By.NAME: "name",
+    By.CSS_SELECTOR: "css",
+    By.XPATH: "xpath",
+    By.TAG_NAME: "tag",
+    By.CLASS_NAME: "class",
+}
+
+
+class LocatorMatch(NamedTuple):
+    """Elemento encontrado y el localizador que ganó.
+
+    ``index`` es la posición en el orden evaluado, que con ``step`` es el de la caché
+    (el localizador aprendido va primero), no necesariamente el de la lista recibida.
+    """
+    element: BrowserElement
+    locator: Tuple[str, str]
+    index: int
+    # Con ``action``: pageState() del runtime justo antes de aplicarla (ver ensure_click_took_effect)
+    page_state: Optional[Tuple[str, int]] = None
+
+
+# =======================================================
+# 2. CARRERA DE LOCALIZADORES
+# =======================================================
+
+def _to_js_specs(locators: Sequence[Tuple[str, str]]) -> List[List[str]]:
+    specs = []
+    for by, value in locators:
+        kind = _JS_STRATEGIES.get(by)
+        if kind is None:
+            raise ValueError(f"Estrategia de localizador no soportada por el motor JS: {by}")
+        specs.append([kind, value])
+    return specs
+
+def race_locators(
+    driver: BrowserDriver,
+    locators: Sequence[Tuple[str, str]],
+    timeout_seconds: float,
+    clickable: bool = False,
+    step: Optional[str] = None,
+    action: Optional[str] = None,
+    never_prefer: Sequence[Tuple[str, str]] = (),
+) -> Optional[LocatorMatch]:
+    """Devuelve el primer localizador (en orden de prioridad) que coincide, bajo un solo plazo.
+
+    Cada sondeo evalúa todos los candidatos en una única llamada al runtime JS
+    (sat_page_runtime); con ``timeout_seconds=0`` se hace un solo sondeo. ``action``
+    ('click', 'scroll', 'clear' o 'prepare_file') se aplica al ganador en esa misma llamada. Si se indica ``step``, el
+    localizador aprendido para ese paso se prueba primero y los aciertos se registran
+    en la caché de localizadores. Una búsqueda sin resultado no se registra, porque el
+    paso puede resolverse en otro frame: para eso está ``record_step_failure``.
+    Los localizadores de ``never_prefer`` (comodines) se evalúan pero nunca se aprenden.
+    """
+    if not locators:
+        return None
+    if step is None:
+        return _race(driver, list(locators), timeout_seconds, clickable, action)
+
+    cache = get_selector_cache()
+    ordered = cache.order(step, locators, never_prefer)
+    match = _race(driver, ordered, timeout_seconds, clickable, action)
+    if match:
+        cache.record(step, ordered, match.locator, never_prefer)
+        record_locator(step, match.locator)
+    return match
+
+def record_step_failure(step: str, locators: Sequence[Tuple[str, str]],
+                        never_prefer: Sequence[Tuple[str, str]] = ()):
+    """Registra que ningún localizador resolvió el paso (en ningún contexto)."""
+    cache = get_selector_cache()
+    cache.record(step, cache.order(step, locators, never_prefer), None, never_prefer)
+
+def _race(driver: BrowserDriver, locators: List[Tuple[str, str]], timeout_seconds: float, clickable: bool,
+          action: Optional[str] = None) -> Optional[LocatorMatch]:
+    specs = _to_js_specs(locators)
+    deadline = time.monotonic() + timeout_seconds
+
+    while True:
+        try:
+            found = page_call(driver, "find", specs, clickable, action)
+        except (JavascriptException, StaleElementReferenceException):
+            found = None
+
+        if found:
+            index, element = found[0], found[1]
+            page_state = tuple(found[2]) if len(found) > 2 else None
+            return LocatorMatch(element, tuple(locators[index]), index, page_state)
+
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(RACE_POLL_SECONDS)
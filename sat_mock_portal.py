@@ -0,0 +1,609 @@
+"""Servidor local que imita el flujo del portal del SAT (login e.firma, módulo y PDF) para pruebas y benchmarks."""
+import argparse
+import base64
+import threading
+import time
+import uuid
+import zlib
+from datetime import date
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from sat_efirma import CertificateInfo, parse_certificate, verify
+
+
+# =======================================================
+# 1. CONFIGURACIÓN
+# =======================================================
+
+LOGIN_PATH = "/aplicacion/login/53027/genera-tu-constancia-de-situacion-fiscal"
+MODULE_PATH = "/aplicacion/53027/genera-tu-constancia-de-situacion-fiscal"
+NIDP_PATH = "/nidp/app/login"
+NIDP_FRAME_PATH = "/nidp/app/login/frame"
+NIDP_INNER_FRAME_PATH = "/nidp/app/login/frame/inner"
+MODULE_FRAME_PATH = "/aplicacion/53027/contenido"
+GENERAR_PATH = "/aplicacion/53027/generar-constancia"
+FIEL_QUERY = "id=SATx509Custom&sid=0&option=credential&sid=0"
+
+SESSION_COOKIE = "MOCKSESSION"
+
+# Variantes del DOM:
+#  - "default": ids como en el portal real, login en un iframe
+#  - "no_ids": sin ids en pestaña, inputs y botones (obliga a usar los locators de respaldo)
+#  - "nested_frame": el formulario de login vive en un iframe dentro de otro iframe
+#  - "module_frame": el botón "Generar Constancia" vive dentro de un iframe
+DOM_VARIANTS = ("default", "no_ids", "nested_frame", "module_frame")
+
+# Latencias por etapa (segundos). "tab_switch" se aplica en el navegador (JS) al elegir e.firma.
+DEFAULT_LATENCY = {
+    "login_page": 0.0,
+    "frame": 0.0,
+    "tab_switch": 0.0,
+    "sign": 0.0,
+    "module_page": 0.0,
+    "pdf": 0.0,
+}
+
+# Datos de la constancia simulada
+MOCK_TAXPAYER = {
+    "rfc": "XAXX010101000",
+    "curp": "XEXX010101HNEXXXA4",
+    "nombre": "CONTRIBUYENTE",
+    "primer_apellido": "DE",
+    "segundo_apellido": "PRUEBA",
+    "regimen": "Régimen de Sueldos y Salarios e Ingresos Asimilados a Salarios",
+    "codigo_postal": "06300",
+    "vialidad": "AVENIDA HIDALGO",
+    "numero_exterior": "77",
+    "colonia": "GUERRERO",
+    "municipio": "CUAUHTEMOC",
+    "entidad": "CIUDAD DE MEXICO",
+    "obligacion": "Declaración anual de ISR del ejercicio Personas físicas.",
+}
+MESES = ("ENERO", "FEBRERO", "MARZO", "ABRIL", "MAYO", "JUNIO", "JULIO",
+         "AGOSTO", "SEPTIEMBRE", "OCTUBRE", "NOVIEMBRE", "DICIEMBRE")
+
+
+# Recursos estáticos que incluye cada página cuando assets_kb > 0 (para medir el modo ligero)
+STATIC_PREFIX = "/static/"
+ASSET_HEAD = "<link rel='stylesheet' href='/static/portal.css'><script src='/static/analytics.js' async></script>"
+ASSET_BODY = "<img src='/static/logo.png' alt='SAT'>"
+ASSET_TYPES = {
+    "portal.css": "text/css",
+    "fuente.woff2": "font/woff2",
+    "logo.png": "image/png",
+    "analytics.js": "application/javascript",
+}
+
+
+class MockPortalConfig(NamedTuple):
+    latency: Dict[str, float] = DEFAULT_LATENCY
+    variant: str = "default"
+    # Tamaño (KiB) de cada recurso estático; 0 = páginas sin imágenes, fuentes, CSS ni analítica
+    assets_kb: int = 0
+    # DER del .cer de prueba: si se indica, el login exige un token firmado con su llave
+    # (sin él se acepta cualquier token no vacío para el guid emitido)
+    certificate: bytes = b""
+
+
+# =======================================================
+# 2. PDF Y RECURSOS SIMULADOS
+# =======================================================
+
+def render_pdf(lines: List[str], compress: bool = False) -> bytes:
+    """PDF mínimo válido (una página, Helvetica) con las líneas de texto dadas; ``compress`` usa FlateDecode."""
+    def escape(text: str) -> str:
+        return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    content = ["BT", "/F1 10 Tf", "50 780 Td", "14 TL"]
+    for line in lines:
+        content.append(f"({escape(line)}) Tj T*")
+    content.append("ET")
+    stream = "\n".join(content).encode("cp1252", errors="replace")
+    stream_dict = b"<< /Length " + str(len(stream)).encode() + b" >>"
+    if compress:
+        stream = zlib.compress(stream)
+        stream_dict = b"<< /Length " + str(len(stream)).encode() + b" /Filter /FlateDecode >>"
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        stream_dict + b"\nstream\n" + stream + b"\nendstream",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+def constancia_lines(taxpayer: Dict[str, str], issued: Optional[date] = None) -> List[str]:
+    """Texto de la constancia simulada, con las etiquetas y la disposición del documento real."""
+    issued = issued or date.today()
+    return [
+        "CÉDULA DE IDENTIFICACIÓN FISCAL",
+        f"Lugar y Fecha de Emisión {taxpayer['municipio']} , {taxpayer['entidad']} A "
+        f"{issued.day:02d} DE {MESES[issued.month - 1]} DE {issued.year}",
+        "CONSTANCIA DE SITUACIÓN FISCAL",
+        "Datos de Identificación del Contribuyente:",
+        f"RFC: {taxpayer['rfc']}",
+        f"CURP: {taxpayer['curp']}",
+        f"Nombre (s): {taxpayer['nombre']}",
+        f"Primer Apellido: {taxpayer['primer_apellido']}",
+        f"Segundo Apellido: {taxpayer['segundo_apellido']}",
+        "Fecha inicio de operaciones: 01 DE ENERO DE 2020",
+        "Estatus en el padrón: ACTIVO",
+        "Datos del domicilio registrado",
+        f"Código Postal:{taxpayer['codigo_postal']} Tipo de Vialidad: AVENIDA (AV.)",
+        f"Nombre de Vialidad: {taxpayer['vialidad']} Número Exterior: {taxpayer['numero_exterior']}",
+        f"Número Interior: Nombre de la Colonia: {taxpayer['colonia']}",
+        f"Nombre de la Localidad: {taxpayer['municipio']} Nombre del Municipio o Demarcación Territorial: {taxpayer['municipio']}",
+        f"Nombre de la Entidad Federativa: {taxpayer['entidad']} Entre Calle:",
+        "Actividades Económicas:",
+        "Orden Actividad Económica Porcentaje Fecha Inicio Fecha Fin",
+        "1 Asalariado 100 01/01/2020",
+        "Regímenes:",
+        "Régimen Fecha Inicio Fecha Fin",
+        f"{taxpayer['regimen']} 01/01/2020",
+        "Obligaciones:",
+        "Descripción de la Obligación Descripción Vencimiento Fecha Inicio Fecha Fin",
+        f"{taxpayer['obligacion']} A más tardar el 30 de abril del ejercicio siguiente. 01/01/2020",
+        "Sus datos personales son incorporados y protegidos en los sistemas del SAT.",
+    ]
+
+
+def render_asset(name: str, size_kb: int) -> bytes:
+    """Contenido de relleno del tamaño indicado para un recurso estático."""
+    size = size_kb * 1024
+    if name == "portal.css":
+        head = b"@font-face { font-family: 'SAT'; src: url('/static/fuente.woff2'); } body { font-family: 'SAT'; }\n"
+        return head + b"/*" + b" " * max(0, size - len(head) - 4) + b"*/"
+    if name == "logo.png":
+        return b"\x89PNG\r\n\x1a\n" + b"\0" * max(0, size - 8)
+    if name == "analytics.js":
+        return b"/*" + b" " * max(0, size - 4) + b"*/"
+    return b"\0" * size
+
+
+# =======================================================
+# 3. PÁGINAS
+# =======================================================
+
+def _page(title: str, body: str) -> str:
+    return f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{title}</title></head><body>{body}</body></html>"
+
+def _nidp_page(variant: str) -> str:
+    src = NIDP_FRAME_PATH if variant != "nested_frame" else NIDP_FRAME_PATH + "?outer=1"
+    return _page("Acceso SAT", f"<h1>SAT - Acceso</h1><iframe id='loginFrame' src='{src}' width='900' height='600'></iframe>")
+
+# Firma del reto en el navegador como la hace el JavaScript del portal: lee el .cer y el .key
+# elegidos, descifra el PKCS#8 (PBES2 con AES-CBC) con WebCrypto y firma guid|RFC|serie con SHA-1
+FIEL_SIGN_JS = """
+function derNodo(b, pos) {
+    let len = b[pos + 1], p = pos + 2;
+    if (len & 0x80) {
+        const n = len & 0x7f;
+        len = 0;
+        for (let i = 0; i < n; i++) len = len * 256 + b[p++];
+    }
+    return {tag: b[pos], start: p, end: p + len};
+}
+function derHijos(b, nodo) {
+    const hijos = [];
+    for (let p = nodo.start; p < nodo.end; ) { const h = derNodo(b, p); hijos.push(h); p = h.end; }
+    return hijos;
+}
+function derBytes(b, nodo) { return b.subarray(nodo.start, nodo.end); }
+function hex(bytes) { return Array.from(bytes, x => x.toString(16).padStart(2, '0')).join(''); }
+function b64(bytes) { let s = ''; bytes.forEach(x => s += String.fromCharCode(x)); return btoa(s); }
+
+// RFC (x500UniqueIdentifier) y número de serie del SAT, como sat_efirma.parse_certificate
+function datosCertificado(cer) {
+    const tbs = derHijos(cer, derHijos(cer, derNodo(cer, 0))[0]);
+    const i = tbs[0].tag === 0xa0 ? 1 : 0;
+    let serie = derBytes(cer, tbs[i]);
+    while (serie.length > 1 && serie[0] === 0) serie = serie.subarray(1);
+    const texto = String.fromCharCode(...serie);
+    let rfc = '';
+    for (const rdn of derHijos(cer, tbs[i + 4])) {
+        for (const attr of derHijos(cer, rdn)) {
+            const [oid, valor] = derHijos(cer, attr);
+            if (hex(derBytes(cer, oid)) === '55042d') {
+                rfc = new TextDecoder().decode(derBytes(cer, valor)).split('/')[0].trim().toUpperCase();
+            }
+        }
+    }
+    return {rfc, serie: /^[0-9]+$/.test(texto) ? texto : (hex(serie).replace(/^0+/, '') || '0')};
+}
+
+const PRF_HASH = {'2a864886f70d0207': 'SHA-1', '2a864886f70d0209': 'SHA-256'};
+const AES_BITS = {'608648016503040102': 128, '60864801650304012a': 256};
+async function llavePrivada(key, pwd) {
+    const [alg, cifrado] = derHijos(key, derNodo(key, 0));
+    const [kdf, cipher] = derHijos(key, derHijos(key, alg)[1]);
+    const kdfParams = derHijos(key, derHijos(key, kdf)[1]);
+    const prf = kdfParams.find(n => n.tag === 0x30);
+    const hash = prf ? PRF_HASH[hex(derBytes(key, derHijos(key, prf)[0]))] : 'SHA-1';
+    const [cipherOid, iv] = derHijos(key, cipher);
+    const params = {
+        name: 'PBKDF2', hash,
+        salt: derBytes(key, kdfParams[0]),
+        iterations: derBytes(key, kdfParams[1]).reduce((n, x) => n * 256 + x, 0),
+    };
+    const base = await crypto.subtle.importKey('raw', new TextEncoder().encode(pwd), 'PBKDF2', false, ['deriveKey']);
+    const aes = await crypto.subtle.deriveKey(params, base, {name: 'AES-CBC', length: AES_BITS[hex(derBytes(key, cipherOid))]},
+                                              false, ['decrypt']);
+    const pkcs8 = await crypto.subtle.decrypt({name: 'AES-CBC', iv: derBytes(key, iv)}, aes, derBytes(key, cifrado));
+    return crypto.subtle.importKey('pkcs8', pkcs8, {name: 'RSASSA-PKCS1-v1_5', hash: 'SHA-1'}, false, ['sign']);
+}
+
+async function tokenFiel(cer, key, pwd, guid) {
+    const {rfc, serie} = datosCertificado(cer);
+    const cadena = new TextEncoder().encode(`${guid}|${rfc}|${serie}`);
+    const firma = new Uint8Array(await crypto.subtle.sign('RSASSA-PKCS1-v1_5', await llavePrivada(key, pwd), cadena));
+    return btoa(b64(cadena) + '#' + b64(firma));
+}
+"""
+
+def _login_form_page(variant: str, tab_delay_ms: int, guid: str, error: str = "") -> str:
+    ids = variant != "no_ids"
+    fiel_id = "id='buttonFiel'" if ids else ""
+    cer_attrs = "id='fileCer' name='fileCer'" if ids else ""
+    key_attrs = "id='fileKey' name='fileKey'" if ids else ""
+    pwd_attrs = "id='contrasena' name='contrasena'" if ids else "name='pwd'"
+    btn_attrs = "id='btnFirma' name='btnFirma'" if ids else ""
+    fiel_form = (
+        f"<form id='certform' method='post' action='{NIDP_PATH}?{FIEL_QUERY}' target='_top'>"
+        f"<input type='hidden' name='guid' value='{guid}'/>"
+        "<input type='hidden' name='token' value=''/>"
+        "<input type='hidden' name='credentialsRequired' value='CERT'/>"
+        f"<label>Certificado (.cer)</label><input type='file' accept='.cer' {cer_attrs}/>"
+        f"<label>Clave privada (.key)</label><input type='file' accept='.key' {key_attrs}/>"
+        f"<label>Contraseña de clave privada</label><input type='password' {pwd_attrs}/>"
+        f"<button type='button' {btn_attrs} onclick='firmar()'>Enviar</button>"
+        "</form>"
+    )
+    # El formulario va en un <template>: el navegador no lo muestra hasta elegir la pestaña,
+    # pero el motor sin navegador lo encuentra en el HTML como en el portal real.
+    script = f"""
+        <template id='fielTemplate'>{fiel_form}</template>
+        <script>
+        function mostrarFiel() {{
+            setTimeout(function () {{
+                document.getElementById('contenido').innerHTML = document.getElementById('fielTemplate').innerHTML;
+            }}, {tab_delay_ms});
+        }}
+        {FIEL_SIGN_JS}
+        function leerArchivo(input) {{
+            const archivo = input && input.files[0];
+            return archivo ? archivo.arrayBuffer().then(b => new Uint8Array(b)) : Promise.resolve(new Uint8Array());
+        }}
+        async function firmar() {{
+            const form = document.getElementById('certform');
+            const guid = form.querySelector("input[name='guid']").value;
+            let token;
+            try {{
+                const cer = await leerArchivo(form.querySelector("input[accept='.cer']"));
+                const key = await leerArchivo(form.querySelector("input[accept='.key']"));
+                token = await tokenFiel(cer, key, form.querySelector("input[type='password']").value, guid);
+            }} catch (e) {{
+                // Archivos vacíos o llave ilegible: solo se acepta si el portal no tiene certificado configurado
+                token = 'sin-firma-' + Date.now();
+            }}
+            form.querySelector("input[name='token']").value = token;
+            form.submit();
+        }}
+        </script>
+    """
+    body = (
+        f"<p style='color:red'>{error}</p>"
+        "<nav><a class='nav-link' href='#'>Contraseña</a> "
+        f"<a class='nav-link' href='#' {fiel_id} onclick='mostrarFiel(); return false;'>e.firma</a></nav>"
+        "<div id='contenido'><form id='ciecform'><label>RFC</label><input type='text' name='rfc'/>"
+        "<label>Contraseña</label><input type='password' name='ciec'/></form></div>"
+        + script
+    )
+    return _page("Login", body)
+
+def _module_form(view_state: str, variant: str) -> str:
+    ids = variant != "no_ids"
+    btn_attrs = "id='formReimpAcuse:j_idt50' name='formReimpAcuse:j_idt50'" if ids else "name='generar'"
+    return (
+        f"<form id='formReimpAcuse' method='post' action='{GENERAR_PATH}' target='_blank'>"
+        f"<input type='hidden' name='javax.faces.ViewState' value='{view_state}'/>"
+        "<div style='width:2400px'><span>Constancia de Situación Fiscal</span>"
+        f"<button type='submit' {btn_attrs} style='margin-left:1800px'><span>Generar Constancia</span></button></div>"
+        "</form>"
+    )
+
+
+# =======================================================
+# 4. SERVIDOR
+# =======================================================
+
+class _Session:
+    def __init__(self):
+        self.authenticated = False
+        self.view_state = uuid.uuid4().hex
+        self.fiel_guids: Set[str] = set()
+        self.events: List[Tuple[str, float]] = []
+
+    def issue_guid(self) -> str:
+        """Reto del formulario de e.firma; cada uno se acepta una sola vez."""
+        guid = uuid.uuid4().hex
+        self.fiel_guids.add(guid)
+        return guid
+
+
+def verify_fiel_token(token: str, guid: str, cert: CertificateInfo) -> bool:
+    """Comprueba el token de e.firma: ``base64(base64(guid|RFC|serie) + "#" + base64(firma SHA-1))``."""
+    try:
+        source_b64, _, signature_b64 = base64.b64decode(token, validate=True).decode("ascii").partition("#")
+        source = base64.b64decode(source_b64, validate=True)
+        signature = base64.b64decode(signature_b64, validate=True)
+    except ValueError:
+        return False
+    if source != f"{guid}|{cert.rfc}|{cert.serial}".encode("utf-8"):
+        return False
+    return verify(cert, source, signature, "sha1")
+
+
+class MockSatPortal:
+    """Portal simulado en un hilo de fondo; registra la hora de cada etapa por sesión."""
+
+    def __init__(self, config: MockPortalConfig = MockPortalConfig(), host: str = "127.0.0.1", port: int = 0):
+        if config.variant not in DOM_VARIANTS:
+            raise ValueError(f"Variante de DOM desconocida: {config.variant} (use una de {DOM_VARIANTS})")
+        self.config = config
+        self.latency = dict(DEFAULT_LATENCY, **config.latency)
+        self.certificate = parse_certificate(config.certificate) if config.certificate else None
+        self.sessions: Dict[str, _Session] = {}
+        self.asset_requests = 0
+        self.asset_bytes = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def login_url(self) -> str:
+        return self.base_url + LOGIN_PATH
+
+    @property
+    def fiel_login_url(self) -> str:
+        return f"{self.base_url}{NIDP_FRAME_PATH}?{FIEL_QUERY}"
+
+    def start(self) -> "MockSatPortal":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-sat", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockSatPortal":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _session(self, sid: str) -> _Session:
+        with self._lock:
+            return self.sessions.setdefault(sid, _Session())
+
+    def accepts_fiel(self, session: _Session, form: Dict[str, str]) -> bool:
+        """El guid lo emitió esta sesión y el token está firmado con el certificado de prueba (si hay)."""
+        guid, token = form.get("guid", ""), form.get("token", "")
+        with self._lock:
+            if not token or guid not in session.fiel_guids:
+                return False
+            session.fiel_guids.discard(guid)
+        return self.certificate is None or verify_fiel_token(token, guid, self.certificate)
+
+    def stage_durations(self) -> List[Dict[str, float]]:
+        """Duración de cada etapa por sesión, medida entre peticiones consecutivas al servidor."""
+        stages = []
+        with self._lock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            marks = {}
+            for name, ts in session.events:
+                marks.setdefault(name, ts)
+            durations = {}
+            for start, end, label in (
+                ("login_redirect", "login_page", "navegar_login"),
+                ("login_page", "fiel_submit", "efirma_y_firma"),
+                ("fiel_submit", "module_page", "redireccion_modulo"),
+                ("module_page", "pdf", "generar_y_descargar"),
+            ):
+                if start in marks and end in marks:
+                    durations[label] = marks[end] - marks[start]
+            if durations:
+                stages.append(durations)
+        return stages
+
+    def _handler_class(self):
+        portal = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, fmt, *args):
+                pass
+
+            # --- utilidades ---
+            def _cookies(self) -> Dict[str, str]:
+                jar = SimpleCookie(self.headers.get("Cookie", ""))
+                return {k: m.value for k, m in jar.items()}
+
+            def _session(self) -> Tuple[str, _Session, bool]:
+                sid = self._cookies().get(SESSION_COOKIE)
+                is_new = sid is None
+                sid = sid or uuid.uuid4().hex
+                return sid, portal._session(sid), is_new
+
+            def _mark(self, session: _Session, stage: str):
+                session.events.append((stage, time.monotonic()))
+
+            def _delay(self, stage: str):
+                seconds = portal.latency.get(stage, 0)
+                if seconds:
+                    time.sleep(seconds)
+
+            def _send(self, status: int, body: bytes = b"", content_type: str = "text/html; charset=utf-8",
+                      headers: Optional[Dict[str, str]] = None, sid: Optional[str] = None):
+                if portal.config.assets_kb and status == 200 and content_type.startswith("text/html"):
+                    body = body.replace(b"</head>", ASSET_HEAD.encode() + b"</head>", 1)
+                    body = body.replace(b"<body>", b"<body>" + ASSET_BODY.encode(), 1)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                if sid:
+                    self.send_header("Set-Cookie", f"{SESSION_COOKIE}={sid}; Path=/")
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def _redirect(self, location: str, sid: Optional[str] = None):
+                self._send(302, headers={"Location": location}, sid=sid)
+
+            def _form(self) -> Dict[str, str]:
+                length = int(self.headers.get("Content-Length", 0) or 0)
+                raw = self.rfile.read(length).decode("utf-8", errors="replace")
+                return {k: v[0] for k, v in parse_qs(raw, keep_blank_values=True).items()}
+
+            # --- rutas ---
+            def do_GET(self):
+                path = urlsplit(self.path).path
+                sid, session, is_new = self._session()
+                new_sid = sid if is_new else None
+                variant = portal.config.variant
+
+                if path == LOGIN_PATH:
+                    if session.authenticated:
+                        self._redirect(MODULE_PATH, new_sid)
+                    else:
+                        self._mark(session, "login_redirect")
+                        self._redirect(f"{NIDP_PATH}?{FIEL_QUERY}", new_sid)
+                elif path == NIDP_PATH:
+                    self._delay("login_page")
+                    self._mark(session, "login_page")
+                    self._send(200, _nidp_page(variant).encode(), sid=new_sid)
+                elif path == NIDP_FRAME_PATH:
+                    self._delay("frame")
+                    if variant == "nested_frame" and "outer=1" in self.path:
+                        body = _page("Marco", f"<iframe id='innerFrame' src='{NIDP_INNER_FRAME_PATH}' width='880' height='560'></iframe>")
+                    else:
+                        body = _login_form_page(variant, int(portal.latency["tab_switch"] * 1000), session.issue_guid())
+                    self._send(200, body.encode(), sid=new_sid)
+                elif path == NIDP_INNER_FRAME_PATH:
+                    self._delay("frame")
+                    body = _login_form_page(variant, int(portal.latency["tab_switch"] * 1000), session.issue_guid())
+                    self._send(200, body.encode(), sid=new_sid)
+                elif path == MODULE_PATH:
+                    if not session.authenticated:
+                        body = _page("Genera tu constancia", f"<a href='{LOGIN_PATH}'>Ejecutar en línea</a>")
+                        self._send(200, body.encode(), sid=new_sid)
+                        return
+                    self._delay("module_page")
+                    self._mark(session, "module_page")
+                    if variant == "module_frame":
+                        body = _page("Constancia", f"<iframe id='contenido' src='{MODULE_FRAME_PATH}' width='1300' height='400'></iframe>")
+                    else:
+                        body = _page("Constancia", _module_form(session.view_state, variant))
+                    self._send(200, body.encode(), sid=new_sid)
+                elif path == MODULE_FRAME_PATH and session.authenticated:
+                    self._send(200, _page("Contenido", _module_form(session.view_state, variant)).encode(), sid=new_sid)
+                elif path.startswith(STATIC_PREFIX) and path[len(STATIC_PREFIX):] in ASSET_TYPES:
+                    name = path[len(STATIC_PREFIX):]
+                    asset = render_asset(name, portal.config.assets_kb)
+                    with portal._lock:
+                        portal.asset_requests += 1
+                        portal.asset_bytes += len(asset)
+                    self._send(200, asset, ASSET_TYPES[name])
+                else:
+                    self._send(404, b"No encontrado", "text/plain")
+
+            do_HEAD = do_GET
+
+            def do_POST(self):
+                path = urlsplit(self.path).path
+                sid, session, is_new = self._session()
+                new_sid = sid if is_new else None
+                form = self._form()
+
+                if path == NIDP_PATH:
+                    self._delay("sign")
+                    if portal.accepts_fiel(session, form):
+                        session.authenticated = True
+                        self._mark(session, "fiel_submit")
+                        self._redirect(LOGIN_PATH, new_sid)
+                    else:
+                        body = _login_form_page(portal.config.variant, 0, session.issue_guid(), "Firma inválida")
+                        self._send(200, body.encode(), sid=new_sid)
+                elif path == GENERAR_PATH:
+                    if not session.authenticated or form.get("javax.faces.ViewState") != session.view_state:
+                        self._send(403, b"Sesion invalida", "text/plain", sid=new_sid)
+                        return
+                    self._delay("pdf")
+                    pdf = render_pdf(constancia_lines(MOCK_TAXPAYER))
+                    self._mark(session, "pdf")
+                    self._send(200, pdf, "application/pdf",
+                               headers={"Content-Disposition": "inline; filename=\"constancia.pdf\""}, sid=new_sid)
+                else:
+                    self._send(404, b"No encontrado", "text/plain")
+
+        return Handler
+
+
+def parse_latency(spec: str) -> Dict[str, float]:
+    """Convierte 'sign=0.5,pdf=1' en un diccionario de latencias."""
+    latency = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        stage, _, seconds = part.partition("=")
+        if stage not in DEFAULT_LATENCY:
+            raise ValueError(f"Etapa de latencia desconocida: {stage} (use una de {sorted(DEFAULT_LATENCY)})")
+        latency[stage] = float(seconds)
+    return latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Portal SAT simulado para pruebas locales.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--variant", choices=DOM_VARIANTS, default="default")
+    parser.add_argument("--latency", default="", help="Latencias por etapa, e.g. 'sign=0.5,pdf=1'")
+    parser.add_argument("--assets-kb", type=int, default=0, help="Tamaño de CSS/fuente/imagen/analítica por página")
+    parser.add_argument("--cer", help="Certificado (.cer) con el que deben firmarse los logins")
+    args = parser.parse_args()
+
+    certificate = Path(args.cer).read_bytes() if args.cer else b""
+    config = MockPortalConfig(parse_latency(args.latency), args.variant, args.assets_kb, certificate)
+    portal = MockSatPortal(config, port=args.port).start()
+    print(f"Portal simulado en {portal.login_url} (Ctrl+C para salir)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        portal.stop()
+
+
+if __name__ == "__main__":
+    main()
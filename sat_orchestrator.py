@@ -0,0 +1,270 @@
+"""Orquestador asyncio de trabajos de constancias: límite de tasa, cupo por host, reintentos y contrapresión."""
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import AsyncIterable, Callable, Dict, Iterable, List, NamedTuple, Optional, Union
+from urllib.parse import urlsplit
+
+from selenium.common.exceptions import (
+    InvalidSessionIdException,
+    NoSuchElementException,
+    SessionNotCreatedException,
+    TimeoutException,
+    WebDriverException,
+)
+
+import sat_selenium_fiel
+from sat_driver_pool import ConstanciaJob, DriverPool
+from sat_selenium_fiel import run_sat_automation_core
+
+
+# =======================================================
+# 1. CONFIGURACIÓN
+# =======================================================
+
+DEFAULT_MAX_WORKERS = 4
+# Trabajos iniciados por segundo (global) y ráfaga permitida
+DEFAULT_RATE_PER_SECOND = 0.5
+DEFAULT_RATE_BURST = 2
+# Sesiones simultáneas contra un mismo host del portal
+DEFAULT_PER_HOST_LIMIT = 2
+DEFAULT_MAX_ATTEMPTS = 3
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 60.0
+# Trabajos en cola antes de que ``submit`` bloquee al productor
+DEFAULT_QUEUE_SIZE = 100
+REPORT_INTERVAL_SECONDS = 30.0
+
+Runner = Callable[[str, str, str, Path], Path]
+
+
+class OrchestratorResult(NamedTuple):
+    """Resultado final de un trabajo tras sus reintentos."""
+    job: ConstanciaJob
+    pdf_path: Optional[Path]
+    error: Optional[BaseException]
+    attempts: int
+    elapsed_seconds: float
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Solo se reintentan timeouts y caídas de Chrome/WebDriver, no errores de DOM ni de archivos."""
+    if isinstance(error, (NoSuchElementException, FileNotFoundError)):
+        return False
+    if isinstance(error, (TimeoutException, InvalidSessionIdException, SessionNotCreatedException)):
+        return True
+    if type(error) is WebDriverException:
+        # e.g., "chrome not reachable", "disconnected: not connected to DevTools"
+        return True
+    # Fallo al lanzar Chrome (ver create_chrome_driver)
+    return isinstance(error, RuntimeError) and "WebDriver" in str(error)
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE_SECONDS, cap: float = BACKOFF_MAX_SECONDS) -> float:
+    """Retardo exponencial con jitter completo para el reintento número ``attempt`` (desde 1)."""
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+
+def portal_host(job: ConstanciaJob) -> str:
+    """Host del portal al que se dirige un trabajo (todas las constancias van al mismo)."""
+    return urlsplit(sat_selenium_fiel.SAT_LOGIN_URL).hostname or ""
+
+def pooled_runner(pool: DriverPool) -> Runner:
+    """Adapta un DriverPool a la firma de runner, relanzando el error del trabajo."""
+    def run(cer_path: str, key_path: str, key_pass: str, download_dir: Path) -> Path:
+        result = pool.run_job(ConstanciaJob(cer_path, key_path, key_pass, download_dir))
+        if result.error is not None:
+            raise result.error
+        return result.pdf_path
+    return run
+
+
+# =======================================================
+# 2. LÍMITES
+# =======================================================
+
+class TokenBucket:
+    """Limitador de tasa asíncrono (cubeta de fichas)."""
+
+    def __init__(self, rate_per_second: float, burst: int):
+        self.rate = rate_per_second
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class OrchestratorStats:
+    """Métricas en vivo del orquestador."""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retries = 0
+        self.in_flight = 0
+        self.queue_depth = 0
+
+    def snapshot(self) -> Dict[str, float]:
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        completed = self.succeeded + self.failed
+        return {
+            "submitted": self.submitted,
+            "completed": completed,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retries": self.retries,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "jobs_per_minute": completed * 60 / elapsed,
+            "success_rate": self.succeeded / completed if completed else 0.0,
+        }
+
+    def format(self) -> str:
+        s = self.snapshot()
+        return (f"[ORQ] cola={s['queue_depth']} en_curso={s['in_flight']} "
+                f"completados={s['completed']}/{s['submitted']} éxito={s['success_rate']:.0%} "
+                f"reintentos={s['retries']} {s['jobs_per_minute']:.1f} trabajos/min")
+
+
+# =======================================================
+# 3. ORQUESTADOR
+# =======================================================
+
+class Orchestrator:
+    """Ejecuta un flujo de trabajos sobre un executor acotado respetando tasa global y cupo por host."""
+
+    def __init__(
+        self,
+        runner: Runner = run_sat_automation_core,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        rate_per_second: float = DEFAULT_RATE_PER_SECOND,
+        rate_burst: int = DEFAULT_RATE_BURST,
+        per_host_limit: int = DEFAULT_PER_HOST_LIMIT,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        report_interval: Optional[float] = REPORT_INTERVAL_SECONDS,
+        on_result: Optional[Callable[[OrchestratorResult], None]] = None,
+    ):
+        self.runner = runner
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.max_attempts = max_attempts
+        self.queue_size = queue_size
+        self.report_interval = report_interval
+        self.on_result = on_result
+        self.rate_limiter = TokenBucket(rate_per_second, rate_burst)
+        self.stats = OrchestratorStats()
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._queue: Optional[asyncio.Queue] = None
+
+    def _host_slot(self, host: str) -> asyncio.Semaphore:
+        if host not in self._host_slots:
+            self._host_slots[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_slots[host]
+
+    async def _run_one(self, job: ConstanciaJob) -> OrchestratorResult:
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            await self.rate_limiter.acquire()
+            async with self._host_slot(portal_host(job)):
+                self.stats.in_flight += 1
+                try:
+                    pdf_path = await loop.run_in_executor(
+                        self._executor, self.runner, job.cer_path, job.key_path, job.key_pass, job.download_dir
+                    )
+                    return OrchestratorResult(job, pdf_path, None, attempt, time.monotonic() - start)
+                except Exception as e:
+                    error = e
+                finally:
+                    self.stats.in_flight -= 1
+
+            if attempt >= self.max_attempts or not is_retryable(error):
+                return OrchestratorResult(job, None, error, attempt, time.monotonic() - start)
+            delay = backoff_delay(attempt)
+            self.stats.retries += 1
+            print(f"[ORQ] Reintento {attempt}/{self.max_attempts - 1} en {delay:.1f} s "
+                  f"({type(error).__name__}) para {job.cer_path}")
+            await asyncio.sleep(delay)
+
+    async def _worker(self, results: List[OrchestratorResult]):
+        while True:
+            job = await self._queue.get()
+            self.stats.queue_depth = self._queue.qsize()
+            try:
+                if job is None:
+                    return
+                result = await self._run_one(job)
+                if result.ok:
+                    self.stats.succeeded += 1
+                else:
+                    self.stats.failed += 1
+                results.append(result)
+                if self.on_result:
+                    self.on_result(result)
+            finally:
+                self._queue.task_done()
+
+    async def _reporter(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            print(self.stats.format())
+
+    async def submit(self, job: ConstanciaJob):
+        """Encola un trabajo; espera (contrapresión) si la cola está llena."""
+        await self._queue.put(ConstanciaJob(*job))
+        self.stats.submitted += 1
+        self.stats.queue_depth = self._queue.qsize()
+
+    async def run(self, jobs: Union[Iterable[ConstanciaJob], AsyncIterable[ConstanciaJob]]) -> List[OrchestratorResult]:
+        """Consume el flujo de trabajos hasta agotarlo y devuelve los resultados."""
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="sat-job")
+        self.stats = OrchestratorStats()
+        results: List[OrchestratorResult] = []
+
+        workers = [asyncio.ensure_future(self._worker(results)) for _ in range(self.max_workers)]
+        reporter = asyncio.ensure_future(self._reporter()) if self.report_interval else None
+        try:
+            if hasattr(jobs, "__aiter__"):
+                async for job in jobs:
+                    await self.submit(job)
+            else:
+                for job in jobs:
+                    await self.submit(job)
+            for _ in workers:
+                await self._queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            if reporter:
+                reporter.cancel()
+            self._executor.shutdown(wait=True)
+        print(self.stats.format())
+        return results
+
+
+def run_orchestrated(jobs: Iterable[ConstanciaJob], **options) -> List[OrchestratorResult]:
+    """Entrada síncrona: ejecuta los trabajos con el orquestador y devuelve los resultados."""
+    return asyncio.run(Orchestrator(**options).run(jobs))
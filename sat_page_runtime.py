@@ -0,0 +1,211 @@
+"""Runtime JS inyectado en cada documento: búsquedas y acciones de un paso completo en una sola llamada a WebDriver."""
+import threading
+import weakref
+
+from selenium.common.exceptions import WebDriverException
+
+from sat_browser import BrowserDriver
+
+
+# =======================================================
+# 1. RUNTIME
+# =======================================================
+
+RUNTIME_VERSION = 2
+_MISSING = "__sat_rt_missing__"
+
+# Se instala una vez por documento (Page.addScriptToEvaluateOnNewDocument, también en iframes).
+# - find: evalúa todos los localizadores, filtra visibilidad en lote y ejecuta la acción del paso
+# - findByText / clickByText: índice de textos por documento (TreeWalker), invalidado por MutationObserver
+# - scrollHorizontal: recorre con TreeWalker y separa lecturas de escrituras de layout
+# - pageState: [id del documento, mutaciones del DOM] para saber si un clic por JS tuvo efecto
+RUNTIME_JS = r"""
+(function () {
+    if (window.__satRt && window.__satRt.version === %(version)d) return;
+    const CLICKABLE = new Set(['BUTTON', 'A', 'LABEL', 'SPAN', 'DIV', 'INPUT']);
+    const index = {dirty: true, entries: []};
+    const docId = Math.random().toString(36).slice(2);
+    let mutations = 0;
+    try {
+        new MutationObserver(function (records) {
+            mutations++;
+            if (records.some(function (r) { return r.type !== 'attributes'; })) index.dirty = true;
+        })
+            .observe(document, {subtree: true, childList: true, characterData: true, attributes: true});
+    } catch (e) {}
+    function pageState() { return [docId, mutations]; }
+
+    function visibleBatch(els) {
+        const rects = els.map(function (el) { return el.getBoundingClientRect(); });
+        return els.map(function (el, i) {
+            if (rects[i].width <= 0 || rects[i].height <= 0) return false;
+            const st = window.getComputedStyle(el);
+            return st.visibility !== 'hidden' && st.display !== 'none' && st.opacity !== '0';
+        });
+    }
+    function first(kind, value) {
+        switch (kind) {
+            case 'id': return document.getElementById(value);
+            case 'name': return document.getElementsByName(value)[0] || null;
+            case 'css': return document.querySelector(value);
+            case 'tag': return document.getElementsByTagName(value)[0] || null;
+            case 'class': return document.getElementsByClassName(value)[0] || null;
+            case 'xpath':
+                return document.evaluate(value, document, null,
+                    XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+        }
+        return null;
+    }
+    function act(el, action) {
+        switch (action) {
+            case 'click':
+                el.scrollIntoView({behavior: 'instant', block: 'center', inline: 'center'});
+                el.click();
+                break;
+            case 'scroll':
+                el.scrollIntoView({behavior: 'instant', block: 'center', inline: 'center'});
+                break;
+            case 'clear':
+                el.value = '';
+                break;
+            case 'prepare_file':
+                el.removeAttribute('disabled');
+                el.removeAttribute('readonly');
+                Object.assign(el.style, {display: 'block', visibility: 'visible', opacity: '1',
+                                         position: 'fixed', zIndex: '99999'});
+                break;
+        }
+    }
+    function find(specs, clickable, action) {
+        const hits = [];
+        for (let i = 0; i < specs.length; i++) {
+            let el = null;
+            try { el = first(specs[i][0], specs[i][1]); } catch (e) { continue; }
+            if (el && !(clickable && el.disabled)) hits.push([i, el]);
+            if (hits.length && !clickable) break;
+        }
+        if (!hits.length) return null;
+        let hit = hits[0];
+        if (clickable) {
+            const visible = visibleBatch(hits.map(function (h) { return h[1]; }));
+            hit = hits.find(function (h, i) { return visible[i]; });
+            if (!hit) return null;
+        }
+        if (!action) return hit;
+        const before = pageState();
+        act(hit[1], action);
+        return [hit[0], hit[1], before];
+    }
+    function buildIndex() {
+        const entries = [];
+        const root = document.body || document.documentElement;
+        if (root) {
+            const walker = document.createTreeWalker(root, NodeFilter.SHOW_ELEMENT, {
+                acceptNode: function (n) {
+                    return CLICKABLE.has(n.tagName) || n.getAttribute('role') === 'button'
+                        ? NodeFilter.FILTER_ACCEPT : NodeFilter.FILTER_SKIP;
+                }
+            });
+            for (let n = walker.nextNode(); n; n = walker.nextNode()) {
+                if (n.tagName === 'INPUT' && n.type !== 'button' && n.type !== 'submit') continue;
+                const text = (n.tagName === 'INPUT' ? n.value : n.textContent || '')
+                    .replace(/\s+/g, ' ').trim().toLowerCase();
+                if (text) entries.push([text, n]);
+            }
+        }
+        index.entries = entries;
+        index.dirty = false;
+    }
+    function findByText(needles) {
+        if (index.dirty) buildIndex();
+        const ns = needles.map(function (s) { return (s || '').trim().toLowerCase(); }).filter(Boolean);
+        const hits = index.entries
+            .filter(function (e) { return ns.some(function (n) { return e[0].indexOf(n) !== -1; }); })
+            .map(function (e) { return e[1]; });
+        const visible = visibleBatch(hits);
+        return hits.find(function (el, i) { return visible[i]; }) || null;
+    }
+    function clickByText(needles) {
+        const el = findByText(needles);
+        if (!el) return false;
+        try { act(el, 'click'); return true; } catch (e) { return false; }
+    }
+    function scrollHorizontal() {
+        const targets = [];
+        const root = document.scrollingElement || document.documentElement;
+        if (root && root.scrollWidth - root.clientWidth > 5) targets.push(root);
+        if (document.body) {
+            const walker = document.createTreeWalker(document.body, NodeFilter.SHOW_ELEMENT);
+            for (let n = walker.nextNode(); n; n = walker.nextNode()) {
+                if (n.scrollWidth - n.clientWidth > 5) targets.push(n);
+            }
+        }
+        targets.forEach(function (el) { el.scrollLeft = el.scrollWidth; });
+        return targets.length;
+    }
+    window.__satRt = {version: %(version)d, find: find, findByText: findByText, clickByText: clickByText,
+                      scrollHorizontal: scrollHorizontal, visibleBatch: visibleBatch, act: act,
+                      pageState: pageState};
+})();
+""" % {"version": RUNTIME_VERSION}
+
+_CALL_JS = (
+    "const rt = window.__satRt;"
+    f" if (!rt || rt.version !== {RUNTIME_VERSION}) return '{_MISSING}';"
+    " return rt[arguments[0]].apply(null, arguments[1]);"
+)
+_BOOT_AND_CALL_JS = RUNTIME_JS + "\nreturn window.__satRt[arguments[0]].apply(null, arguments[1]);"
+
+_installed: "weakref.WeakSet[BrowserDriver]" = weakref.WeakSet()
+_installed_lock = threading.Lock()
+
+
+def install_page_runtime(driver: BrowserDriver) -> bool:
+    """Registra el runtime para todos los documentos nuevos del driver (una vez por driver)."""
+    with _installed_lock:
+        if driver in _installed:
+            return True
+    try:
+        driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": RUNTIME_JS})
+    except WebDriverException as e:
+        print(f"[RUNTIME] No se pudo registrar el runtime JS (se inyectará bajo demanda): {e}")
+        return False
+    with _installed_lock:
+        _installed.add(driver)
+    return True
+
+def page_call(driver: BrowserDriver, name: str, *args):
+    """Llama una función del runtime en el contexto (frame) actual; lo inyecta si el documento no lo tiene."""
+    result = driver.execute_script(_CALL_JS, name, list(args))
+    if result == _MISSING:
+        # Documento cargado antes del registro (o sin CDP): inyectar y llamar en el mismo viaje
+        result = driver.execute_script(_BOOT_AND_CALL_JS, name, list(args))
+    return result
+
+
+# =======================================================
+# 2. CONTEO DE VIAJES A WEBDRIVER
+# =======================================================
+
+class RoundTripCounter:
+    """Comandos enviados por un driver (HTTP a chromedriver o mensajes CDP del backend directo)."""
+
+    def __init__(self):
+        self.count = 0
+
+
+def count_round_trips(driver: BrowserDriver) -> RoundTripCounter:
+    """Cuenta cada comando de WebDriver del driver (find, click, execute_script, CDP...); idempotente."""
+    counter = getattr(driver, "_sat_round_trips", None)
+    if counter is not None:
+        return counter
+    counter = RoundTripCounter()
+    execute = driver.execute
+
+    def counted_execute(driver_command, params=None, *args):
+        counter.count += 1
+        return execute(driver_command, params, *args)
+
+    driver.execute = counted_execute
+    driver._sat_round_trips = counter
+    return counter
@@ -0,0 +1,419 @@
+"""Gobernador de recursos de los navegadores: RSS/CPU por árbol de procesos, admisión por memoria y limpieza de huérfanos."""
+import os
+import signal
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set
+
+
+# =======================================================
+# 1. CONFIGURACIÓN
+# =======================================================
+
+# Un Chrome cuyo árbol de procesos supera esto se recicla al terminar su trabajo
+MAX_BROWSER_RSS_MB = 1536
+# Memoria estimada de un Chrome nuevo y margen libre que debe quedar en el equipo
+BROWSER_ESTIMATE_MB = 450
+MIN_FREE_MEMORY_MB = 768
+CAPACITY_POLL_SECONDS = 1.0
+# Muestreo periódico (métricas y huérfanos) de los pools de larga duración
+SAMPLE_INTERVAL_SECONDS = 15.0
+# Espera tras SIGTERM antes de SIGKILL al limpiar procesos
+KILL_GRACE_SECONDS = 3.0
+# Margen para que Chrome termine solo tras driver.quit() antes de considerarlo sobreviviente
+QUIT_SETTLE_SECONDS = 2.0
+# Procesos de automatización que pueden quedar huérfanos si driver.quit() falla
+ORPHAN_PROCESS_NAMES = ("chromedriver", "chrome", "chromium", "chromium-browser", "google-chrome", "headless_shell")
+# Solo se limpian navegadores lanzados por WebDriver (nunca el Chrome personal del usuario)
+AUTOMATION_FLAG = "--enable-automation"
+
+
+class ProcessInfo(NamedTuple):
+    pid: int
+    ppid: int
+    name: str
+    state: str
+    rss_bytes: int
+    cpu_seconds: float
+
+
+class WorkerUsage(NamedTuple):
+    """Consumo del árbol de procesos de un navegador (chromedriver + Chrome + renderers)."""
+    worker: str
+    processes: int
+    rss_bytes: int
+    cpu_percent: float
+
+    @property
+    def rss_mb(self) -> float:
+        return self.rss_bytes / (1024 * 1024)
+
+
+# =======================================================
+# 2. PROCESOS (psutil si está instalado; si no, /proc)
+# =======================================================
+
+def _psutil():
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil
+
+def monitoring_available() -> bool:
+    return _psutil() is not None or os.path.isdir("/proc/self")
+
+def _proc_snapshot() -> Dict[int, ProcessInfo]:
+    psutil = _psutil()
+    snapshot: Dict[int, ProcessInfo] = {}
+    if psutil is not None:
+        for proc in psutil.process_iter(["pid", "ppid", "name", "status", "memory_info", "cpu_times"]):
+            info = proc.info
+            mem, cpu = info.get("memory_info"), info.get("cpu_times")
+            snapshot[info["pid"]] = ProcessInfo(
+                info["pid"], info.get("ppid") or 0, info.get("name") or "", info.get("status") or "",
+                mem.rss if mem else 0, (cpu.user + cpu.system) if cpu else 0.0,
+            )
+        return snapshot
+
+    ticks = os.sysconf("SC_CLK_TCK")
+    page = os.sysconf("SC_PAGE_SIZE")
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as fh:
+                stat = fh.read().decode("utf-8", errors="replace")
+            # El nombre va entre paréntesis y puede contener espacios
+            name = stat[stat.index("(") + 1:stat.rindex(")")]
+            fields = stat[stat.rindex(")") + 2:].split()
+            with open(f"/proc/{entry}/statm", "rb") as fh:
+                rss_pages = int(fh.read().split()[1])
+        except (OSError, ValueError, IndexError):
+            continue  # El proceso terminó mientras se leía
+        snapshot[int(entry)] = ProcessInfo(
+            int(entry), int(fields[1]), name, fields[0], rss_pages * page,
+            (int(fields[11]) + int(fields[12])) / ticks,
+        )
+    return snapshot
+
+def _cmdline(pid: int) -> str:
+    psutil = _psutil()
+    try:
+        if psutil is not None:
+            return " ".join(psutil.Process(pid).cmdline())
+        with open(f"/proc/{pid}/cmdline", "rb") as fh:
+            return fh.read().replace(b"\0", b" ").decode("utf-8", errors="replace")
+    except Exception:
+        return ""
+
+def _owned_by_me(pid: int) -> bool:
+    if not hasattr(os, "getuid"):
+        return True
+    try:
+        return os.stat(f"/proc/{pid}").st_uid == os.getuid()
+    except OSError:
+        psutil = _psutil()
+        try:
+            return psutil is not None and psutil.Process(pid).uids().real == os.getuid()
+        except Exception:
+            return False
+
+def process_tree(root_pid: int, snapshot: Optional[Dict[int, ProcessInfo]] = None) -> List[ProcessInfo]:
+    """El proceso y todos sus descendientes."""
+    snapshot = snapshot if snapshot is not None else _proc_snapshot()
+    children: Dict[int, List[int]] = {}
+    for info in snapshot.values():
+        children.setdefault(info.ppid, []).append(info.pid)
+    tree, pending = [], [root_pid]
+    while pending:
+        pid = pending.pop()
+        if pid in snapshot:
+            tree.append(snapshot[pid])
+            pending.extend(children.get(pid, []))
+    return tree
+
+def available_memory_bytes() -> Optional[int]:
+    psutil = _psutil()
+    if psutil is not None:
+        return psutil.virtual_memory().available
+    try:
+        with open("/proc/meminfo") as fh:
+            for line in fh:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def driver_root_pid(driver) -> Optional[int]:
+    """PID de chromedriver (padre de Chrome) del driver de Selenium."""
+    process = getattr(getattr(driver, "service", None), "process", None)
+    return getattr(process, "pid", None)
+
+def terminate_processes(pids: Iterable[int], grace_seconds: float = KILL_GRACE_SECONDS) -> int:
+    """SIGTERM y, si siguen vivos tras la espera, SIGKILL; recoge los que sean hijos de este proceso."""
+    pids = [pid for pid in set(pids) if pid != os.getpid()]
+    sent = []
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+            sent.append(pid)
+        except (ProcessLookupError, PermissionError):
+            pass
+    deadline = time.monotonic() + grace_seconds
+    alive = list(sent)
+    while alive and time.monotonic() < deadline:
+        time.sleep(0.1)
+        _reap_children(alive)
+        alive = [pid for pid in alive if _is_running(pid)]
+    for pid in alive:
+        try:
+            os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+        except (ProcessLookupError, PermissionError):
+            pass
+    _reap_children(sent)
+    return len(sent)
+
+def _is_running(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as fh:
+            return fh.read().rsplit(b")", 1)[1].split()[0] != b"Z"
+    except OSError:
+        pass
+    try:
+        os.kill(pid, 0)
+        return True
+    except (ProcessLookupError, PermissionError, OSError):
+        return False
+
+def _reap_children(pids: Iterable[int]):
+    """Recoge el zombi de cada PID indicado que sea hijo de este proceso.
+
+    Nunca ``waitpid(-1)``: robaría el código de salida de hijos ajenos
+    (subprocess, multiprocessing, el supervisor de sat_job_queue).
+    """
+    if not hasattr(os, "WNOHANG"):
+        return
+    for pid in pids:
+        try:
+            os.waitpid(pid, os.WNOHANG)
+        except (ChildProcessError, OSError):
+            # No es hijo nuestro o ya se recogió
+            pass
+
+def quit_and_reap(driver, quit: Optional[Callable[[], None]] = None):
+    """Cierra el driver y termina los procesos de su árbol que sigan vivos (si quit() falló o se colgó a medias)."""
+    root = driver_root_pid(driver)
+    tree = [p.pid for p in process_tree(root)] if root and monitoring_available() else []
+    try:
+        (quit or driver.quit)()
+    except Exception as e:
+        print(f"[RECURSOS] driver.quit() falló: {type(e).__name__}: {e}")
+    deadline = time.monotonic() + QUIT_SETTLE_SECONDS
+    survivors = [pid for pid in tree if _is_running(pid)]
+    while survivors and time.monotonic() < deadline:
+        time.sleep(0.1)
+        _reap_children(survivors)
+        survivors = [pid for pid in survivors if _is_running(pid)]
+    if survivors:
+        print(f"[RECURSOS] Terminando {len(survivors)} procesos de Chrome que sobrevivieron a quit().")
+        terminate_processes(survivors)
+    else:
+        _reap_children(tree)
+
+
+# =======================================================
+# 3. GOBERNADOR
+# =======================================================
+
+class ResourceGovernor:
+    """Mide cada navegador registrado, limita los lanzamientos por memoria y limpia huérfanos."""
+
+    def __init__(self, max_browser_rss_mb: float = MAX_BROWSER_RSS_MB, browser_estimate_mb: float = BROWSER_ESTIMATE_MB,
+                 min_free_memory_mb: float = MIN_FREE_MEMORY_MB, max_browsers: Optional[int] = None):
+        self.max_browser_rss_bytes = int(max_browser_rss_mb * 1024 * 1024)
+        self.browser_estimate_bytes = int(browser_estimate_mb * 1024 * 1024)
+        self.min_free_bytes = int(min_free_memory_mb * 1024 * 1024)
+        self.max_browsers = max_browsers
+        self.enabled = monitoring_available()
+        self._lock = threading.Lock()
+        self._workers: Dict[str, int] = {}  # worker -> PID raíz
+        self._cpu: Dict[str, tuple] = {}  # worker -> (segundos de CPU, instante)
+        self._launching = 0
+        self.usage: Dict[str, WorkerUsage] = {}
+        self.recycled: Dict[str, int] = {}
+        self.orphans_reaped = 0
+        self._monitor: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        if not self.enabled:
+            print("[RECURSOS] Sin /proc ni psutil: no se medirá el consumo de los navegadores.")
+        from sat_telemetry import get_metrics_registry
+        get_metrics_registry().add_collector(self.render_metrics)
+
+    # --- Admisión ---
+
+    def reserve_launch(self, timeout: float):
+        """Espera a que haya memoria (y cupo) para un Chrome más; llamar a ``register`` o ``cancel_launch`` después."""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                running = len(self._workers) + self._launching
+                available = available_memory_bytes() if self.enabled else None
+                needed = (self._launching + 1) * self.browser_estimate_bytes + self.min_free_bytes
+                # Siempre se permite al menos un navegador
+                fits = running == 0 or available is None or available >= needed
+                if fits and (self.max_browsers is None or running < self.max_browsers):
+                    self._launching += 1
+                    return
+            if time.monotonic() >= deadline:
+                raise RuntimeError(
+                    f"Memoria insuficiente para lanzar otro Chrome/WebDriver ({running} activos, "
+                    f"{(available or 0) / 2**20:.0f} MB libres, se requieren {needed / 2**20:.0f} MB)."
+                )
+            time.sleep(CAPACITY_POLL_SECONDS)
+
+    def cancel_launch(self):
+        with self._lock:
+            self._launching = max(0, self._launching - 1)
+
+    def register(self, worker: str, driver):
+        with self._lock:
+            self._launching = max(0, self._launching - 1)
+            pid = driver_root_pid(driver)
+            if pid:
+                self._workers[worker] = pid
+
+    def unregister(self, worker: str, reason: Optional[str] = None):
+        with self._lock:
+            self._workers.pop(worker, None)
+            self._cpu.pop(worker, None)
+            self.usage.pop(worker, None)
+            if reason:
+                self.recycled[reason] = self.recycled.get(reason, 0) + 1
+
+    # --- Medición ---
+
+    def sample(self, snapshot: Optional[Dict[int, ProcessInfo]] = None) -> Dict[str, WorkerUsage]:
+        """RSS y CPU de cada navegador registrado."""
+        if not self.enabled:
+            return {}
+        snapshot = snapshot if snapshot is not None else _proc_snapshot()
+        now = time.monotonic()
+        with self._lock:
+            for worker, pid in self._workers.items():
+                tree = process_tree(pid, snapshot)
+                cpu = sum(p.cpu_seconds for p in tree)
+                previous = self._cpu.get(worker)
+                percent = 0.0
+                if previous and now > previous[1]:
+                    percent = max(0.0, (cpu - previous[0]) / (now - previous[1]) * 100)
+                self._cpu[worker] = (cpu, now)
+                self.usage[worker] = WorkerUsage(worker, len(tree), sum(p.rss_bytes for p in tree), percent)
+            return dict(self.usage)
+
+    def over_limit(self, worker: str) -> Optional[WorkerUsage]:
+        """Consumo actual del navegador si supera MAX_BROWSER_RSS_MB (hay que reciclarlo), o None."""
+        usage = self.sample().get(worker)
+        if usage and usage.rss_bytes > self.max_browser_rss_bytes:
+            return usage
+        return None
+
+    # --- Huérfanos ---
+
+    def reap_orphans(self) -> int:
+        """Termina chromedriver/Chrome de automatización huérfanos (su padre murió) que no son de ningún worker."""
+        if not self.enabled:
+            return 0
+        snapshot = _proc_snapshot()
+        with self._lock:
+            managed: Set[int] = {p.pid for root in self._workers.values() for p in process_tree(root, snapshot)}
+        victims = []
+        for info in snapshot.values():
+            if info.pid in managed or info.name not in ORPHAN_PROCESS_NAMES:
+                continue
+            orphaned = info.ppid == 1 or info.ppid not in snapshot
+            if not orphaned or not _owned_by_me(info.pid):
+                continue
+            if info.name != "chromedriver" and AUTOMATION_FLAG not in _cmdline(info.pid):
+                continue
+            victims.extend(p.pid for p in process_tree(info.pid, snapshot))
+        if victims:
+            print(f"[RECURSOS] Terminando {len(victims)} procesos huérfanos de Chrome/chromedriver.")
+            terminate_processes(victims)
+            with self._lock:
+                self.orphans_reaped += len(victims)
+        return len(victims)
+
+    # --- Monitor y métricas ---
+
+    def start_monitor(self, interval: float = SAMPLE_INTERVAL_SECONDS):
+        """Muestrea consumo y limpia huérfanos en un hilo de fondo (idempotente)."""
+        if not self.enabled:
+            return
+        if self._monitor and self._monitor.is_alive():
+            if not self._stop.is_set():
+                return
+            # Se detuvo pero aún no termina: esperarlo antes de lanzar otro
+            self._monitor.join()
+        self._stop.clear()
+        self._monitor = threading.Thread(target=self._monitor_loop, args=(interval,), name="sat-recursos", daemon=True)
+        self._monitor.start()
+
+    def stop_monitor(self):
+        """Detiene el hilo de muestreo (lo vuelve a iniciar el siguiente start_monitor)."""
+        self._stop.set()
+
+    def _monitor_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.sample()
+                self.reap_orphans()
+            except Exception as e:
+                print(f"[RECURSOS] Falló el muestreo: {type(e).__name__}: {e}")
+
+    def format_usage(self) -> str:
+        with self._lock:
+            usage = sorted(self.usage.values())
+        return "\n".join(f"    {u.worker:<12} {u.rss_mb:8.0f} MB  {u.cpu_percent:5.1f}% CPU  {u.processes} procesos"
+                         for u in usage)
+
+    def render_metrics(self) -> List[str]:
+        with self._lock:
+            usage = sorted(self.usage.values())
+            recycled = sorted(self.recycled.items())
+            orphans = self.orphans_reaped
+        lines = ["# HELP sat_browser_rss_bytes Memoria residente del árbol de procesos de cada navegador.",
+                 "# TYPE sat_browser_rss_bytes gauge"]
+        lines += [f'sat_browser_rss_bytes{{worker="{u.worker}"}} {u.rss_bytes}' for u in usage]
+        lines += ["# HELP sat_browser_cpu_percent CPU del árbol de procesos de cada navegador.",
+                  "# TYPE sat_browser_cpu_percent gauge"]
+        lines += [f'sat_browser_cpu_percent{{worker="{u.worker}"}} {u.cpu_percent:.1f}' for u in usage]
+        lines += ["# HELP sat_browser_processes Procesos en el árbol de cada navegador.",
+                  "# TYPE sat_browser_processes gauge"]
+        lines += [f'sat_browser_processes{{worker="{u.worker}"}} {u.processes}' for u in usage]
+        lines += ["# HELP sat_browser_recycled_total Navegadores reciclados por motivo.",
+                  "# TYPE sat_browser_recycled_total counter"]
+        lines += [f'sat_browser_recycled_total{{reason="{r}"}} {n}' for r, n in recycled]
+        lines += ["# HELP sat_browser_orphans_reaped_total Procesos huérfanos de Chrome/chromedriver terminados.",
+                  "# TYPE sat_browser_orphans_reaped_total counter",
+                  f"sat_browser_orphans_reaped_total {orphans}"]
+        available = available_memory_bytes() if self.enabled else None
+        if available is not None:
+            lines += ["# HELP sat_memory_available_bytes Memoria disponible en el equipo.",
+                      "# TYPE sat_memory_available_bytes gauge",
+                      f"sat_memory_available_bytes {available}"]
+        return lines
+
+
+_governor: Optional[ResourceGovernor] = None
+_governor_lock = threading.Lock()
+
+
+def get_resource_governor() -> ResourceGovernor:
+    """Gobernador compartido del proceso."""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = ResourceGovernor()
+        return _governor
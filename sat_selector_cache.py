@@ -0,0 +1,172 @@
+"""Caché persistente de localizadores aprendidos por paso, con contadores de aciertos/fallos."""
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+# =======================================================
+# 1. CONFIGURACIÓN
+# =======================================================
+
+SELECTOR_CACHE_PATH = Path.cwd() / ".sat_selector_cache.json"
+# Fallos consecutivos del localizador preferido antes de olvidarlo
+STALE_AFTER_MISSES = 3
+CACHE_VERSION = 1
+
+Locator = Tuple[str, str]
+
+
+def locator_key(locator: Locator) -> str:
+    """Clave estable de un localizador (estrategia::valor)."""
+    by, value = locator
+    return f"{by}::{value}"
+
+
+# =======================================================
+# 2. CACHÉ
+# =======================================================
+
+class SelectorCache:
+    """Recuerda qué localizador funcionó en cada paso y lo prueba primero la próxima vez.
+
+    Estructura en disco (JSON)::
+
+        {"version": 1, "steps": {"login/password": {
+            "preferred": ["css selector", "input[type='password']"],
+            "consecutive_misses": 0,
+            "locators": {"css selector::input[...]": {"hits": 10, "misses": 0, "last_hit": "..."}}}}}
+    """
+
+    def __init__(self, path: Path = SELECTOR_CACHE_PATH, autosave: bool = True):
+        self.path = Path(path)
+        self.autosave = autosave
+        self._lock = threading.Lock()
+        self._steps: Dict[str, Dict] = self._load()
+
+    def _load(self) -> Dict[str, Dict]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"[CACHE] Caché de localizadores ilegible, se reinicia: {e}")
+            return {}
+        if data.get("version") != CACHE_VERSION:
+            return {}
+        return data.get("steps", {})
+
+    def save(self):
+        """Escribe la caché de forma atómica."""
+        with self._lock:
+            payload = json.dumps({"version": CACHE_VERSION, "steps": self._steps}, indent=2, ensure_ascii=False)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=self.path.name, dir=str(self.path.parent))
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                fh.write(payload)
+            os.replace(tmp, str(self.path))
+        except OSError as e:
+            print(f"[CACHE] No se pudo guardar la caché de localizadores: {e}")
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    def order(self, step: str, locators: Sequence[Locator],
+              never_prefer: Sequence[Locator] = ()) -> List[Locator]:
+        """Devuelve los localizadores con el preferido del paso en primer lugar.
+
+        Los de ``never_prefer`` (comodines como ``//input[@type='file']``) nunca se adelantan.
+        """
+        locators = [tuple(loc) for loc in locators]
+        generic = {tuple(loc) for loc in never_prefer}
+        with self._lock:
+            preferred = self._steps.get(step, {}).get("preferred")
+        if preferred:
+            preferred = tuple(preferred)
+            if preferred in locators and preferred not in generic:
+                locators.remove(preferred)
+                locators.insert(0, preferred)
+        return locators
+
+    def record(self, step: str, tried: Sequence[Locator], winner: Optional[Locator],
+               never_prefer: Sequence[Locator] = ()):
+        """Registra el resultado de una búsqueda.
+
+        Los localizadores evaluados antes del ganador (o todos, si no hubo ganador)
+        cuentan como fallo; el ganador pasa a ser el preferido del paso, salvo que esté
+        en ``never_prefer``: un comodín casi siempre encuentra *algún* elemento, así que
+        como preferido nunca acumularía fallos y taparía a los localizadores específicos.
+        """
+        generic = {tuple(loc) for loc in never_prefer}
+        with self._lock:
+            entry = self._steps.setdefault(step, {"preferred": None, "consecutive_misses": 0, "locators": {}})
+            stats = entry["locators"]
+
+            for locator in tried:
+                if winner is not None and tuple(locator) == tuple(winner):
+                    break
+                counters = stats.setdefault(locator_key(locator), {"hits": 0, "misses": 0, "last_hit": None})
+                counters["misses"] += 1
+
+            preferred = tuple(entry["preferred"]) if entry["preferred"] else None
+            if preferred in generic:
+                # Aprendido antes de marcarse como comodín
+                entry["preferred"] = preferred = None
+                entry["consecutive_misses"] = 0
+
+            if winner is not None:
+                winner = tuple(winner)
+                counters = stats.setdefault(locator_key(winner), {"hits": 0, "misses": 0, "last_hit": None})
+                counters["hits"] += 1
+                counters["last_hit"] = datetime.now().isoformat(timespec="seconds")
+
+            if winner is not None and winner not in generic:
+                if preferred is not None and preferred != winner:
+                    # El portal cambió: otro localizador resolvió el paso
+                    print(f"[CACHE] Localizador preferido de '{step}' reemplazado: {preferred} -> {winner}")
+                entry["preferred"] = list(winner)
+                entry["consecutive_misses"] = 0
+            elif preferred is not None:
+                # Sin ganador, o solo lo resolvió un comodín: el preferido falló
+                entry["consecutive_misses"] += 1
+                if entry["consecutive_misses"] >= STALE_AFTER_MISSES:
+                    print(f"[CACHE] Localizador preferido de '{step}' obsoleto, se descarta: {preferred}")
+                    entry["preferred"] = None
+                    entry["consecutive_misses"] = 0
+
+        if self.autosave:
+            self.save()
+
+    def stats(self) -> Dict[str, Dict[str, Dict]]:
+        """Contadores de aciertos/fallos por paso y localizador."""
+        with self._lock:
+            return json.loads(json.dumps({step: entry["locators"] for step, entry in self._steps.items()}))
+
+    def hit_rate(self, step: str) -> Optional[float]:
+        """Proporción de aciertos sobre todas las evaluaciones de localizadores del paso."""
+        with self._lock:
+            entry = self._steps.get(step)
+            if not entry:
+                return None
+            hits = sum(c["hits"] for c in entry["locators"].values())
+            misses = sum(c["misses"] for c in entry["locators"].values())
+        total = hits + misses
+        return hits / total if total else None
+
+
+_default_cache: Optional[SelectorCache] = None
+_default_lock = threading.Lock()
+
+
+def get_selector_cache() -> SelectorCache:
+    """Caché compartida del proceso (se carga al primer uso)."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = SelectorCache()
+        return _default_cache
@@ -1,8 +1,11 @@
 import os
+import shutil
+import tempfile
 import time
 from pathlib import Path
-from typing import List, Optional, Set
+from typing import List, Optional
 from datetime import datetime
+from urllib.parse import urlencode, urlsplit
 import json
 
 # --- Importaciones de Selenium ---
@@ -13,12 +16,42 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import (
     TimeoutException,
+    JavascriptException,
     NoSuchElementException,
     NoSuchFrameException,
+    NoSuchWindowException,
+    StaleElementReferenceException,
     WebDriverException,
     # FileNotFoundError no existe en Selenium, se usa la de Python
 )
 
+from sat_browser import DRIVER_BACKENDS, BrowserDriver, BrowserElement
+from sat_download_watch import (
+    drain_cdp_download_events,
+    has_pdf_markers,
+    snapshot_filenames,
+    wait_for_pdf_download,
+)
+from sat_http import StreamedFile, request as http_request, stream_response_to_file
+from sat_constancia_store import get_constancia_store
+from sat_efirma import CertificateInfo, EfirmaPreflightError, crypto_available, preflight_efirma
+from sat_frames import get_frame_resolver, switch_to_frame_path
+from sat_lean import LEAN_CHROME_ARGS, LEAN_PREFS, blocked_url_patterns, enable_url_blocking, page_load_stats
+from sat_locators import LocatorMatch, race_locators, record_step_failure
+from sat_resources import get_resource_governor, quit_and_reap
+from sat_page_runtime import count_round_trips, install_page_runtime, page_call
+from sat_session_store import SavedSession, certificate_fingerprint, get_session_store
+from sat_telemetry import finish_trace, format_trace, record_frame, record_retry, stage_span, start_trace
+from sat_waits import (
+    format_wait_timings,
+    get_wait_timings,
+    reset_wait_timings,
+    wait_for_dom_settled,
+    wait_for_file_attached,
+    wait_for_network_idle,
+    wait_for_url_change,
+)
+
 
 # =======================================================
 # 1. CONFIGURACIÓN
@@ -27,9 +60,48 @@ from selenium.common.exceptions import (
 # Usar segundos en lugar de Duration de Java
 TIMEOUT_DURATION_SECONDS = 60
 WAIT_FOR_ELEMENT_SECONDS = 12
+# Espera del click dentro del frame ya identificado y pausa entre sondas del árbol de frames
+GENERAR_CLICK_TIMEOUT_SECONDS = 2
+FRAME_REPROBE_SECONDS = 0.25
+# Si el clic por JS no cambia la página (DOM, documento o pestañas) en este plazo, se repite con el clic nativo
+NATIVE_CLICK_GRACE_SECONDS = 2.0
+CLICK_EFFECT_POLL_SECONDS = 0.1
+# Portal del SAT: login con e.firma y módulo de la constancia (ver set_portal_base_url)
+SAT_PORTAL_BASE_URL = "https://wwwmat.sat.gob.mx"
+SAT_LOGIN_PATH = "/aplicacion/login/53027/genera-tu-constancia-de-situacion-fiscal"
+SAT_MODULE_PATH = "/aplicacion/53027/genera-tu-constancia-de-situacion-fiscal"
+SAT_LOGIN_URL = SAT_PORTAL_BASE_URL + SAT_LOGIN_PATH
+SAT_MODULE_URL = SAT_PORTAL_BASE_URL + SAT_MODULE_PATH
+SAT_COOKIE_DOMAIN = "sat.gob.mx"
+# Orígenes del login del SAT (proveedor de identidad); solo aplican al portal real
+SAT_IDP_ORIGINS = ("https://login.siat.sat.gob.mx", "https://loginda.siat.sat.gob.mx", "https://www.sat.gob.mx")
+# Descarga directa del PDF por HTTP (sin pestaña nueva ni espera en disco); si falla se usa el click
+DIRECT_PDF_DOWNLOAD = True
+# Extraer los datos de la constancia (RFC, régimen, domicilio...) a <download_dir>/constancias.jsonl
+EXTRACT_CONSTANCIA_FIELDS = False
+CONSTANCIA_RECORDS_FILENAME = "constancias.jsonl"
+# Almacén local de constancias: reutiliza la del RFC si se descargó dentro de la ventana de frescura
+USE_CONSTANCIA_STORE = True
+# Validar la e.firma (vigencia, contraseña, llave del certificado) antes de abrir Chrome; requiere cryptography
+EFIRMA_PREFLIGHT = True
+# Backend del navegador: "selenium" (chromedriver) o "cdp" (websocket de DevTools, sin chromedriver)
+DRIVER_BACKEND = os.environ.get("SAT_DRIVER_BACKEND", "selenium")
+# Modo ligero (opcional): bloquea imágenes, fuentes y trackers y desactiva funciones de fondo de Chrome
+LEAN_BROWSER = False
+# Reanudaciones por trabajo en el mismo driver (desde el último punto de control) ante fallas transitorias
+FLOW_MAX_RESUMES = 2
+# Esperar memoria libre antes de lanzar Chrome y terminar los procesos que sobrevivan a driver.quit()
+RESOURCE_GOVERNOR = True
+FLOW_CHECKPOINTS = ("sesion", "modulo", "generar", "pestana_pdf", "descargado")
+RESUMABLE_ERRORS = (TimeoutException, StaleElementReferenceException, NoSuchWindowException, NoSuchFrameException)
+# Tiempo máximo para confirmar que una sesión restaurada sigue siendo válida
+SESSION_CHECK_TIMEOUT_SECONDS = 20
 # Path usa Pathlib.cwd() (similar a System.getProperty("user.dir"))
 SCREENSHOT_DIR = Path.cwd() / "screenshots"
-DEFAULT_FINAL_PDF_NAME = "constancia_sat.pdf"
+# Nombre final del PDF: determinista por RFC y momento de la descarga
+FINAL_PDF_NAME_TEMPLATE = "constancia_{rfc}_{timestamp}.pdf"
+# Prefijo de los subdirectorios temporales de descarga de cada trabajo
+JOB_DOWNLOAD_DIR_PREFIX = ".descarga_"
 
 # 🚀 Rutas y Contraseña Personalizadas (¡REEMPLAZA ESTAS RUTAS!)
 # Usar Path() con raw strings (r"...") o Path().resolve()
@@ -46,7 +118,7 @@ def sleep(seconds: float):
     """Pausa la ejecución (similar a Thread.sleep de Java)."""
     time.sleep(seconds)
 
-def take_screenshot(driver: webdriver.Chrome, label: str):
+def take_screenshot(driver: BrowserDriver, label: str):
     """Guarda un screenshot con timestamp (función desactivada para el headless por defecto)."""
     try:
         # Esta función puede no ser útil en modo headless, pero se mantiene la lógica
@@ -62,153 +134,115 @@ def take_screenshot(driver: webdriver.Chrome, label: str):
         print(f"[SS] No se pudo guardar screenshot '{label}': {e}")
 
 
-def scroll_horizontal_all_the_way(driver: webdriver.Chrome):
-    """Desplaza a la derecha todos los contenedores con scroll horizontal (JS)."""
-    js = """
-        try {
-            const root = document.scrollingElement || document.documentElement || document.body;
-            if (root && root.scrollWidth - root.clientWidth > 5) {
-                root.scrollLeft = root.scrollWidth;
-            }
-            const nodes = Array.from(document.querySelectorAll('*'));
-            for (const el of nodes) {
-                const sw = el.scrollWidth || 0;
-                const cw = el.clientWidth || 0;
-                if (sw - cw > 5) {
-                    el.scrollLeft = sw;
-                }
-            }
-        } catch (e) {
-            console.log('scroll_horizontal_all_the_way error', e);
-        }
-        """
-    driver.execute_script(js)
-
-def find_first_present(driver: webdriver.Chrome, *locators) -> Optional[webdriver.remote.webelement.WebElement]:
-    """Busca el primer elemento presente en el DOM, esperando hasta 12 segundos."""
-    wait = WebDriverWait(driver, WAIT_FOR_ELEMENT_SECONDS)
-    for locator in locators:
-        try:
-            return wait.until(EC.presence_of_element_located(locator))
-        except TimeoutException:
-            pass
+def scroll_horizontal_all_the_way(driver: BrowserDriver):
+    """Desplaza a la derecha todos los contenedores con scroll horizontal (runtime JS, un solo viaje)."""
+    try:
+        page_call(driver, "scrollHorizontal")
+    except JavascriptException as e:
+        print(f"scroll_horizontal_all_the_way error: {e}")
+
+def find_first_present(driver: BrowserDriver, *locators, step: Optional[str] = None) -> Optional[BrowserElement]:
+    """Busca el primer elemento presente en el DOM; todos los locators comparten un plazo de 12 segundos."""
+    match = race_locators(driver, locators, WAIT_FOR_ELEMENT_SECONDS, step=step)
+    if match:
+        print(f" -> Elemento localizado por {match.locator}.")
+        return match.element
     return None
 
-def find_first_clickable(driver: webdriver.Chrome, *locators) -> Optional[webdriver.remote.webelement.WebElement]:
-    """Busca el primer elemento que sea clicable, esperando hasta 12 segundos."""
-    wait = WebDriverWait(driver, WAIT_FOR_ELEMENT_SECONDS)
-    for locator in locators:
-        try:
-            return wait.until(EC.element_to_be_clickable(locator))
-        except TimeoutException:
-            pass
+def find_first_clickable(driver: BrowserDriver, *locators, step: Optional[str] = None) -> Optional[BrowserElement]:
+    """Busca el primer elemento clicable; todos los locators comparten un plazo de 12 segundos."""
+    match = race_locators(driver, locators, WAIT_FOR_ELEMENT_SECONDS, clickable=True, step=step)
+    if match:
+        print(f" -> Elemento clicable localizado por {match.locator}.")
+        return match.element
     return None
 
-def click_by_inner_text_js(driver: webdriver.Chrome, needles: List[str]) -> bool:
-    """Intenta hacer clic en un elemento usando su texto visible (JS)."""
-    script = """
-        const needles = Array.from(arguments[0] || []).map(s => (s||'').trim().toLowerCase());
-        function isVisible(el){
-          if (!el) return false;
-          const r = el.getBoundingClientRect();
-          const style = window.getComputedStyle(el);
-          return r.width > 1 && r.height > 1 &&
-                 style.visibility !== 'hidden' &&
-                 style.display !== 'none' &&
-                 style.opacity !== '0';
-        }
-        const candidates = Array.from(document.querySelectorAll('button,a,[role="button"],input[type="button"],input[type="submit"],div,span,label'));
-        for (const el of candidates){
-          const txt = (el.innerText || el.textContent || '').trim().toLowerCase();
-          if (!txt) continue;
-          if (!isVisible(el)) continue;
-          if (needles.some(n => n && txt.includes(n))){
-            try {
-              el.scrollIntoView({behavior:'instant', block:'center', inline:'center'});
-              el.click();
-              return true;
-            } catch (e) {}
-          }
-        }
-        return false;
-        """
-    result = driver.execute_script(script, needles)
-    return bool(result)
+def click_by_inner_text_js(driver: BrowserDriver, needles: List[str]) -> bool:
+    """Intenta hacer clic en un elemento usando su texto visible (índice de textos del runtime JS)."""
+    try:
+        return bool(page_call(driver, "clickByText", list(needles)))
+    except Exception:
+        return False
 
-def switch_to_login_frame_if_any(driver: webdriver.Chrome):
-    """Busca y cambia al iframe que contenga campos de login/e.firma."""
-    driver.switch_to.default_content()
-    iframes = driver.find_elements(By.TAG_NAME, "iframe")
-    for frame in iframes:
+def switch_to_login_frame_if_any(driver: BrowserDriver):
+    """Cambia al iframe que contenga campos de login/e.firma (usa el mapa de frames en caché)."""
+    resolver = get_frame_resolver(driver)
+    path = resolver.frame_for("login", prefer_frames=True)
+    if path:
         try:
-            driver.switch_to.frame(frame)
-            inputs = driver.find_elements(By.XPATH,
-                    "//input[@type='text' or @type='email' or @type='password' or @type='file']")
-            if inputs:
-                return 
-            driver.switch_to.default_content()
-        except NoSuchFrameException:
-            driver.switch_to.default_content()
+            switch_to_frame_path(driver, path)
+            record_frame("login", path)
+            return
         except Exception:
-            driver.switch_to.default_content()
+            resolver.invalidate()
     driver.switch_to.default_content()
 
-def try_click_in_current_context(driver: webdriver.Chrome, locators: List[tuple], timeout_seconds: float) -> bool:
-    """Intenta localizar y hacer click en el botón dentro del contexto (frame) actual."""
-    wait = WebDriverWait(driver, timeout_seconds)
-    for locator in locators:
-        try:
-            btn = wait.until(EC.element_to_be_clickable(locator))
-
-            driver.execute_script(
-                    "arguments[0].scrollIntoView({behavior:'instant', block:'center', inline:'center'});",
-                    btn
-            )
-            sleep(0.8)
-
-            try:
-                btn.click()
-            except Exception:
-                driver.execute_script("arguments[0].click();", btn)
-            
-            return True
-        except TimeoutException:
-            pass
-    return False
-
-def click_generar_constancia_btn(driver: webdriver.Chrome):
-    """Busca el botón 'Generar Constancia' y hace click."""
-    
-    locators = [
-        (By.ID, "formReimpAcuse:j_idt50"),
-        (By.XPATH, "//button[.//span[contains(normalize-space(.),'Generar Constancia')]]"),
-        (By.XPATH, "//span[contains(normalize-space(.),'Generar Constancia')]/ancestor::button[1]"),
-        (By.XPATH, "//button[contains(normalize-space(.),'Generar Constancia')]"),
-    ]
+def ensure_click_took_effect(driver: BrowserDriver, match: LocatorMatch, handles_before: int):
+    """Repite con el clic nativo de WebDriver si el clic por JS del runtime no cambió la página.
 
-    # 1) Intentar en el DOM principal
-    driver.switch_to.default_content()
-    if try_click_in_current_context(driver, locators, WAIT_FOR_ELEMENT_SECONDS):
+    Hay efecto si cambian las mutaciones del DOM o el documento del contexto actual, o el
+    número de pestañas. El clic de JS (``el.click()``) no pasa por la prueba de impacto del
+    navegador, así que un botón que solo responde a eventos de puntero reales lo ignora.
+    """
+    if match.page_state is None:
         return
-
-    # 2) Si no se encontró, recorrer todos los iframes
-    frames = driver.find_elements(By.CSS_SELECTOR, "iframe, frame")
-    for idx, frame in enumerate(frames):
+    deadline = time.monotonic() + NATIVE_CLICK_GRACE_SECONDS
+    while True:
         try:
-            driver.switch_to.default_content()
-            WebDriverWait(driver, 5).until(
-                    EC.frame_to_be_available_and_switch_to_it(frame)
-            )
-        except Exception:
-            continue
+            if len(driver.window_handles) != handles_before or tuple(page_call(driver, "pageState")) != match.page_state:
+                return
+        except WebDriverException:
+            return  # El documento o el frame ya no existe: el clic navegó
+        if time.monotonic() >= deadline:
+            break
+        time.sleep(CLICK_EFFECT_POLL_SECONDS)
+
+    print(" -> El clic por JS no cambió la página; se repite con el clic nativo.")
+    record_retry()
+    try:
+        match.element.click()
+    except WebDriverException as e:
+        print(f" -> Clic nativo fallido: {type(e).__name__}: {e}")
 
-        if try_click_in_current_context(driver, locators, WAIT_FOR_ELEMENT_SECONDS):
+def try_click_in_current_context(driver: BrowserDriver, locators: List[tuple], timeout_seconds: float,
+                                 step: Optional[str] = None) -> bool:
+    """Intenta localizar y hacer click en el botón dentro del contexto (frame) actual."""
+    handles_before = len(driver.window_handles)
+    # Localizar (visible y habilitado), desplazar y hacer click en un solo viaje
+    match = race_locators(driver, locators, timeout_seconds, clickable=True, step=step, action="click")
+    if match is None:
+        return False
+
+    print(f" -> Botón localizado por {match.locator}.")
+    ensure_click_took_effect(driver, match, handles_before)
+    return True
+
+GENERAR_CONSTANCIA_LOCATORS = [
+    (By.ID, "formReimpAcuse:j_idt50"),
+    (By.XPATH, "//button[.//span[contains(normalize-space(.),'Generar Constancia')]]"),
+    (By.XPATH, "//span[contains(normalize-space(.),'Generar Constancia')]/ancestor::button[1]"),
+    (By.XPATH, "//button[contains(normalize-space(.),'Generar Constancia')]"),
+]
+
+def click_generar_constancia_btn(driver: BrowserDriver):
+    """Busca el botón 'Generar Constancia' y hace click."""
+    locators = GENERAR_CONSTANCIA_LOCATORS
+
+    # 1) Buscar el frame del botón con el mapa de frames (DOM principal incluido) hasta el plazo
+    resolver = get_frame_resolver(driver)
+    deadline = time.monotonic() + WAIT_FOR_ELEMENT_SECONDS
+    while time.monotonic() < deadline:
+        if resolver.switch_to("generar"):
+            clicked = try_click_in_current_context(driver, locators, GENERAR_CLICK_TIMEOUT_SECONDS, step="constancia/generar")
             driver.switch_to.default_content()
-            return
-        
-        driver.switch_to.default_content()
+            if clicked:
+                return
+            resolver.invalidate()
+        record_retry()
+        time.sleep(FRAME_REPROBE_SECONDS)
 
-    # 3) Fallo
+    # 2) Fallo
+    record_step_failure("constancia/generar", locators)
     raise NoSuchElementException(
             "No se encontró el botón para generar/descargar la Constancia. El portal SAT pudo haber cambiado su estructura (DOM)."
     )
@@ -218,7 +252,7 @@ def click_generar_constancia_btn(driver: webdriver.Chrome):
 # 3. LÓGICA DE E.FIRMA
 # =======================================================
 
-def select_efirma_tab(driver: webdriver.Chrome):
+def select_efirma_tab(driver: BrowserDriver):
     """Selecciona la pestaña/botón de 'e.firma' de forma robusta."""
     candidates = [
         (By.ID, "buttonFiel"),
@@ -227,58 +261,75 @@ def select_efirma_tab(driver: webdriver.Chrome):
         (By.XPATH, "//a[contains(@class,'nav-link') and contains(translate(.,'E.FIRMA','e.firma'),'e.firma')]"),
     ]
 
-    for locator in candidates:
-        elements = driver.find_elements(*locator)
-        if elements:
-            efirma_btn = elements[0]
+    handles_before = len(driver.window_handles)
+    match = race_locators(driver, candidates, 0, step="login/efirma_tab", action="click")
+    if match:
+        ensure_click_took_effect(driver, match, handles_before)
+        wait_for_dom_settled(driver, "pestana_efirma")
+        print(f" -> E.firma seleccionada por locator {match.locator}.")
+        return
 
-            try:
-                efirma_btn.click()
-                sleep(1)
-                print(f" -> E.firma seleccionada por locator {locator}.")
-                return
-            except Exception:
-                driver.execute_script("arguments[0].click();", efirma_btn)
-                sleep(1)
-                print(f" -> E.firma seleccionada por locator {locator} (JS).")
-                return
-    
+    record_step_failure("login/efirma_tab", candidates)
     if click_by_inner_text_js(driver, ["e.firma", "efirma", "firma", "certificado"]):
-        sleep(1)
+        wait_for_dom_settled(driver, "pestana_efirma")
         print(" -> E.firma seleccionada por texto visible (JS).")
         return
 
     raise NoSuchElementException("No se pudo localizar ni hacer click en la pestaña/botón 'e.firma'.")
 
-def make_file_input_visible(driver: webdriver.chrome.webdriver.WebElement, el: webdriver.remote.webelement.WebElement):
+def make_file_input_visible(driver: BrowserDriver, el: BrowserElement):
     """Hace visible un input[type='file'] para poder enviar la ruta directamente (Workaround de Selenium)."""
-    js = """
-        arguments[0].style.display='block';
-        arguments[0].style.visibility='visible';
-        arguments[0].removeAttribute('disabled');
-        arguments[0].removeAttribute('readonly');
-        arguments[0].style.opacity='1';
-        arguments[0].style.position='fixed';
-        arguments[0].style.zIndex='99999';
-        """
-    driver.execute_script(js, el)
-
-def upload_file_to_any(driver: webdriver.Chrome, locators: List[tuple], absolute_path: str) -> bool:
-    """Intenta subir el archivo a cualquiera de los locators dados."""
-    for locator in locators:
-        elements = driver.find_elements(*locator)
-        if elements:
-            input_el = elements[0]
+    page_call(driver, "act", el, "prepare_file")
+
+def upload_file_to_any(driver: BrowserDriver, locators: List[tuple], absolute_path: str,
+                       step: Optional[str] = None, never_prefer: List[tuple] = ()) -> bool:
+    """Intenta subir el archivo a cualquiera de los locators dados (``never_prefer``: ver race_locators)."""
+    remaining = list(locators)
+    while remaining:
+        # Localizar el input y hacerlo visible en la misma llamada
+        match = race_locators(driver, remaining, 0, step=step, action="prepare_file", never_prefer=never_prefer)
+        if match is None:
+            return False
+        input_el = match.element
+        try:
+            input_el.send_keys(absolute_path)
+            wait_for_file_attached(driver, input_el, f"archivo_{Path(absolute_path).suffix.lstrip('.')}")
+            return True
+        except Exception:
+            # Descartar el input que falló y probar con los demás (match.index se refiere al
+            # orden de la caché de localizadores, no a ``remaining``)
+            record_retry()
+            remaining = [loc for loc in remaining if tuple(loc) != tuple(match.locator)]
+    return False
+
+def upload_file_in_any_frame(driver: BrowserDriver, locators: List[tuple], absolute_path: str, step: str,
+                             never_prefer: List[tuple] = ()):
+    """Sube el archivo en el contexto actual o en los frames con input 'file' según el mapa de frames."""
+    if upload_file_to_any(driver, locators, absolute_path, step=step, never_prefer=never_prefer):
+        return
+
+    resolver = get_frame_resolver(driver)
+    for attempt in range(2):
+        if attempt:
+            record_retry()
+        for path in resolver.frame_map().paths("file"):
             try:
-                make_file_input_visible(driver, input_el)
-                input_el.send_keys(absolute_path)
-                sleep(0.3)
-                return True
+                switch_to_frame_path(driver, path)
+                if upload_file_to_any(driver, locators, absolute_path, step=step, never_prefer=never_prefer):
+                    driver.switch_to.default_content()
+                    return
             except Exception:
                 pass
-    return False
+        # El frame pudo recargarse tras el mapeo: volver a mapear una vez
+        resolver.invalidate()
+    driver.switch_to.default_content()
+
+    record_step_failure(step, locators, never_prefer)
+    raise NoSuchElementException(
+        f"No se pudo subir el archivo {Path(absolute_path).suffix}. No se encontró el input 'file'."
+    )
 
-def upload_efirma_files(driver: webdriver.Chrome, cer_path: str, key_path: str):
+def upload_efirma_files(driver: BrowserDriver, cer_path: str, key_path: str):
     """Carga los archivos .cer y .key."""
     cer = Path(cer_path).resolve()
     key = Path(key_path).resolve()
@@ -299,48 +350,15 @@ def upload_efirma_files(driver: webdriver.Chrome, cer_path: str, key_path: str):
         (By.CSS_SELECTOR, "input[type='file'][accept*='.key' i]"),
         (By.ID, "fileKey"), (By.NAME, "fileKey"),
         (By.XPATH, "//label[contains(translate(normalize-space(.),'LLAVE PRIVADA','llave privada'),'LLAVE PRIVADA')]/following::input[@type='file'][1]"),
-        (By.XPATH, "//input[@type='file'][not(@value)]")
     ]
+    # Comodín: coincide con cualquier input 'file' (incluido el del .cer), así que nunca se aprende
+    key_fallback = [(By.XPATH, "//input[@type='file'][not(@value)]")]
 
-    # Subir .cer (con búsqueda en iframes)
-    if not upload_file_to_any(driver, cer_locators, str(cer)):
-        uploaded = False
-        iframes = driver.find_elements(By.TAG_NAME, "iframe")
-        for frame in iframes:
-            try:
-                driver.switch_to.frame(frame)
-                if upload_file_to_any(driver, cer_locators, str(cer)):
-                    uploaded = True
-                    driver.switch_to.default_content()
-                    break
-            except Exception:
-                pass
-            finally:
-                driver.switch_to.default_content()
-        
-        if not uploaded:
-            raise NoSuchElementException("No se pudo subir el archivo .cer. No se encontró el input 'file'.")
-
-    # Subir .key (con búsqueda en iframes)
-    if not upload_file_to_any(driver, key_locators, str(key)):
-        uploaded = False
-        iframes = driver.find_elements(By.TAG_NAME, "iframe")
-        for frame in iframes:
-            try:
-                driver.switch_to.frame(frame)
-                if upload_file_to_any(driver, key_locators, str(key)):
-                    uploaded = True
-                    driver.switch_to.default_content()
-                    break
-            except Exception:
-                pass
-            finally:
-                driver.switch_to.default_content()
-        
-        if not uploaded:
-            raise NoSuchElementException("No se pudo subir el archivo .key. No se encontró el input 'file'.")
+    # Subir .cer y .key (con búsqueda en iframes)
+    upload_file_in_any_frame(driver, cer_locators, str(cer), "login/cer")
+    upload_file_in_any_frame(driver, key_locators + key_fallback, str(key), "login/key", never_prefer=key_fallback)
 
-def enter_key_password_and_sign(driver: webdriver.Chrome, key_password: str):
+def enter_key_password_and_sign(driver: BrowserDriver, key_password: str):
     """Ingresa la contraseña y hace clic en el botón de Firmar/Enviar."""
     switch_to_login_frame_if_any(driver)
 
@@ -350,12 +368,13 @@ def enter_key_password_and_sign(driver: webdriver.Chrome, key_password: str):
         (By.XPATH, "//label[contains(translate(.,'ÁÉÍÓÚáéíóú','AEIOUaeiou'),'CONTRASENA')]/following::input[@type='password'][1]")
     ]
 
-    pwd = find_first_present(driver, *pwd_locators)
-    if pwd is None:
+    # Localizar y limpiar el campo en la misma llamada
+    match = race_locators(driver, pwd_locators, WAIT_FOR_ELEMENT_SECONDS, step="login/password", action="clear")
+    if match is None:
+        record_step_failure("login/password", pwd_locators)
         raise NoSuchElementException("No encontré el campo de contraseña de la e.firma.")
 
-    pwd.clear()
-    pwd.send_keys(key_password)
+    match.element.send_keys(key_password)
 
     sign_btn_locators = [
         (By.XPATH, "//button[contains(translate(.,'ENVIAR','enviar'),'enviar')]"),
@@ -364,185 +383,679 @@ def enter_key_password_and_sign(driver: webdriver.Chrome, key_password: str):
         (By.XPATH, "//button[contains(.,'Firmar') or contains(.,'Ingresar') or contains(.,'Acceder')]"),
     ]
 
-    sign_btn = find_first_clickable(driver, *sign_btn_locators)
+    sign_btn = find_first_clickable(driver, *sign_btn_locators, step="login/sign_button")
 
     if sign_btn is None:
+        record_step_failure("login/sign_button", sign_btn_locators)
         raise NoSuchElementException("No encontré el botón para firmar con e.firma (Firmar/Enviar).")
 
+    previous_url = driver.current_url
     sign_btn.click()
-    sleep(2)
+    wait_for_url_change(driver, previous_url, "firma_enviada", stale_element=sign_btn)
 
 
 # =======================================================
 # 4. UTILIDADES DE DESCARGA
 # =======================================================
 
-def snapshot_filenames(directory: Path) -> Set[str]:
-    """Obtiene los nombres de los archivos en un directorio."""
+def rfc_from_certificate(cer_path: str) -> Optional[str]:
+    """Extrae el RFC del certificado (.cer DER) leyendo el atributo x500UniqueIdentifier."""
+    # OID 2.5.4.45 (x500UniqueIdentifier) codificado en DER
+    oid = bytes([0x06, 0x03, 0x55, 0x04, 0x2D])
     try:
-        return {p.name for p in directory.iterdir() if p.is_file()}
-    except FileNotFoundError:
-        return set()
-    except Exception:
-        return set()
-
-def wait_for_new_pdf_download(download_dir: Path, known_files: Set[str], timeout_seconds: float) -> Optional[Path]:
-    """Espera a que un nuevo archivo PDF aparezca en el directorio de descarga."""
-    start_time = time.time()
-    
-    while time.time() - start_time < timeout_seconds:
-        current_files = snapshot_filenames(download_dir)
-        new_files = current_files - known_files
-
-        for name in new_files:
-            # Si termina en .pdf y NO es un archivo de descarga parcial de Chrome (.crdownload)
-            if name.lower().endswith(".pdf") and not name.endswith(".crdownload"):
-                new_path = download_dir / name
-                sleep(1) 
-                return new_path
-
-        sleep(1)
-        
-    return None
+        data = Path(cer_path).read_bytes()
+    except OSError:
+        return None
+
+    # El emisor (SAT) también trae este atributo; el del sujeto es la última aparición
+    idx = data.rfind(oid)
+    if idx < 0:
+        return None
+    # Tras el OID viene el valor: tag (1 byte) + longitud corta (1 byte) + texto "RFC / CURP"
+    pos = idx + len(oid)
+    if pos + 2 > len(data) or data[pos + 1] & 0x80:
+        return None
+    length = data[pos + 1]
+    value = data[pos + 2:pos + 2 + length].decode("latin-1", errors="ignore")
+    rfc = value.split("/")[0].strip().upper()
+    return rfc or None
+
+def build_final_pdf_name(rfc: str, when: Optional[datetime] = None) -> str:
+    """Nombre final del PDF a partir del RFC y la fecha/hora de descarga."""
+    when = when or datetime.now()
+    safe_rfc = "".join(c for c in rfc.upper() if c.isalnum() or c == "&") or "SIN_RFC"
+    return FINAL_PDF_NAME_TEMPLATE.format(rfc=safe_rfc, timestamp=when.strftime("%Y%m%d_%H%M%S"))
+
+def create_job_download_dir(download_dir: Path) -> Path:
+    """Crea un subdirectorio de descarga exclusivo para un trabajo dentro de download_dir."""
+    download_dir.mkdir(parents=True, exist_ok=True)
+    return Path(tempfile.mkdtemp(prefix=JOB_DOWNLOAD_DIR_PREFIX, dir=str(download_dir)))
+
+def move_pdf_atomically(source: Path, destination: Path) -> Path:
+    """Mueve el PDF a su destino final de forma atómica (mismo sistema de archivos)."""
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(str(source), str(destination))
+    return destination
 
 
 # =======================================================
 # 5. FUNCIÓN PRINCIPAL DE AUTOMATIZACIÓN (CORE)
 # =======================================================
 
-def run_sat_automation_core(cer_path: str, key_path: str, key_pass: str, download_dir: Path) -> Path:
-    """Función de automatización de Selenium para el SAT."""
-    final_pdf_path = None
-    main_handle = None
-    driver = None
+def set_portal_base_url(base_url: str):
+    """Apunta el flujo a otro servidor con las mismas rutas (e.g., el portal simulado de sat_mock_portal)."""
+    global SAT_PORTAL_BASE_URL, SAT_LOGIN_URL, SAT_MODULE_URL, SAT_COOKIE_DOMAIN
+    SAT_PORTAL_BASE_URL = base_url.rstrip("/")
+    SAT_LOGIN_URL = SAT_PORTAL_BASE_URL + SAT_LOGIN_PATH
+    SAT_MODULE_URL = SAT_PORTAL_BASE_URL + SAT_MODULE_PATH
+    SAT_COOKIE_DOMAIN = urlsplit(SAT_PORTAL_BASE_URL).hostname or SAT_COOKIE_DOMAIN
+
+def is_sat_portal() -> bool:
+    """True si el flujo apunta al portal real del SAT y no a un servidor local (e.g., sat_mock_portal)."""
+    host = urlsplit(SAT_PORTAL_BASE_URL).hostname or ""
+    return host == "sat.gob.mx" or host.endswith(".sat.gob.mx")
+
+def portal_origins() -> List[str]:
+    """Orígenes cuyo almacenamiento usa el flujo con el portal configurado (ver set_portal_base_url)."""
+    origins = []
+    for url in (SAT_PORTAL_BASE_URL, SAT_LOGIN_URL, SAT_MODULE_URL):
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        if origin not in origins:
+            origins.append(origin)
+    if is_sat_portal():
+        origins += [o for o in SAT_IDP_ORIGINS if o not in origins]
+    return origins
+
+def build_chrome_options(download_dir: Path, lean: bool = False) -> Options:
+    """Construye las opciones de Chrome (headless, descargas automáticas de PDF; perfil ligero opcional)."""
+    prefs = {
+        "download.prompt_for_download": False,
+        "download.default_directory": str(download_dir.resolve()),
+        "download.directory_upgrade": True,
+        "safebrowsing.enabled": True,
+        "plugins.always_open_pdf_externally": True, # Desactiva el visor de PDF de Chrome
+    }
+    if lean:
+        prefs.update(LEAN_PREFS)
+
+    opts = Options()
+    opts.add_experimental_option("prefs", prefs)
+    # Log de rendimiento solo con eventos de Page: permite detectar el fin de la descarga por CDP
+    opts.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    opts.add_experimental_option("perfLoggingPrefs", {"enableNetwork": False, "enablePage": True})
+    opts.add_argument("--window-size=1366,900")
+    opts.add_argument("--disable-popup-blocking")
+
+    # Opciones Headless (se recomienda para entornos de servidor)
+    opts.add_argument("--headless=new")
+    opts.add_argument("--no-sandbox")
+    opts.add_argument("--disable-dev-shm-usage")
+    if lean:
+        for arg in LEAN_CHROME_ARGS:
+            opts.add_argument(arg)
+    return opts
+
+def create_chrome_driver(download_dir: Path, lean: Optional[bool] = None, backend: Optional[str] = None) -> BrowserDriver:
+    """Inicializa un driver listo para la automatización (por defecto: LEAN_BROWSER y DRIVER_BACKEND)."""
+    lean = LEAN_BROWSER if lean is None else lean
+    backend = backend or DRIVER_BACKEND
+    if backend not in DRIVER_BACKENDS:
+        raise ValueError(f"Backend de navegador desconocido: {backend} (use uno de {DRIVER_BACKENDS})")
+    download_dir.mkdir(parents=True, exist_ok=True)
+    opts = build_chrome_options(download_dir, lean)
 
     try:
-        # Configuración de Chrome Options
-        download_dir.mkdir(parents=True, exist_ok=True)
-        
-        prefs = {
-            "download.prompt_for_download": False,
-            "download.default_directory": str(download_dir.resolve()),
-            "download.directory_upgrade": True,
-            "safebrowsing.enabled": True,
-            "plugins.always_open_pdf_externally": True, # Desactiva el visor de PDF de Chrome
-        }
-
-        opts = Options()
-        opts.add_experimental_option("prefs", prefs)
-        opts.add_argument("--window-size=1366,900")
-        opts.add_argument("--disable-popup-blocking")
-        
-        # Opciones Headless (se recomienda para entornos de servidor)
-        opts.add_argument("--headless=new")
-        opts.add_argument("--no-sandbox")
-        opts.add_argument("--disable-dev-shm-usage")
-        
-        # Inicializar WebDriver
-        try:
+        if backend == "cdp":
+            from sat_cdp_driver import create_cdp_driver
+            driver = create_cdp_driver(opts)
+        else:
             driver = webdriver.Chrome(options=opts)
-        except WebDriverException as e:
-            # Captura errores de inicialización (e.g., ChromeDriver no encontrado)
-            raise RuntimeError(f"Error al inicializar WebDriver: {e}")
-            
-        driver.implicitly_wait(0)
-        wait = WebDriverWait(driver, TIMEOUT_DURATION_SECONDS)
-
-        # 1) Navegar a la página de login
+    except WebDriverException as e:
+        # Captura errores de inicialización (e.g., ChromeDriver no encontrado)
+        raise RuntimeError(f"Error al inicializar WebDriver: {e}")
+
+    driver.implicitly_wait(0)
+    count_round_trips(driver)
+    install_page_runtime(driver)
+    if lean and enable_url_blocking(driver, blocked_url_patterns()):
+        print("Modo ligero: imágenes, fuentes y trackers bloqueados.")
+    return driver
+
+def close_extra_windows(driver: BrowserDriver, main_handle: Optional[str]):
+    """Cierra las pestañas abiertas por el flujo y regresa a la ventana principal."""
+    try:
+        handles = driver.window_handles
+        if main_handle is None:
+            main_handle = handles[0]
+        for handle in handles:
+            if handle != main_handle:
+                driver.switch_to.window(handle)
+                driver.close()
+        driver.switch_to.window(main_handle)
+    except Exception:
+        pass
+
+_GENERAR_FORM_JS = """
+    const btn = arguments[0];
+    const form = btn.form || btn.closest('form');
+    if (!form) return null;
+    const fields = [];
+    for (const [name, value] of new FormData(form).entries()) {
+        if (typeof value === 'string') fields.push([name, value]);
+    }
+    // El botón que envía el formulario (JSF/PrimeFaces lo identifica por su name)
+    if (btn.name) fields.push([btn.name, btn.value || btn.name]);
+    return {
+        action: new URL(form.getAttribute('action') || location.href, location.href).href,
+        method: (form.getAttribute('method') || 'GET').toUpperCase(),
+        fields: fields,
+        userAgent: navigator.userAgent,
+        referer: location.href,
+    };
+"""
+
+def download_constancia_direct(driver: BrowserDriver, destination: Path) -> Optional[StreamedFile]:
+    """Envía el formulario de 'Generar Constancia' por HTTP con las cookies del driver y guarda el PDF.
+
+    Devuelve None (sin efectos en el navegador) si el botón no pertenece a un formulario
+    o la respuesta no es un PDF; en ese caso se usa el flujo con click.
+    """
+    resolver = get_frame_resolver(driver)
+    if not resolver.switch_to("generar"):
+        return None
+    try:
+        match = race_locators(driver, GENERAR_CONSTANCIA_LOCATORS, WAIT_FOR_ELEMENT_SECONDS, step="constancia/generar")
+        form = driver.execute_script(_GENERAR_FORM_JS, match.element) if match else None
+    finally:
+        driver.switch_to.default_content()
+    if not form:
+        return None
+
+    cookies = driver.execute_cdp_cmd("Network.getAllCookies", {}).get("cookies", [])
+    headers = {
+        "User-Agent": form["userAgent"],
+        "Referer": form["referer"],
+        "Accept": "application/pdf,*/*",
+    }
+    body = urlencode(form["fields"]).encode("utf-8")
+    url = form["action"]
+    if form["method"] == "POST":
+        headers["Content-Type"] = "application/x-www-form-urlencoded"
+        response = http_request("POST", url, headers=headers, body=body, cookies=cookies)
+    else:
+        response = http_request("GET", f"{url.split('?')[0]}?{body.decode()}", headers=headers, cookies=cookies)
+
+    if response.status != 200 or "pdf" not in response.header("Content-Type").lower():
+        print(f" -> Descarga directa no disponible (HTTP {response.status}, {response.header('Content-Type')}).")
+        response.finish()
+        return None
+
+    streamed = stream_response_to_file(response, destination,
+                                       keep_content=EXTRACT_CONSTANCIA_FIELDS or USE_CONSTANCIA_STORE)
+    if not has_pdf_markers(streamed.path):
+        print(" -> La respuesta directa no es un PDF completo; se usará el click.")
+        streamed.path.unlink()
+        return None
+    return streamed
+
+def submit_constancia_extraction(pdf_path: Path, rfc: str, content: Optional[bytes] = None):
+    """Envía la constancia al pool de extracción; el registro se agrega a CONSTANCIA_RECORDS_FILENAME."""
+    if not EXTRACT_CONSTANCIA_FIELDS:
+        return
+    from sat_constancia_extract import get_extractor
+    try:
+        pdf = content if content is not None else pdf_path.read_bytes()
+        get_extractor().submit(pdf, pdf_path.name, pdf_path.parent / CONSTANCIA_RECORDS_FILENAME)
+    except Exception as e:
+        print(f"[EXTRACCIÓN] No se pudo programar la extracción de {rfc}: {type(e).__name__}: {e}")
+
+def fresh_constancia(cert: Optional[CertificateInfo], download_dir: Path) -> Optional[Path]:
+    """Constancia vigente del RFC copiada desde el almacén a download_dir, o None si hay que descargarla.
+
+    ``cert`` es el resultado de check_efirma_before_browser: sin una e.firma validada
+    (llave del certificado y contraseña correctas) no se consulta el almacén, porque
+    tener el .cer (público) no basta para recibir la constancia.
+    """
+    if not USE_CONSTANCIA_STORE or cert is None or not cert.rfc:
+        return None
+    rfc = cert.rfc
+    store = get_constancia_store()
+    try:
+        entry = store.lookup(rfc)
+        if not entry:
+            return None
+        when = datetime.fromtimestamp(entry.fetched_at)
+        pdf_path = store.materialize(entry, download_dir / build_final_pdf_name(rfc, when))
+    except OSError as e:
+        print(f"[ALMACÉN] No se pudo leer el almacén de constancias: {e}")
+        return None
+    print(f"Constancia de {rfc} reutilizada del almacén (descargada hace {entry.age_seconds() / 60:.0f} min).")
+    print(f" -> PDF en: {pdf_path.resolve()}")
+    return pdf_path
+
+def store_constancia(pdf_path: Path, rfc: Optional[str], content: Optional[bytes] = None):
+    """Guarda la constancia recién descargada en el almacén (deduplicada por contenido).
+
+    ``rfc`` debe ser el leído del certificado; sin él no se guarda (el nombre del archivo
+    .cer no identifica al contribuyente).
+    """
+    if not USE_CONSTANCIA_STORE:
+        return
+    if not rfc:
+        print(f"[ALMACÉN] No se leyó el RFC del certificado; {pdf_path.name} no se guarda en el almacén.")
+        return
+    try:
+        get_constancia_store().put(rfc, content if content is not None else pdf_path.read_bytes())
+    except OSError as e:
+        print(f"[ALMACÉN] No se pudo guardar la constancia de {rfc}: {e}")
+
+_preflight_skip_reported = False
+
+def check_efirma_before_browser(cer_path: str, key_path: str, key_pass: str) -> Optional[CertificateInfo]:
+    """Falla en milisegundos si la e.firma no sirve, antes de ocupar un navegador (ver sat_efirma).
+
+    Devuelve el certificado validado, o None si no se validó (EFIRMA_PREFLIGHT desactivado
+    o sin ``cryptography``); en ese caso tampoco se reutilizan constancias del almacén.
+    """
+    global _preflight_skip_reported
+    if not EFIRMA_PREFLIGHT:
+        return None
+    if not crypto_available():
+        if not _preflight_skip_reported:
+            _preflight_skip_reported = True
+            print("[E.FIRMA] Validación previa omitida: requiere el paquete 'cryptography' "
+                  "(tampoco se reutilizan constancias del almacén).")
+        if not Path(cer_path).exists() or not Path(key_path).exists():
+            raise FileNotFoundError(f"Rutas de e.firma inválidas o inaccesibles: {cer_path} / {key_path}")
+        return None
+    cert = preflight_efirma(cer_path, key_path, key_pass)
+    print(f"e.firma de {cert.rfc} válida (serie {cert.serial}, vigente hasta {cert.not_after:%Y-%m-%d}).")
+    return cert
+
+def set_download_directory(driver: BrowserDriver, download_dir: Path):
+    """Redirige las descargas de todas las pestañas de un driver ya iniciado (CDP)."""
+    download_dir.mkdir(parents=True, exist_ok=True)
+    driver.execute_cdp_cmd("Browser.setDownloadBehavior", {
+        "behavior": "allow",
+        "downloadPath": str(download_dir.resolve()),
+        "eventsEnabled": True,
+    })
+
+def login_with_efirma(driver: BrowserDriver, cer_path: str, key_path: str, key_pass: str):
+    """Pasos 1-6: navega al login, firma con e.firma y espera el regreso al módulo."""
+    wait = WebDriverWait(driver, TIMEOUT_DURATION_SECONDS)
+
+    # 1) Navegar a la página de login
+    with stage_span("1", "navegar_login") as span:
         try:
-            driver.get("https://wwwmat.sat.gob.mx/aplicacion/login/53027/genera-tu-constancia-de-situacion-fiscal")
+            driver.get(SAT_LOGIN_URL)
             wait.until(lambda d: "login" in d.current_url or "nidp" in d.current_url)
         except TimeoutException:
-            driver.get("https://wwwmat.sat.gob.mx/aplicacion/53027/genera-tu-constancia-de-situacion-fiscal")
+            record_retry()
+            driver.get(SAT_MODULE_URL)
             ejecutar = wait.until(
                     EC.element_to_be_clickable((By.XPATH, "//a[contains(.,'Ejecutar en línea') or contains(.,'Ejecutar en linea')]"))
             )
             ejecutar.click()
             wait.until(lambda d: "login" in d.current_url or "nidp" in d.current_url)
+        span.attributes.update(page_load_stats(driver))
 
-        # 2) Entrar a iframe de login
+    # 2) Entrar a iframe de login
+    with stage_span("2", "frame_login"):
         switch_to_login_frame_if_any(driver)
 
-        # 3) Seleccionar e.firma
-        print("Intentando seleccionar e.firma...")
+    # 3) Seleccionar e.firma
+    print("Intentando seleccionar e.firma...")
+    with stage_span("3", "pestana_efirma"):
         select_efirma_tab(driver)
-        sleep(1.5)
         switch_to_login_frame_if_any(driver)
+        wait_for_network_idle(driver, "formulario_efirma")
 
-        # 4) Cargar .cer y .key
-        print("Cargando archivos .cer y .key...")
+    # 4) Cargar .cer y .key
+    print("Cargando archivos .cer y .key...")
+    with stage_span("4", "cargar_archivos"):
         upload_efirma_files(driver, cer_path, key_path)
 
-        # 5) Contraseña de la llave y firmar
-        print("Ingresando contraseña y firmando...")
+    # 5) Contraseña de la llave y firmar
+    print("Ingresando contraseña y firmando...")
+    with stage_span("5", "firmar"):
         enter_key_password_and_sign(driver, key_pass)
 
-        # 6) Esperar retorno al módulo
+    # 6) Esperar retorno al módulo
+    with stage_span("6", "redireccion_modulo") as span:
         wait.until(lambda d: "genera-tu-constancia-de-situacion-fiscal" in d.current_url)
-        print("¡Inicio de sesión con e.firma exitoso!")
+        span.attributes.update(page_load_stats(driver))
+    print("¡Inicio de sesión con e.firma exitoso!")
+
+def capture_session(driver: BrowserDriver) -> tuple:
+    """Obtiene cookies del SAT (CDP) y el local/sessionStorage del módulo ya autenticado."""
+    cookies = [
+        c for c in driver.execute_cdp_cmd("Network.getAllCookies", {}).get("cookies", [])
+        if SAT_COOKIE_DOMAIN in c.get("domain", "")
+    ]
+    driver.switch_to.default_content()
+    local_storage, session_storage = driver.execute_script(
+        "return [Object.assign({}, window.localStorage), Object.assign({}, window.sessionStorage)];"
+    )
+    return cookies, local_storage or {}, session_storage or {}
+
+def restore_session(driver: BrowserDriver, session: SavedSession) -> bool:
+    """Restaura cookies y storage y confirma que el portal acepta la sesión (muestra el módulo)."""
+    allowed = ("name", "value", "domain", "path", "secure", "httpOnly", "sameSite", "expires")
+    cookies = []
+    for cookie in session.cookies:
+        param = {k: v for k, v in cookie.items() if k in allowed}
+        if cookie.get("session") or param.get("expires", 0) < 0:
+            param.pop("expires", None)
+        cookies.append(param)
+    driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookies})
+
+    script_id = None
+    if session.local_storage or session.session_storage:
+        source = (
+            "(function(ls, ss){ if (!location.hostname.endsWith(%s)) return;"
+            " try { for (const k in ls) localStorage.setItem(k, ls[k]);"
+            " for (const k in ss) sessionStorage.setItem(k, ss[k]); } catch (e) {} })(%s, %s);"
+            % (json.dumps(SAT_COOKIE_DOMAIN), json.dumps(session.local_storage), json.dumps(session.session_storage))
+        )
+        script_id = driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": source}).get("identifier")
+
+    resolver = get_frame_resolver(driver)
 
-        # 6.5) Scroll horizontal
-        print("Realizando scroll horizontal hacia la derecha para localizar 'Generar Constancia'...")
+    def outcome(d):
+        if "nidp" in d.current_url:
+            return "rechazada"
+        if resolver.switch_to("generar"):
+            return "valida"
+        if resolver.frame_for("password") is not None or resolver.frame_for("file") is not None:
+            return "rechazada"
+        return None
+
+    try:
+        driver.get(SAT_LOGIN_URL)
+        result = WebDriverWait(driver, SESSION_CHECK_TIMEOUT_SECONDS).until(outcome)
+    except TimeoutException:
+        result = "rechazada"
+    finally:
+        driver.switch_to.default_content()
+        if script_id:
+            driver.execute_cdp_cmd("Page.removeScriptToEvaluateOnNewDocument", {"identifier": script_id})
+    return result == "valida"
+
+class FlowState:
+    """Estado reanudable de un trabajo sobre un driver vivo: último punto de control, ventanas y sesión."""
+
+    def __init__(self, job_dir: Path):
+        self.job_dir = job_dir
+        self.checkpoint: Optional[str] = None  # Último punto de control alcanzado (ver FLOW_CHECKPOINTS)
+        self.authenticated = False
+        self.main_handle: Optional[str] = None
+        self.pdf_handle: Optional[str] = None
+        self.generar_frame = None  # Ruta de frames donde estaba 'Generar Constancia'
+        self.resumes = 0
+
+    def reach(self, checkpoint: str):
+        self.checkpoint = checkpoint
+
+    def to_dict(self) -> dict:
+        return {
+            "checkpoint": self.checkpoint,
+            "authenticated": self.authenticated,
+            "main_handle": self.main_handle,
+            "pdf_handle": self.pdf_handle,
+            "generar_frame": list(self.generar_frame) if self.generar_frame else None,
+            "resumes": self.resumes,
+        }
+
+
+def is_driver_usable(driver: BrowserDriver) -> bool:
+    """False si Chrome o la sesión de WebDriver murieron (no hay nada que reanudar)."""
+    try:
+        driver.window_handles
+        return True
+    except Exception:
+        # Con chromedriver caído, urllib3 lanza sus propios errores de conexión
+        return False
+
+def can_resume(error: BaseException, driver: BrowserDriver) -> bool:
+    """Solo las fallas transitorias de una etapa se reanudan; un driver caído exige reiniciar el trabajo."""
+    return isinstance(error, RESUMABLE_ERRORS) and is_driver_usable(driver)
+
+def return_to_module(driver: BrowserDriver, state: FlowState):
+    """Punto de reanudación tras el login: cierra pestañas del intento fallido y recarga el módulo.
+
+    Si el portal pide login de nuevo, la sesión se perdió y se marca como no autenticada.
+    """
+    close_extra_windows(driver, state.main_handle)
+    state.pdf_handle = None
+    driver.switch_to.default_content()
+    driver.get(SAT_MODULE_URL)
+    WebDriverWait(driver, TIMEOUT_DURATION_SECONDS).until(
+        lambda d: SAT_MODULE_PATH in d.current_url or "login" in d.current_url or "nidp" in d.current_url
+    )
+    if SAT_MODULE_PATH not in driver.current_url:
+        print(" -> El portal pidió login de nuevo: la sesión se perdió.")
+        state.authenticated = False
+        state.checkpoint = None
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+
+def run_sat_flow(driver: BrowserDriver, cer_path: str, key_path: str, key_pass: str, download_dir: Path,
+                 reuse_session: bool = True) -> Path:
+    """Ejecuta el flujo completo (login con e.firma y descarga) sobre un driver ya iniciado.
+
+    Si hay una sesión guardada y vigente para el certificado, se omite el login; si el
+    portal la rechaza, se descarta y se hace el login completo. Cada etapa se mide con
+    un span (ver sat_telemetry). Si una etapa falla de forma transitoria, el flujo se
+    reanuda en el mismo driver desde el último punto de control (ver FlowState).
+    """
+    # El RFC del certificado indexa el almacén; el nombre del .cer solo sirve para nombrar archivos
+    cert_rfc = rfc_from_certificate(cer_path)
+    rfc = cert_rfc or Path(cer_path).stem
+    session_store = get_session_store() if reuse_session else None
+    reset_wait_timings()
+    trace = start_trace(rfc)
+    round_trips = count_round_trips(driver)
+    round_trips_start = round_trips.count
+    error = None
+
+    # Cada trabajo descarga en su propio subdirectorio para no competir con otras sesiones
+    job_dir = create_job_download_dir(download_dir)
+    state = FlowState(job_dir)
+
+    try:
+        set_download_directory(driver, job_dir)
+        while True:
+            try:
+                if state.resumes and state.authenticated:
+                    with stage_span("R", "reanudar_modulo"):
+                        return_to_module(driver, state)
+                return _run_flow_stages(driver, state, rfc, cert_rfc, cer_path, key_path, key_pass,
+                                        download_dir, session_store)
+            except Exception as e:
+                if state.resumes >= FLOW_MAX_RESUMES or not can_resume(e, driver):
+                    raise
+                state.resumes += 1
+                print(f"[REANUDAR] {type(e).__name__} tras el punto de control '{state.checkpoint or 'inicio'}'; "
+                      f"reanudando en el mismo navegador ({state.resumes}/{FLOW_MAX_RESUMES})...")
+
+    except BaseException as e:
+        error = e
+        raise
+
+    finally:
+        # Lógica de cierre de ventanas/pestañas
+        if state.main_handle:
+            close_extra_windows(driver, state.main_handle)
+        shutil.rmtree(job_dir, ignore_errors=True)
+        timings = get_wait_timings()
+        if timings:
+            print(" -> Esperas por condición (latencia real del portal):")
+            print(format_wait_timings(timings))
+        trace.attributes["round_trips"] = round_trips.count - round_trips_start
+        trace.attributes["flow_state"] = state.to_dict()
+        print(f" -> Viajes a WebDriver en este trabajo: {trace.attributes['round_trips']}")
+        finish_trace("error" if error else "ok", error)
+        if trace.spans:
+            print(" -> Etapas del flujo:")
+            print(format_trace(trace))
+
+def _run_flow_stages(driver: BrowserDriver, state: FlowState, rfc: str, cert_rfc: Optional[str], cer_path: str,
+                     key_path: str, key_pass: str, download_dir: Path, session_store) -> Path:
+    """Etapas 0-8 a partir del punto de control de ``state``.
+
+    ``cert_rfc`` es el RFC leído del certificado (o None); solo con él se guarda en el almacén.
+    """
+    job_dir = state.job_dir
+
+    # 1-6) Reutilizar la sesión autenticada del RFC o hacer login con e.firma
+    if not state.authenticated:
+        fingerprint = certificate_fingerprint(cer_path) if session_store else None
+        session = session_store.load(rfc, fingerprint) if session_store else None
+        restored = False
+        if session:
+            with stage_span("0", "restaurar_sesion") as span:
+                restored = restore_session(driver, session)
+                span.outcome = "ok" if restored else "rechazada"
+        if restored:
+            print(f"Sesión reutilizada para {rfc} (vigente hasta {datetime.fromtimestamp(session.expires_at):%H:%M:%S}).")
+        else:
+            if session:
+                print(f"La sesión guardada de {rfc} fue rechazada; se hará login completo.")
+                session_store.invalidate(rfc, fingerprint)
+                driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            login_with_efirma(driver, cer_path, key_path, key_pass)
+            if session_store:
+                try:
+                    session_store.save(rfc, fingerprint, *capture_session(driver))
+                except Exception as e:
+                    print(f"[SESIÓN] No se pudo guardar la sesión de {rfc}: {e}")
+        driver.switch_to.default_content()
+        state.authenticated = True
+        state.main_handle = driver.current_window_handle
+        state.reach("sesion")
+
+    # 6.5) Scroll horizontal
+    print("Realizando scroll horizontal hacia la derecha para localizar 'Generar Constancia'...")
+    with stage_span("6.5", "scroll_horizontal"):
         scroll_horizontal_all_the_way(driver)
-        sleep(1)
+        wait_for_dom_settled(driver, "scroll_horizontal")
+    state.reach("modulo")
 
-        # 7) HACER CLIC EN GENERAR CONSTANCIA
-        main_handle = driver.current_window_handle
+    # 6.8) DESCARGA DIRECTA: enviar el formulario por HTTP y escribir el PDF en su destino final
+    if DIRECT_PDF_DOWNLOAD:
+        final_pdf_path = download_dir / build_final_pdf_name(rfc)
+        with stage_span("6.8", "descarga_directa") as span:
+            try:
+                streamed = download_constancia_direct(driver, final_pdf_path)
+            except Exception as e:
+                print(f" -> Falló la descarga directa, se usará el click: {type(e).__name__}: {e}")
+                span.error = type(e).__name__
+                streamed = None
+            if streamed:
+                span.attributes["bytes"] = streamed.size_bytes
+            else:
+                span.outcome = "fallback"
+        if streamed:
+            print(f" -> PDF descargado por HTTP directo: {streamed.size_bytes} bytes en "
+                  f"{streamed.elapsed_seconds:.2f} s ({streamed.bytes_per_second / 1024:.1f} KiB/s)")
+            print(f" -> PDF guardado en: {final_pdf_path.resolve()}")
+            state.reach("descargado")
+            store_constancia(final_pdf_path, cert_rfc, streamed.content)
+            submit_constancia_extraction(final_pdf_path, rfc, streamed.content)
+            return final_pdf_path
+
+    # 7) HACER CLIC EN GENERAR CONSTANCIA
+    main_handle = state.main_handle
+    before_files = snapshot_filenames(job_dir)
+    drain_cdp_download_events(driver)  # Descartar eventos de descargas anteriores
+    with stage_span("7", "generar_constancia"):
         click_generar_constancia_btn(driver)
-        print("✅ Botón 'Generar Constancia' presionado.")
+    state.generar_frame = get_frame_resolver(driver).cached_frame_for("generar")
+    state.reach("generar")
+    print("✅ Botón 'Generar Constancia' presionado.")
 
-        # 7.5) MANEJO DE NUEVA VENTANA / PESTAÑA DEL PDF
-        print("Esperando que se abra la pestaña con la constancia (hasta 15 s)...")
-        
-        # Función auxiliar para encontrar el nuevo handle
-        def get_new_handle(driver, main_handle):
-            handles = driver.window_handles
-            if len(handles) > 1:
-                return next((h for h in handles if h != main_handle), None)
-            return None
+    # 7.5) MANEJO DE NUEVA VENTANA / PESTAÑA DEL PDF
+    print("Esperando que se abra la pestaña con la constancia (hasta 15 s)...")
 
+    # Función auxiliar para encontrar el nuevo handle
+    def get_new_handle(driver, main_handle):
+        handles = driver.window_handles
+        if len(handles) > 1:
+            return next((h for h in handles if h != main_handle), None)
+        return None
+
+    with stage_span("7.5", "pestana_pdf"):
         pdf_handle = WebDriverWait(driver, 15).until(lambda d: get_new_handle(d, main_handle))
 
         if pdf_handle:
             driver.switch_to.window(pdf_handle)
+            state.pdf_handle = pdf_handle
             print(f" -> Cambiado a pestaña del PDF: {driver.current_url}")
         else:
             driver.switch_to.window(main_handle)
             print(f" -> Seguimos en la ventana principal: {driver.current_url}")
+    state.reach("pestana_pdf")
+
+    # 8) OBTENER EL PDF POR DESCARGA AUTOMÁTICA
+    print("Iniciando espera de la descarga automática del PDF (máx 120 segundos)...")
+    with stage_span("8", "descarga_pdf") as span:
+        download = wait_for_pdf_download(job_dir, before_files, 120, driver)
+        if download:
+            span.attributes.update(bytes=download.size_bytes, source=download.source)
+        else:
+            span.outcome = "timeout"
+
+    if download:
+        final_pdf_path = download_dir / build_final_pdf_name(rfc)
+        move_pdf_atomically(download.path, final_pdf_path)
+        state.reach("descargado")
+        print(f" -> Descarga completa ({download.source}): {download.size_bytes} bytes "
+              f"en {download.elapsed_seconds:.2f} s ({download.bytes_per_second / 1024:.1f} KiB/s)")
+
+        print(f" -> PDF detectado por descarga automática en: {final_pdf_path.resolve()}")
+        content = final_pdf_path.read_bytes() if USE_CONSTANCIA_STORE or EXTRACT_CONSTANCIA_FIELDS else None
+        store_constancia(final_pdf_path, cert_rfc, content)
+        submit_constancia_extraction(final_pdf_path, rfc, content)
+        return final_pdf_path
+    else:
+        raise TimeoutException("No se detectó la descarga automática del PDF en 120 segundos.")
 
-        # 8) OBTENER EL PDF POR DESCARGA AUTOMÁTICA
-        print("Iniciando espera de la descarga automática del PDF (máx 120 segundos)...")
-        before_files = snapshot_filenames(download_dir)
+def run_sat_automation_core(cer_path: str, key_path: str, key_pass: str, download_dir: Path) -> Path:
+    """Función de automatización de Selenium para el SAT."""
+    driver = None
 
-        new_file = wait_for_new_pdf_download(download_dir, before_files, 120)
+    # Constancia reciente del mismo RFC (ya con la e.firma validada): no hace falta abrir el navegador
+    cert = check_efirma_before_browser(cer_path, key_path, key_pass)
+    cached = fresh_constancia(cert, download_dir)
+    if cached:
+        return cached
 
-        if new_file:
-            final_pdf_path = download_dir / DEFAULT_FINAL_PDF_NAME
-            if final_pdf_path.exists():
-                final_pdf_path.unlink() # Borrar el archivo si ya existe
-            
-            new_file.rename(final_pdf_path) # Mover/renombrar
-            
-            print(f" -> PDF detectado por descarga automática en: {final_pdf_path.resolve()}")
-            return final_pdf_path
+    governor = get_resource_governor() if RESOURCE_GOVERNOR else None
+    worker = f"local-{os.getpid()}"
+    try:
+        # Inicializar WebDriver (si hay memoria para otro Chrome)
+        if governor:
+            governor.reserve_launch(timeout=120)
+            try:
+                driver = create_chrome_driver(download_dir)
+            except Exception:
+                governor.cancel_launch()
+                raise
+            governor.register(worker, driver)
         else:
-            raise TimeoutException("No se detectó la descarga automática del PDF en 120 segundos.")
+            driver = create_chrome_driver(download_dir)
+        return run_sat_flow(driver, cer_path, key_path, key_pass, download_dir)
 
     except Exception as e:
         # Relanzar la excepción para que el main la maneje
         raise e
         
     finally:
-        if driver:
-            # Lógica de cierre de ventanas/pestañas
-            try:
-                handles = driver.window_handles
-                if main_handle and len(handles) > 1 and driver.current_window_handle != main_handle:
-                    driver.close()
-                    driver.switch_to.window(main_handle)
-            except Exception:
-                pass
-            
+        if driver and governor:
+            governor.unregister(worker)
+            quit_and_reap(driver)
+        elif driver:
             driver.quit()
 
 
@@ -577,6 +1090,8 @@ def main():
             detail = f"Error al localizar un elemento: {e}. El portal SAT pudo haber cambiado su estructura (DOM)."
         elif isinstance(e, TimeoutException):
             detail = f"Tiempo de espera agotado (Timeout de Selenium): {e.msg if hasattr(e, 'msg') else str(e)}"
+        elif isinstance(e, EfirmaPreflightError):
+            detail = f"e.firma rechazada antes de abrir el navegador: {e}"
         elif isinstance(e, FileNotFoundError):
             detail = f"Error en ruta de e.firma: {e}. Verifique que las rutas absolutas sean correctas y que los archivos existan."
         elif isinstance(e, RuntimeError) and "WebDriver" in str(e):
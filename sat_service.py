@@ -0,0 +1,421 @@
+"""Servicio local de larga duración: navegadores precalentados y una API HTTP (TCP o socket Unix) de trabajos."""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socketserver
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from sat_driver_pool import ConstanciaJob, DriverPool
+from sat_orchestrator import (
+    DEFAULT_RATE_BURST,
+    DEFAULT_RATE_PER_SECOND,
+    Orchestrator,
+    OrchestratorResult,
+    Runner,
+    pooled_runner,
+)
+
+
+# =======================================================
+# 1. CONFIGURACIÓN
+# =======================================================
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+SERVICE_OUTPUT_DIR = Path.cwd() / "constancias" / "servicio"
+ENGINES = ("pool", "selenium", "browserless")
+DEFAULT_WORKERS = 2
+# Control de admisión: trabajos en cola o en curso antes de responder 429
+DEFAULT_MAX_PENDING = 50
+RETRY_AFTER_SECONDS = 30
+# Espera máxima de un long-poll (GET /jobs/<id>?wait=N) y latido del stream de eventos
+MAX_WAIT_SECONDS = 120
+EVENT_HEARTBEAT_SECONDS = 15
+# Trabajos terminados que se conservan para consulta (los PDFs quedan en disco)
+MAX_FINISHED_JOBS = 1000
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+
+class AdmissionError(RuntimeError):
+    """El servicio no acepta el trabajo (cola llena o en apagado)."""
+
+    def __init__(self, message: str, status: int = 429):
+        super().__init__(message)
+        self.status = status
+
+
+class ServiceJob:
+    """Estado de un trabajo recibido por la API."""
+
+    def __init__(self, job_id: str, job: ConstanciaJob):
+        self.id = job_id
+        self.job = job
+        self.status = QUEUED
+        self.attempts = 0
+        self.accepted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.pdf_path: Optional[Path] = None
+        self.error: Optional[str] = None
+        self.version = 0  # Cambia con cada transición (para el stream de eventos)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+    def to_dict(self) -> Dict:
+        # Sin la contraseña de la e.firma
+        return {
+            "id": self.id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "accepted_at": self.accepted_at,
+            "dispatch_seconds": None if self.started_at is None else self.started_at - self.accepted_at,
+            "elapsed_seconds": None if self.finished_at is None else self.finished_at - self.accepted_at,
+            "pdf": f"/jobs/{self.id}/pdf" if self.status == SUCCEEDED else None,
+            "error": self.error,
+        }
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+# =======================================================
+# 2. SERVICIO
+# =======================================================
+
+class ConstanciaService:
+    """Mantiene los navegadores calientes, encola trabajos en el orquestador y expone la API."""
+
+    def __init__(self, engine: str = "pool", workers: int = DEFAULT_WORKERS, max_pending: int = DEFAULT_MAX_PENDING,
+                 output_dir: Path = SERVICE_OUTPUT_DIR, rate_per_second: float = DEFAULT_RATE_PER_SECOND,
+                 rate_burst: int = DEFAULT_RATE_BURST, per_host_limit: Optional[int] = None):
+        if engine not in ENGINES:
+            raise ValueError(f"Motor desconocido: {engine} (use uno de {ENGINES})")
+        self.engine = engine
+        self.workers = workers
+        # Sin límite explícito, todos los navegadores calientes pueden trabajar contra el SAT a la vez
+        self.per_host_limit = per_host_limit or workers
+        self.max_pending = max_pending
+        self.output_dir = Path(output_dir)
+        self.jobs: Dict[str, ServiceJob] = {}
+        self._by_dir: Dict[Path, ServiceJob] = {}
+        self._pending = 0
+        self._draining = False
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._runner, self._close_runner = self._make_runner()
+        self.orchestrator = Orchestrator(
+            runner=self._run_job, max_workers=workers, rate_per_second=rate_per_second, rate_burst=rate_burst,
+            per_host_limit=self.per_host_limit, queue_size=max_pending, on_result=self._on_result,
+        )
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._intake: Optional[asyncio.Queue] = None
+        self._loop_ready = threading.Event()
+        self._loop_thread: Optional[threading.Thread] = None
+        self._server = None
+        self._server_thread: Optional[threading.Thread] = None
+        self._unix_path: Optional[str] = None
+
+    def _make_runner(self) -> Tuple[Runner, Callable[[], None]]:
+        if self.engine == "pool":
+            pool = DriverPool(size=self.workers, base_download_dir=self.output_dir)
+            print(f"[SERVICIO] Lanzando {self.workers} navegadores...")
+            pool.start()
+            return pooled_runner(pool), pool.close
+        if self.engine == "browserless":
+            from sat_browserless import run_sat_browserless
+            return run_sat_browserless, lambda: None
+        from sat_selenium_fiel import run_sat_automation_core
+        return run_sat_automation_core, lambda: None
+
+    # --- Trabajos ---
+
+    def submit(self, cer_path: str, key_path: str, key_pass: str) -> ServiceJob:
+        """Acepta un trabajo o lanza AdmissionError (429 con la cola llena, 503 en apagado)."""
+        job_id = uuid.uuid4().hex[:16]
+        job = ConstanciaJob(cer_path, key_path, key_pass, self.output_dir / job_id)
+        with self._lock:
+            if self._draining:
+                raise AdmissionError("El servicio se está apagando.", status=503)
+            if self._pending >= self.max_pending:
+                raise AdmissionError(f"Cola llena ({self._pending} trabajos pendientes).")
+            record = ServiceJob(job_id, job)
+            self.jobs[job_id] = record
+            self._by_dir[job.download_dir] = record
+            self._pending += 1
+            # Dentro del candado: drain() encola el centinela después de todo trabajo aceptado
+            self._loop.call_soon_threadsafe(self._intake.put_nowait, job)
+        return record
+
+    def get(self, job_id: str) -> Optional[ServiceJob]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def wait(self, record: ServiceJob, timeout: float, since_version: Optional[int] = None) -> ServiceJob:
+        """Espera a que el trabajo termine (o cambie de versión) como máximo ``timeout`` segundos."""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while not record.finished and (since_version is None or record.version == since_version):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+        return record
+
+    def _update(self, record: ServiceJob, **fields):
+        with self._changed:
+            for name, value in fields.items():
+                setattr(record, name, value)
+            record.version += 1
+            self._changed.notify_all()
+
+    def _run_job(self, cer_path: str, key_path: str, key_pass: str, download_dir: Path) -> Path:
+        # Se ejecuta en el executor del orquestador (un hilo por trabajo en curso)
+        record = self._by_dir[download_dir]
+        self._update(record, status=RUNNING, attempts=record.attempts + 1,
+                     started_at=record.started_at or time.time())
+        return self._runner(cer_path, key_path, key_pass, download_dir)
+
+    def _on_result(self, result: OrchestratorResult):
+        with self._lock:
+            record = self._by_dir.pop(result.job.download_dir)
+            self._pending -= 1
+        if result.ok:
+            self._update(record, status=SUCCEEDED, pdf_path=result.pdf_path, finished_at=time.time())
+        else:
+            self._update(record, status=FAILED, error=f"{type(result.error).__name__}: {result.error}",
+                         finished_at=time.time())
+        self._forget_old_jobs()
+
+    def _forget_old_jobs(self):
+        with self._lock:
+            finished = [r for r in self.jobs.values() if r.finished]
+            for record in sorted(finished, key=lambda r: r.finished_at)[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+                del self.jobs[record.id]
+
+    def stats(self) -> Dict:
+        snapshot = self.orchestrator.stats.snapshot()
+        with self._lock:
+            snapshot.update(engine=self.engine, pending=self._pending, max_pending=self.max_pending,
+                            draining=self._draining)
+        if self.engine != "browserless":
+            from sat_resources import get_resource_governor
+            snapshot["browsers"] = {u.worker: {"rss_mb": round(u.rss_mb, 1), "cpu_percent": round(u.cpu_percent, 1),
+                                               "processes": u.processes}
+                                    for u in get_resource_governor().sample().values()}
+        return snapshot
+
+    # --- Ciclo de vida ---
+
+    async def _feed(self):
+        while True:
+            job = await self._intake.get()
+            if job is None:
+                return
+            yield job
+
+    async def _orchestrate(self):
+        self._loop = asyncio.get_running_loop()
+        self._intake = asyncio.Queue()
+        self._loop_ready.set()
+        await self.orchestrator.run(self._feed())
+
+    def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, unix_socket: Optional[str] = None) -> "ConstanciaService":
+        self._loop_thread = threading.Thread(target=asyncio.run, args=(self._orchestrate(),), name="sat-service-jobs")
+        self._loop_thread.start()
+        self._loop_ready.wait()
+
+        handler = _handler_class(self)
+        if unix_socket:
+            if os.path.exists(unix_socket):
+                os.unlink(unix_socket)
+            # La API recibe contraseñas de e.firma: el socket nace con permisos 0600 (sin ventana tras bind)
+            previous_umask = os.umask(0o177)
+            try:
+                self._server = _UnixHTTPServer(unix_socket, handler)
+            finally:
+                os.umask(previous_umask)
+            self._unix_path = unix_socket
+            where = f"unix:{unix_socket}"
+        else:
+            self._server = ThreadingHTTPServer((host, port), handler)
+            self._server.daemon_threads = True
+            where = "http://{}:{}".format(*self._server.server_address[:2])
+        self._server_thread = threading.Thread(target=self._server.serve_forever, name="sat-service-http", daemon=True)
+        self._server_thread.start()
+        concurrency = min(self.workers, self.per_host_limit)
+        print(f"[SERVICIO] API en {where} (motor {self.engine}, {self.workers} trabajadores, "
+              f"hasta {concurrency} trabajos simultáneos contra el SAT)")
+        return self
+
+    def drain(self):
+        """Deja de aceptar trabajos, termina los encolados y en curso, y libera navegadores y la API."""
+        with self._lock:
+            if self._draining:
+                return
+            self._draining = True
+            pending = self._pending
+            self._loop.call_soon_threadsafe(self._intake.put_nowait, None)
+        print(f"[SERVICIO] Apagando: esperando {pending} trabajos pendientes...")
+        self._loop_thread.join()
+        self._close_runner()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            if self._unix_path and os.path.exists(self._unix_path):
+                os.unlink(self._unix_path)
+        print("[SERVICIO] Apagado completo.")
+
+
+# =======================================================
+# 3. API HTTP
+# =======================================================
+# POST /jobs                 {"cer_path", "key_path", "key_pass"} -> 202 con el trabajo
+# GET  /jobs/<id>[?wait=N]   estado (long-poll opcional hasta que termine)
+# GET  /jobs/<id>/events     stream de estados (text/event-stream)
+# GET  /jobs/<id>/pdf        la constancia
+# GET  /health               métricas del servicio
+
+def _handler_class(service: ConstanciaService):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send(self, status: int, body: bytes, content_type: str = "application/json",
+                  headers: Optional[Dict[str, str]] = None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self, status: int, data: Dict, headers: Optional[Dict[str, str]] = None):
+            self._send(status, json.dumps(data, ensure_ascii=False).encode("utf-8"), headers=headers)
+
+        def _record(self, job_id: str) -> Optional[ServiceJob]:
+            record = service.get(job_id)
+            if record is None:
+                self._json(404, {"error": f"Trabajo desconocido: {job_id}"})
+            return record
+
+        def do_POST(self):
+            if urlsplit(self.path).path.rstrip("/") != "/jobs":
+                return self._json(404, {"error": "Ruta desconocida"})
+            try:
+                length = int(self.headers.get("Content-Length", 0) or 0)
+                data = json.loads(self.rfile.read(length) or b"{}")
+                args = (str(data["cer_path"]), str(data["key_path"]), str(data["key_pass"]))
+            except (ValueError, KeyError, TypeError) as e:
+                return self._json(400, {"error": f"Se esperaba JSON con cer_path, key_path y key_pass: {e}"})
+            try:
+                record = service.submit(*args)
+            except AdmissionError as e:
+                return self._json(e.status, {"error": str(e)}, headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+            self._json(202, record.to_dict(), headers={"Location": f"/jobs/{record.id}"})
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            parts = [p for p in url.path.split("/") if p]
+            if parts == ["health"]:
+                return self._json(200, service.stats())
+            if len(parts) < 2 or parts[0] != "jobs" or len(parts) > 3:
+                return self._json(404, {"error": "Ruta desconocida"})
+            record = self._record(parts[1])
+            if record is None:
+                return
+            if len(parts) == 2:
+                wait = parse_qs(url.query).get("wait", ["0"])[0]
+                try:
+                    wait_seconds = min(float(wait), MAX_WAIT_SECONDS)
+                except ValueError:
+                    wait_seconds = 0
+                if wait_seconds > 0:
+                    service.wait(record, wait_seconds)
+                return self._json(200, record.to_dict())
+            if parts[2] == "pdf":
+                if record.status != SUCCEEDED:
+                    return self._json(409, {"error": f"El trabajo está en estado {record.status}", **record.to_dict()})
+                try:
+                    body = record.pdf_path.read_bytes()
+                except OSError as e:
+                    return self._json(410, {"error": f"El PDF ya no está disponible: {e}"})
+                return self._send(200, body, "application/pdf",
+                                  headers={"Content-Disposition": f'attachment; filename="{record.pdf_path.name}"'})
+            if parts[2] == "events":
+                return self._events(record)
+            self._json(404, {"error": "Ruta desconocida"})
+
+        def _events(self, record: ServiceJob):
+            # Server-Sent Events: un evento por transición hasta que el trabajo termina
+            self.close_connection = True
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            version = -1  # Emitir primero el estado actual
+            try:
+                while True:
+                    service.wait(record, EVENT_HEARTBEAT_SECONDS, since_version=version)
+                    if record.version == version:
+                        self.wfile.write(b": latido\n\n")
+                    else:
+                        version = record.version
+                        data = json.dumps(record.to_dict(), ensure_ascii=False)
+                        self.wfile.write(f"event: {record.status}\ndata: {data}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    if record.finished:
+                        return
+            except (BrokenPipeError, ConnectionResetError):
+                return
+
+    return Handler
+
+
+# =======================================================
+# 4. LÍNEA DE COMANDOS
+# =======================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Servicio local de constancias con navegadores precalentados.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix-socket", help="Escucha en este socket Unix en lugar de TCP")
+    parser.add_argument("--engine", choices=ENGINES, default="pool")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--max-pending", type=int, default=DEFAULT_MAX_PENDING)
+    parser.add_argument("--output-dir", type=Path, default=SERVICE_OUTPUT_DIR)
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE_PER_SECOND, help="Trabajos iniciados por segundo")
+    parser.add_argument("--per-host-limit", type=int, help="Trabajos simultáneos por host del SAT (por defecto, --workers)")
+    args = parser.parse_args()
+
+    service = ConstanciaService(args.engine, args.workers, args.max_pending, args.output_dir, args.rate,
+                                per_host_limit=args.per_host_limit)
+    service.start(args.host, args.port, args.unix_socket)
+
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+    while not stop.wait(3600):
+        pass
+    service.drain()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Almacén cifrado de sesiones autenticadas del SAT (cookies y storage) con caducidad por RFC."""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+
+# =======================================================
+# 1. CONFIGURACIÓN
+# =======================================================
+
+SESSION_DIR = Path.cwd() / ".sat_sessions"
+# Vida útil de una sesión guardada (el SAT expira sesiones inactivas en pocos minutos)
+SESSION_TTL_SECONDS = 10 * 60
+# Clave Fernet (base64 urlsafe de 32 bytes); sin ella la reutilización de sesiones queda desactivada
+SESSION_KEY_ENV = "SAT_SESSION_KEY"
+
+
+class SavedSession(NamedTuple):
+    """Sesión autenticada lista para restaurarse en un driver."""
+    rfc: str
+    created_at: float
+    expires_at: float
+    cookies: List[Dict]
+    local_storage: Dict[str, str]
+    session_storage: Dict[str, str]
+
+    @property
+    def expired(self) -> bool:
+        return time.time() >= self.expires_at
+
+
+def certificate_fingerprint(cer_path: str) -> str:
+    """SHA-256 del certificado: identifica la e.firma aunque se renombre el archivo."""
+    return hashlib.sha256(Path(cer_path).read_bytes()).hexdigest()
+
+
+def load_fernet(key: Optional[str]):
+    """Crea el cifrador Fernet (sesiones y contraseñas de sat_job_queue); requiere el paquete opcional ``cryptography``."""
+    try:
+        from cryptography.fernet import Fernet
+    except ImportError:
+        raise RuntimeError(
+            f"El cifrado con {SESSION_KEY_ENV} requiere el paquete 'cryptography' (pip install cryptography)."
+        )
+    if not key:
+        raise RuntimeError(f"Defina la variable de entorno {SESSION_KEY_ENV} con una clave Fernet.")
+    return Fernet(key.encode() if isinstance(key, str) else key)
+
+
+def generate_session_key() -> str:
+    """Clave Fernet nueva (para pruebas o para definir SAT_SESSION_KEY)."""
+    try:
+        from cryptography.fernet import Fernet
+    except ImportError:
+        raise RuntimeError(
+            f"El cifrado con {SESSION_KEY_ENV} requiere el paquete 'cryptography' (pip install cryptography)."
+        )
+    return Fernet.generate_key().decode("ascii")
+
+
+# =======================================================
+# 2. ALMACÉN
+# =======================================================
+
+class SessionStore:
+    """Guarda una sesión cifrada por certificado (RFC + huella del .cer) con TTL."""
+
+    def __init__(self, directory: Path = SESSION_DIR, key: Optional[str] = None, ttl_seconds: float = SESSION_TTL_SECONDS):
+        self.directory = Path(directory)
+        self.ttl_seconds = ttl_seconds
+        self._fernet = load_fernet(key or os.environ.get(SESSION_KEY_ENV))
+        self._lock = threading.Lock()
+
+    def _path_for(self, rfc: str, fingerprint: str) -> Path:
+        name = hashlib.sha256(f"{rfc.upper()}:{fingerprint}".encode()).hexdigest()
+        return self.directory / f"{name}.session"
+
+    def load(self, rfc: str, fingerprint: str) -> Optional[SavedSession]:
+        """Sesión vigente para el certificado, o None si no existe, caducó o no se puede descifrar."""
+        path = self._path_for(rfc, fingerprint)
+        try:
+            token = path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+        try:
+            data = json.loads(self._fernet.decrypt(token))
+            session = SavedSession(**data)
+        except Exception:
+            # Clave distinta o archivo dañado: la sesión no es utilizable
+            self._remove(path)
+            return None
+
+        if session.expired:
+            self._remove(path)
+            return None
+        return session
+
+    def save(self, rfc: str, fingerprint: str, cookies: List[Dict],
+             local_storage: Optional[Dict[str, str]] = None,
+             session_storage: Optional[Dict[str, str]] = None) -> SavedSession:
+        """Cifra y guarda la sesión con la caducidad configurada."""
+        now = time.time()
+        session = SavedSession(rfc.upper(), now, now + self.ttl_seconds, cookies,
+                               local_storage or {}, session_storage or {})
+        token = self._fernet.encrypt(json.dumps(session._asdict()).encode("utf-8"))
+
+        path = self._path_for(rfc, fingerprint)
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(prefix=".tmp_", dir=str(self.directory))
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(token)
+            os.replace(tmp, str(path))
+        return session
+
+    def invalidate(self, rfc: str, fingerprint: str):
+        """Elimina la sesión (e.g., cuando el portal la rechazó)."""
+        self._remove(self._path_for(rfc, fingerprint))
+
+    def purge_expired(self) -> int:
+        """Borra las sesiones caducadas o ilegibles; devuelve cuántas se eliminaron."""
+        removed = 0
+        for path in self.directory.glob("*.session"):
+            try:
+                data = json.loads(self._fernet.decrypt(path.read_bytes()))
+                expired = time.time() >= data["expires_at"]
+            except Exception:
+                expired = True
+            if expired:
+                self._remove(path)
+                removed += 1
+        return removed
+
+    def _remove(self, path: Path):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+_default_store: Optional[SessionStore] = None
+_default_checked = False
+_default_lock = threading.Lock()
+
+
+def get_session_store() -> Optional[SessionStore]:
+    """Almacén por defecto del proceso, o None si falta ``cryptography`` o la clave."""
+    global _default_store, _default_checked
+    with _default_lock:
+        if not _default_checked:
+            _default_checked = True
+            try:
+                _default_store = SessionStore()
+            except (RuntimeError, ValueError) as e:
+                # ValueError: SAT_SESSION_KEY no es una clave Fernet válida
+                print(f"[SESIÓN] Reutilización de sesiones desactivada: {e}")
+        return _default_store
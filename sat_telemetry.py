@@ -0,0 +1,279 @@
+"""Spans de tiempo por etapa del flujo y exportación de métricas (JSON lines y formato de texto de Prometheus)."""
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+# =======================================================
+# 1. CONFIGURACIÓN
+# =======================================================
+
+# Un span por línea (JSON); vacío para desactivar
+SPANS_JSONL_PATH = os.environ.get("SAT_SPANS_PATH", "sat_spans.jsonl")
+# Archivo de métricas en formato de Prometheus (e.g., para el textfile collector de node_exporter); vacío = no se escribe
+METRICS_TEXTFILE_PATH = os.environ.get("SAT_METRICS_PATH", "")
+# Cubetas (segundos) del histograma de duración por etapa
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+class Span:
+    """Una etapa del flujo: duración, resultado, localizadores/frames elegidos y reintentos."""
+    __slots__ = ("stage", "name", "started_at", "_start", "duration_seconds", "outcome", "error", "retries", "attributes")
+
+    def __init__(self, stage: str, name: str):
+        self.stage = stage
+        self.name = name
+        self.started_at = time.time()
+        self._start = time.monotonic()
+        self.duration_seconds = 0.0
+        self.outcome = "ok"
+        self.error: Optional[str] = None
+        self.retries = 0
+        self.attributes: Dict[str, object] = {}
+
+    def to_dict(self, trace_id: str) -> Dict[str, object]:
+        return {
+            "trace_id": trace_id,
+            "stage": self.stage,
+            "name": self.name,
+            "started_at": round(self.started_at, 6),
+            "duration_seconds": round(self.duration_seconds, 6),
+            "outcome": self.outcome,
+            "error": self.error,
+            "retries": self.retries,
+            **self.attributes,
+        }
+
+
+class JobTrace:
+    """Spans de un trabajo (una constancia)."""
+
+    def __init__(self, label: str):
+        self.trace_id = uuid.uuid4().hex
+        self.label = label
+        self.started_at = time.monotonic()
+        self.spans: List[Span] = []
+        # Datos del trabajo completo (e.g., viajes a WebDriver) que van en el registro "job"
+        self.attributes: Dict[str, object] = {}
+
+
+_local = threading.local()
+
+
+# =======================================================
+# 2. SPANS
+# =======================================================
+
+def start_trace(label: str) -> JobTrace:
+    """Inicia la traza del trabajo en el hilo actual."""
+    trace = JobTrace(label)
+    _local.trace = trace
+    _local.span = None
+    return trace
+
+def current_trace() -> Optional[JobTrace]:
+    return getattr(_local, "trace", None)
+
+@contextmanager
+def stage_span(stage: str, name: str) -> Iterator[Span]:
+    """Mide una etapa; una excepción marca el span como ``error`` y se relanza."""
+    span = Span(stage, name)
+    parent = getattr(_local, "span", None)
+    _local.span = span
+    try:
+        yield span
+    except BaseException as e:
+        span.outcome = "error"
+        span.error = type(e).__name__
+        raise
+    finally:
+        span.duration_seconds = time.monotonic() - span._start
+        _local.span = parent
+        trace = current_trace()
+        if trace is not None:
+            trace.spans.append(span)
+
+def _current_span() -> Optional[Span]:
+    return getattr(_local, "span", None)
+
+def record_locator(step: str, locator: Tuple[str, str]):
+    """Anota en el span actual qué localizador resolvió un paso."""
+    span = _current_span()
+    if span is not None:
+        span.attributes.setdefault("locators", {})[step] = f"{locator[0]}={locator[1]}"
+
+def record_frame(control: str, path: Sequence[int]):
+    """Anota en el span actual la ruta del frame donde se encontró un control."""
+    span = _current_span()
+    if span is not None:
+        span.attributes.setdefault("frames", {})[control] = list(path)
+
+def record_retry(count: int = 1):
+    span = _current_span()
+    if span is not None:
+        span.retries += count
+
+def finish_trace(outcome: str, error: Optional[BaseException] = None) -> Optional[JobTrace]:
+    """Cierra la traza del hilo y exporta sus spans (JSON lines y métricas)."""
+    trace = current_trace()
+    _local.trace = None
+    if trace is None:
+        return None
+    duration = time.monotonic() - trace.started_at
+    registry = get_metrics_registry()
+    registry.observe_job(outcome, duration, trace.spans, int(trace.attributes.get("round_trips", 0)))
+
+    if SPANS_JSONL_PATH:
+        records = [span.to_dict(trace.trace_id) for span in trace.spans]
+        records.append({
+            "trace_id": trace.trace_id,
+            "stage": "job",
+            "name": trace.label,
+            "duration_seconds": round(duration, 6),
+            "outcome": outcome,
+            "error": type(error).__name__ if error else None,
+            **trace.attributes,
+        })
+        try:
+            append_json_lines(Path(SPANS_JSONL_PATH), records)
+        except OSError as e:
+            print(f"[MÉTRICAS] No se pudieron escribir los spans: {e}")
+    if METRICS_TEXTFILE_PATH:
+        try:
+            registry.write_textfile(Path(METRICS_TEXTFILE_PATH))
+        except OSError as e:
+            print(f"[MÉTRICAS] No se pudo escribir {METRICS_TEXTFILE_PATH}: {e}")
+    return trace
+
+def format_trace(trace: JobTrace) -> str:
+    """Resumen legible de los spans de un trabajo."""
+    lines = []
+    for span in trace.spans:
+        extra = f" reintentos={span.retries}" if span.retries else ""
+        lines.append(f"   {span.stage:<5} {span.name:<24} {span.duration_seconds * 1000:8.0f} ms ({span.outcome}){extra}")
+    return "\n".join(lines)
+
+
+# =======================================================
+# 3. EXPORTACIÓN
+# =======================================================
+
+_jsonl_lock = threading.Lock()
+
+
+def append_json_lines(path: Path, records: List[Dict[str, object]]):
+    """Agrega los registros en una sola escritura (un trabajo = una escritura)."""
+    payload = "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in records)
+    with _jsonl_lock:
+        with open(path, "a", encoding="utf-8") as fh:
+            fh.write(payload)
+
+
+class MetricsRegistry:
+    """Contadores e histogramas en memoria con salida en formato de texto de Prometheus."""
+
+    def __init__(self, buckets: Sequence[float] = DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.stage_total: Dict[Tuple[str, str], int] = {}
+        self.stage_retries: Dict[str, int] = {}
+        self.stage_histograms: Dict[str, List[float]] = {}  # [conteo por cubeta..., suma, conteo]
+        self.job_total: Dict[str, int] = {}
+        self.job_histogram: List[float] = [0.0] * (len(self.buckets) + 2)
+        self.round_trips = 0
+        self.collectors: List[Callable[[], List[str]]] = []
+
+    def add_collector(self, collector: Callable[[], List[str]]):
+        """Agrega una función que devuelve líneas extra de métricas (p. ej. consumo de los navegadores)."""
+        with self._lock:
+            if collector not in self.collectors:
+                self.collectors.append(collector)
+
+    def _observe(self, histogram: List[float], seconds: float):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                histogram[i] += 1
+        histogram[-2] += seconds
+        histogram[-1] += 1
+
+    def observe_job(self, outcome: str, seconds: float, spans: Sequence[Span], round_trips: int = 0):
+        with self._lock:
+            self.job_total[outcome] = self.job_total.get(outcome, 0) + 1
+            self.round_trips += round_trips
+            self._observe(self.job_histogram, seconds)
+            for span in spans:
+                key = (span.name, span.outcome)
+                self.stage_total[key] = self.stage_total.get(key, 0) + 1
+                if span.retries:
+                    self.stage_retries[span.name] = self.stage_retries.get(span.name, 0) + span.retries
+                histogram = self.stage_histograms.setdefault(span.name, [0.0] * (len(self.buckets) + 2))
+                self._observe(histogram, span.duration_seconds)
+
+    def _render_histogram(self, metric: str, labels: str, histogram: List[float]) -> List[str]:
+        sep = "," if labels else ""
+        lines = [f'{metric}_bucket{{{labels}{sep}le="{bound:g}"}} {int(histogram[i])}'
+                 for i, bound in enumerate(self.buckets)]
+        lines.append(f'{metric}_bucket{{{labels}{sep}le="+Inf"}} {int(histogram[-1])}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{metric}_sum{suffix} {histogram[-2]:.6f}")
+        lines.append(f"{metric}_count{suffix} {int(histogram[-1])}")
+        return lines
+
+    def render(self) -> str:
+        with self._lock:
+            lines = [
+                "# HELP sat_job_total Trabajos de constancia terminados por resultado.",
+                "# TYPE sat_job_total counter",
+            ]
+            lines += [f'sat_job_total{{outcome="{o}"}} {n}' for o, n in sorted(self.job_total.items())]
+            lines += [
+                "# HELP sat_job_duration_seconds Duración de extremo a extremo de cada trabajo.",
+                "# TYPE sat_job_duration_seconds histogram",
+            ]
+            lines += self._render_histogram("sat_job_duration_seconds", "", self.job_histogram)
+            lines += [
+                "# HELP sat_webdriver_round_trips_total Comandos enviados a chromedriver por los trabajos.",
+                "# TYPE sat_webdriver_round_trips_total counter",
+                f"sat_webdriver_round_trips_total {self.round_trips}",
+                "# HELP sat_stage_total Etapas ejecutadas por nombre y resultado.",
+                "# TYPE sat_stage_total counter",
+            ]
+            lines += [f'sat_stage_total{{stage="{s}",outcome="{o}"}} {n}'
+                      for (s, o), n in sorted(self.stage_total.items())]
+            lines += [
+                "# HELP sat_stage_retries_total Reintentos (re-mapeos de frame, localizadores de respaldo) por etapa.",
+                "# TYPE sat_stage_retries_total counter",
+            ]
+            lines += [f'sat_stage_retries_total{{stage="{s}"}} {n}' for s, n in sorted(self.stage_retries.items())]
+            lines += [
+                "# HELP sat_stage_duration_seconds Duración de cada etapa del flujo.",
+                "# TYPE sat_stage_duration_seconds histogram",
+            ]
+            for stage, histogram in sorted(self.stage_histograms.items()):
+                lines += self._render_histogram("sat_stage_duration_seconds", f'stage="{stage}"', histogram)
+            collectors = list(self.collectors)
+        for collector in collectors:
+            lines += collector()
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: Path):
+        """Escribe las métricas de forma atómica (el collector nunca lee un archivo a medias)."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".metrics_", dir=str(path.parent))
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            fh.write(self.render())
+        os.replace(tmp, str(path))
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """Registro de métricas compartido del proceso."""
+    return _registry
@@ -0,0 +1,179 @@
+"""Esperas por condición (DOM estable, elemento habilitado, red inactiva, cambio de URL) con tiempos medidos."""
+import threading
+import time
+from typing import Callable, List, NamedTuple, Optional
+
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException
+
+from sat_browser import BrowserDriver, BrowserElement
+
+
+# =======================================================
+# 1. CONFIGURACIÓN
+# =======================================================
+
+# Cotas superiores (segundos) de cada condición; se pueden ajustar antes de ejecutar
+WAIT_BOUNDS = {
+    "dom_settled": 5.0,
+    "element_ready": 5.0,
+    "network_idle": 10.0,
+    "url_change": 15.0,
+    "file_attached": 3.0,
+}
+# Milisegundos sin mutaciones del DOM / sin peticiones nuevas para considerar la página quieta
+DOM_QUIET_MS = 250
+NETWORK_QUIET_MS = 400
+POLL_FREQUENCY_SECONDS = 0.05
+
+
+class WaitTiming(NamedTuple):
+    """Duración real de una espera por condición."""
+    label: str
+    condition: str
+    seconds: float
+    satisfied: bool
+
+
+_local = threading.local()
+
+
+def _timings() -> List[WaitTiming]:
+    if not hasattr(_local, "timings"):
+        _local.timings = []
+    return _local.timings
+
+def reset_wait_timings():
+    """Limpia los tiempos registrados en el hilo actual (uno por trabajo)."""
+    _local.timings = []
+
+def get_wait_timings() -> List[WaitTiming]:
+    """Tiempos de espera registrados en el hilo actual."""
+    return list(_timings())
+
+def format_wait_timings(timings: List[WaitTiming]) -> str:
+    """Resumen legible de las esperas: etiqueta, condición y duración."""
+    lines = []
+    for t in timings:
+        status = "ok" if t.satisfied else "cota"
+        lines.append(f"   {t.label:<28} {t.condition:<14} {t.seconds * 1000:8.0f} ms ({status})")
+    total = sum(t.seconds for t in timings)
+    lines.append(f"   {'TOTAL':<28} {'':<14} {total * 1000:8.0f} ms")
+    return "\n".join(lines)
+
+
+def timed_wait(label: str, condition: str, fn: Callable[[float], bool], timeout_seconds: Optional[float] = None) -> bool:
+    """Ejecuta una espera acotada, registra cuánto tardó y devuelve si se cumplió.
+
+    Agotar la cota no es un error: la condición solo sustituye a una pausa fija.
+    """
+    bound = WAIT_BOUNDS[condition] if timeout_seconds is None else timeout_seconds
+    start = time.monotonic()
+    try:
+        satisfied = bool(fn(bound))
+    except TimeoutException:
+        satisfied = False
+    _timings().append(WaitTiming(label, condition, time.monotonic() - start, satisfied))
+    return satisfied
+
+
+# =======================================================
+# 2. CONDICIONES
+# =======================================================
+
+_DOM_SETTLED_JS = """
+    const quietMs = arguments[0];
+    const boundMs = arguments[1];
+    const done = arguments[arguments.length - 1];
+    const root = document.documentElement || document.body;
+    if (!root) { done(true); return; }
+    let timer = null;
+    const started = Date.now();
+    const observer = new MutationObserver(() => {
+        clearTimeout(timer);
+        timer = setTimeout(finish, quietMs);
+    });
+    const hardStop = setTimeout(() => finish(false), boundMs);
+    function finish(ok) {
+        observer.disconnect();
+        clearTimeout(timer);
+        clearTimeout(hardStop);
+        done(ok !== false && document.readyState !== 'loading');
+    }
+    observer.observe(root, {childList: true, subtree: true, attributes: true, characterData: true});
+    timer = setTimeout(finish, quietMs);
+"""
+
+_NETWORK_IDLE_JS = """
+    let pending = 0;
+    try { if (window.jQuery && jQuery.active) pending += jQuery.active; } catch (e) {}
+    try {
+        if (window.PrimeFaces && PrimeFaces.ajax && PrimeFaces.ajax.Queue &&
+            !PrimeFaces.ajax.Queue.isEmpty()) pending += 1;
+    } catch (e) {}
+    const entries = (performance.getEntriesByType && performance.getEntriesByType('resource')) || [];
+    return [document.readyState, pending, entries.length];
+"""
+
+
+def wait_for_dom_settled(driver: BrowserDriver, label: str, timeout_seconds: Optional[float] = None) -> bool:
+    """Espera a que el DOM del contexto actual deje de mutar durante DOM_QUIET_MS."""
+    def condition(bound: float) -> bool:
+        driver.set_script_timeout(bound + 1)
+        return driver.execute_async_script(_DOM_SETTLED_JS, DOM_QUIET_MS, int(bound * 1000))
+    return timed_wait(label, "dom_settled", condition, timeout_seconds)
+
+def wait_for_element_ready(driver: BrowserDriver, element: BrowserElement, label: str, timeout_seconds: Optional[float] = None) -> bool:
+    """Espera a que el elemento esté visible y habilitado."""
+    def ready(_):
+        try:
+            return element.is_displayed() and element.is_enabled()
+        except StaleElementReferenceException:
+            return False
+
+    def condition(bound: float) -> bool:
+        return WebDriverWait(driver, bound, POLL_FREQUENCY_SECONDS).until(ready)
+    return timed_wait(label, "element_ready", condition, timeout_seconds)
+
+def wait_for_network_idle(driver: BrowserDriver, label: str, timeout_seconds: Optional[float] = None) -> bool:
+    """Espera documento completo, sin AJAX pendiente y sin recursos nuevos durante NETWORK_QUIET_MS."""
+    def condition(bound: float) -> bool:
+        deadline = time.monotonic() + bound
+        last_count = -1
+        quiet_since = time.monotonic()
+        while time.monotonic() < deadline:
+            ready_state, pending, count = driver.execute_script(_NETWORK_IDLE_JS)
+            now = time.monotonic()
+            if ready_state != "complete" or pending or count != last_count:
+                last_count = count
+                quiet_since = now
+            elif (now - quiet_since) * 1000 >= NETWORK_QUIET_MS:
+                return True
+            time.sleep(POLL_FREQUENCY_SECONDS)
+        return False
+    return timed_wait(label, "network_idle", condition, timeout_seconds)
+
+def wait_for_url_change(driver: BrowserDriver, previous_url: str, label: str,
+                        stale_element: Optional[BrowserElement] = None, timeout_seconds: Optional[float] = None) -> bool:
+    """Espera a que cambie la URL o a que ``stale_element`` desaparezca del DOM (navegación)."""
+    def navigated(d):
+        if d.current_url != previous_url:
+            return True
+        if stale_element is not None:
+            try:
+                stale_element.is_enabled()
+            except StaleElementReferenceException:
+                return True
+        return False
+
+    def condition(bound: float) -> bool:
+        return WebDriverWait(driver, bound, POLL_FREQUENCY_SECONDS).until(navigated)
+    return timed_wait(label, "url_change", condition, timeout_seconds)
+
+def wait_for_file_attached(driver: BrowserDriver, input_el: BrowserElement, label: str, timeout_seconds: Optional[float] = None) -> bool:
+    """Espera a que el input[type='file'] tenga el archivo asignado."""
+    def condition(bound: float) -> bool:
+        return WebDriverWait(driver, bound, POLL_FREQUENCY_SECONDS).until(
+            lambda d: d.execute_script("return !!(arguments[0].files && arguments[0].files.length);", input_el)
+        )
+    return timed_wait(label, "file_attached", condition, timeout_seconds)